@@ -1,5 +1,6 @@
 import streamlit as st
 import time
+import logging
 from ui.components import render_chat_header
 
 # Import modules from our refactored structure
@@ -8,6 +9,8 @@ from ui.components import (
     render_chat_header, 
     render_model_selection, 
     render_sidebar,
+    render_archived_chats,
+    render_profile_panel,
     apply_theme
 )
 from state.state_manager import (
@@ -19,15 +22,32 @@ from state.state_manager import (
     add_user_message,
     process_assistant_response,
     get_visible_messages,
-    clean_memory
+    clean_memory,
+    archive_idle_chats,
+    restore_chat,
+    switch_branch,
+    edit_message,
+    regenerate_response,
+    continue_response,
+    pending_request,
+    ResponseCheckpoint
 )
 from llms.llm import (
     get_available_providers,
     get_available_models,
+    start_provider_discovery,
+    start_health_monitor,
     cached_llm_response,
-    get_llm_response_streaming
+    get_llm_response_streaming,
+    record_queue_wait
 )
-from history.history import save_chats
+from history.store import chat_repository
+from llms.usage import usage_ledger
+from diagnostics import tracing, profiler
+from diagnostics.logging_setup import request_context
+
+# Streamlit runs this script as __main__
+logger = logging.getLogger("chat")
 
 
 # Set up Streamlit page configuration
@@ -47,25 +67,9 @@ apply_theme()
 # Apply the logo to the sidebar header
 render_chat_header()
 
-# Define cached versions of provider and model lookup functions
-@st.cache_data(ttl=300)
-def cached_get_available_providers(api_keys):
-    """Cached version of get_available_providers to reduce API calls"""
-    return get_available_providers(api_keys)
-
-
-@st.cache_data(ttl=300)
-def cached_get_available_models(provider, api_keys):
-    """Cached version of get_available_models to reduce API calls"""
-    return get_available_models(provider, api_keys)
-
-
 def handle_new_chat():
     """Handle the creation of a new chat"""
     chat_id = create_new_chat()
-    # Clear relevant caches
-    cached_get_available_providers.clear()
-    cached_get_available_models.clear()
     # Force a rerun to show the new chat
     st.rerun()
 
@@ -84,6 +88,13 @@ def handle_delete_chat(chat_id):
     st.rerun()
 
 
+def handle_restore_chat(chat_id):
+    """Handle the selection of an archived chat"""
+    restore_chat(chat_id)
+    # Force a rerun to show the restored chat
+    st.rerun()
+
+
 def handle_start_chat(provider, model):
     """Handle starting a new chat with a selected provider and model"""
     start_chat(provider, model)
@@ -91,14 +102,66 @@ def handle_start_chat(provider, model):
     st.rerun()
 
 
+def handle_switch_branch(message_id):
+    """Handle showing another version of a message"""
+    switch_branch(message_id)
+    st.rerun()
+
+
+def handle_edit_message(message_id, content):
+    """Handle sending an edited prompt"""
+    edit_message(message_id, content)
+    # Rerun to show the new branch and start processing
+    st.rerun()
+
+
+def handle_regenerate(message_id):
+    """Handle regenerating an answer"""
+    regenerate_response(message_id)
+    # Rerun to start processing
+    st.rerun()
+
+
+def handle_continue_response(message_id):
+    """Handle continuing an interrupted answer"""
+    continue_response(message_id)
+    # Rerun to start processing
+    st.rerun()
+
+
+def keep_profile(profile):
+    """Keep the profile of the run that just ended for the diagnostics panel"""
+    # Summarize now, outside of the next profiled run
+    profile.summary()
+    st.session_state.last_profile = profile
+
+
+def save_profile():
+    """Write the last run profile to disk"""
+    try:
+        path = st.session_state.last_profile.dump()
+        st.success(f"Profile saved to {path}")
+    except OSError as e:
+        st.error(f"Could not save the profile: {str(e)}")
+
+
 def show_chat():
     """Show the main chat interface"""
     # Initialize the session state
-    initialize_session_state()
+    with profiler.phase("initialize"):
+        initialize_session_state()
     
-    # Run garbage collection periodically
-    if st.session_state.get('chat_counter', 0) % 5 == 0:
-        clean_memory()
+    # Warm up provider listings in the background so model selection is instant
+    start_provider_discovery(st.session_state.api_keys)
+    
+    # Probe providers on a schedule so outages fail fast instead of blocking the page
+    start_health_monitor(st.session_state.api_keys)
+    
+    # Keep the resident chat messages within the memory budget
+    clean_memory()
+    
+    # Move chats idle for long to the compressed archive
+    archive_idle_chats()
     
     # Check if we need to rerun due to deletion
     if st.session_state.deleted_chat:
@@ -107,13 +170,19 @@ def show_chat():
     
     # Sidebar for chat management
     with st.sidebar:
-        render_sidebar(
-            st.session_state.chats,
-            st.session_state.active_chat_id,
-            handle_select_chat,
-            handle_new_chat,
-            handle_delete_chat
-        )
+        with profiler.phase("sidebar"):
+            render_sidebar(
+                st.session_state.chats,
+                st.session_state.active_chat_id,
+                handle_select_chat,
+                handle_new_chat,
+                handle_delete_chat
+            )
+            render_archived_chats(chat_repository.archived_chats(), handle_restore_chat)
+        
+        # Profile of the previous run, while profiling is enabled in Settings
+        if st.session_state.app_settings.get('profile_reruns', False) and 'last_profile' in st.session_state:
+            render_profile_panel(st.session_state.last_profile.summary(), save_profile)
     
     # Main content area
     if st.session_state.active_chat_id is None:
@@ -127,14 +196,18 @@ def show_chat():
     # If chat hasn't started, show provider/model selection
     if not active_chat["chat_started"]:
         # Get available providers
-        with st.spinner("Loading available providers..."):
-            available_providers = cached_get_available_providers(st.session_state.api_keys)
+        with st.spinner("Loading available providers..."), profiler.phase("provider_lookup"):
+            available_providers = get_available_providers(st.session_state.api_keys)
+        
+        def get_models(provider):
+            with profiler.phase("provider_lookup"):
+                return get_available_models(provider, st.session_state.api_keys)
         
         # Render model selection UI
         render_model_selection(
             active_chat,
             available_providers,
-            lambda provider: cached_get_available_models(provider, st.session_state.api_keys),
+            get_models,
             handle_start_chat
         )
     
@@ -157,20 +230,32 @@ def show_chat():
                                    st.session_state.processing_chat_id == st.session_state.active_chat_id and
                                    st.session_state.app_settings.get('use_streaming', False))
             
-            display_messages(visible_messages, exclude_last_assistant=is_streaming_response)
+            # Branch actions are offered while no response is in progress
+            idle = not st.session_state.processing
+            with tracing.span("chat.display_messages", messages=len(visible_messages)), \
+                    profiler.phase("display_messages"):
+                display_messages(
+                    visible_messages,
+                    exclude_last_assistant=is_streaming_response,
+                    alternatives=active_chat.alternatives(),
+                    on_switch_branch=handle_switch_branch if idle else None,
+                    on_edit=handle_edit_message if idle else None,
+                    on_regenerate=handle_regenerate if idle else None,
+                    on_continue=handle_continue_response if idle else None
+                )
 
         # Process the assistant's response if needed
         if st.session_state.processing and st.session_state.processing_chat_id == st.session_state.active_chat_id:
-            # Check if we have a user message to respond to
-            if not active_chat["messages"] or active_chat["messages"][-1]["role"] != "user":
+            # Check if we have a user message to respond to, or an answer to continue
+            request = pending_request(active_chat)
+            if request is None:
                 st.session_state.processing = False
                 st.session_state.processing_chat_id = None
                 st.rerun()
                 return
             
-            # Create a unique response ID based on the last user message
-            last_user_msg = active_chat["messages"][-1]
-            response_id = f"{st.session_state.processing_chat_id}_{last_user_msg['id']}"
+            # Create a unique response ID based on the last message
+            response_id = f"{st.session_state.processing_chat_id}_{active_chat['messages'][-1]['id']}"
             
             # Skip if we've already processed this response
             if response_id in st.session_state.completed_responses:
@@ -183,41 +268,63 @@ def show_chat():
                 use_streaming = st.session_state.app_settings.get('use_streaming', False)
                 
                 if use_streaming:
-                    # Streaming response
+                    # Streaming response (never cached, so a regenerated answer needs nothing more)
+                    st.session_state.pop('regenerate', None)
+                    # A rerun during the answer leaves it interrupted rather than continuing it again
+                    st.session_state.pop('continue_message_id', None)
+                    messages, partial = request
+                    checkpoint = ResponseCheckpoint(st.session_state.processing_chat_id, partial)
                     response_placeholder = st.empty()
-                    response_placeholder.markdown("_Thinking..._")
+                    response_placeholder.markdown(checkpoint.prefix or "_Thinking..._")
                     
                     try:
                         current_response = ""
+                        response_usage = {}
                         
-                        # Get streaming response generator
-                        streaming_generator = get_llm_response_streaming(
+                        record_queue_wait(
                             active_chat["selected_provider"],
                             active_chat["selected_model"],
-                            active_chat["messages"],
-                            st.session_state.api_keys
+                            time.time() - st.session_state.get('processing_queued_at', time.time())
                         )
                         
-                        # Process each chunk
-                        for chunk in streaming_generator:
-                            current_response += chunk
-                            response_placeholder.markdown(current_response)
-                            time.sleep(0.01)  # Small delay for UI updates
+                        with request_context(response_id, st.session_state.processing_chat_id), \
+                                tracing.span("chat.render_stream") as render_span, \
+                                profiler.phase("response"):
+                            try:
+                                # Get streaming response generator
+                                streaming_generator = get_llm_response_streaming(
+                                    active_chat["selected_provider"],
+                                    active_chat["selected_model"],
+                                    messages,
+                                    st.session_state.api_keys,
+                                    usage_out=response_usage
+                                )
+                                
+                                # Process each chunk, checkpointing the answer so far at intervals
+                                for chunk in streaming_generator:
+                                    current_response += chunk
+                                    response_placeholder.markdown(checkpoint.prefix + current_response)
+                                    checkpoint.update(current_response)
+                                    time.sleep(0.01)  # Small delay for UI updates
+                            except BaseException:
+                                # An error, a rerun or a disconnect: keep what was received, marked incomplete
+                                checkpoint.interrupt(current_response)
+                                raise
+                            render_span.set_attribute("characters", len(current_response))
                         
-                        # Add the complete response to chat history
-                        message_id = time.time()
-                        active_chat["messages"].append({
-                            "role": "assistant", 
-                            "content": current_response, 
-                            "id": message_id
-                        })
+                        # Save the complete response to chat history
+                        if response_usage:
+                            usage_ledger.record(
+                                st.session_state.processing_chat_id,
+                                active_chat["selected_provider"],
+                                active_chat["selected_model"],
+                                response_usage
+                            )
+                        checkpoint.complete(current_response, response_usage)
                         
                         # Mark this response as completed
                         st.session_state.completed_responses.add(response_id)
                         
-                        # Save to persistent storage
-                        save_chats(st.session_state.chats, st.session_state.chat_counter)
-                        
                         # Reset processing state
                         st.session_state.processing = False
                         st.session_state.processing_chat_id = None
@@ -230,25 +337,23 @@ def show_chat():
                         error_message = f"Error: Failed to get streaming response. {str(e)}"
                         response_placeholder.markdown(error_message)
                         
-                        # Add error message to chat history
-                        message_id = time.time()
-                        active_chat["messages"].append({
-                            "role": "assistant", 
-                            "content": error_message, 
-                            "id": message_id
-                        })
+                        # Add error message to chat history, unless part of the answer was saved to continue from
+                        if not checkpoint.saved:
+                            chat_repository.append_message(st.session_state.processing_chat_id, {
+                                "role": "assistant", 
+                                "content": error_message
+                            })
                         
                         # Mark as completed and reset processing
                         st.session_state.completed_responses.add(response_id)
-                        save_chats(st.session_state.chats, st.session_state.chat_counter)
                         st.session_state.processing = False
                         st.session_state.processing_chat_id = None
                         
-                        print(f"Streaming error: {str(e)}")
+                        logger.error("Streaming error: %s", e)
                         st.rerun()
                 else:
                     # Non-streaming response
-                    with st.spinner("Thinking..."):
+                    with st.spinner("Thinking..."), profiler.phase("response"):
                         success = process_assistant_response()
                         if success:
                             st.rerun()
@@ -269,7 +374,10 @@ def show_chat():
 
 def main():
     """Main entry point for the application"""
-    show_chat()
+    # One trace per script run when tracing is enabled, one profile when profiling is
+    profile_reruns = st.session_state.get('app_settings', {}).get('profile_reruns', False)
+    with tracing.span("chat.run"), profiler.profile_run(profile_reruns, keep_profile):
+        show_chat()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,127 @@
+"""
+Benchmark of the two history file formats.
+
+Writes the same synthetic history (--messages messages, 100k by default)
+as history.json and as history.pack (history.binary), then times, for
+each: loading the whole history, opening it the way the chat repository
+does (the chats' fields, messages left for later), reading one chat, and
+reading one page of 20 messages from the middle of a chat. JSON has to
+parse the whole file for any of them; the binary format decodes only the
+records asked for. Fails (exit code 1) when reading one chat from the
+binary file is not at least --min-speedup times faster than from the JSON
+file.
+
+Usage:
+    python -m benchmarks.bench_history_format [--messages 100000] [--min-speedup 10] [--output bench_format.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+from typing import Any, Callable, Dict
+
+from benchmarks.common import ROOT_DIR, report_metadata, synthetic_history, write_report
+
+
+def best_time(function: Callable[[], Any], repeat: int) -> float:
+    """Best wall time of several calls, in milliseconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return round(best * 1000, 3)
+
+
+def run(messages: int, repeat: int) -> Dict[str, Any]:
+    """Write the history in both formats and time the reads."""
+    from history import binary
+
+    history = synthetic_history(messages)
+    chat_id = list(history["chats"])[len(history["chats"]) // 2]
+    with tempfile.TemporaryDirectory() as data_dir:
+        json_file = os.path.join(data_dir, "history.json")
+        binary_file = os.path.join(data_dir, "history.pack")
+        with open(json_file, "w") as f:
+            json.dump(history, f)
+        with open(binary_file, "wb") as f:
+            binary.write_history(f, history, {})
+        del history
+
+        def json_load():
+            with open(json_file, "r") as f:
+                return json.load(f)
+
+        def binary_load():
+            with binary.BinaryHistory(binary_file) as history:
+                return history.read_history()
+
+        def binary_open():
+            with binary.BinaryHistory(binary_file) as history:
+                return [history.read_fields(chat_id) for chat_id in history.chat_ids()]
+
+        def binary_chat():
+            with binary.BinaryHistory(binary_file) as history:
+                return history.read_chat(chat_id)
+
+        def binary_page():
+            with binary.BinaryHistory(binary_file) as history:
+                return history.read_messages(chat_id, start=100, count=20)
+
+        # JSON reads one chat or one page by parsing the whole file
+        json_ms = best_time(json_load, repeat)
+        results = {
+            "json": {
+                "bytes": os.path.getsize(json_file), "load_ms": json_ms, "open_ms": json_ms, "chat_ms": json_ms,
+                "page_ms": json_ms,
+            },
+            "binary": {
+                "bytes": os.path.getsize(binary_file),
+                "load_ms": best_time(binary_load, repeat),
+                "open_ms": best_time(binary_open, repeat),
+                "chat_ms": best_time(binary_chat, repeat),
+                "page_ms": best_time(binary_page, repeat),
+            },
+        }
+    for key in ("load", "open", "chat", "page"):
+        results[f"{key}_speedup"] = round(results["json"][f"{key}_ms"] / max(results["binary"][f"{key}_ms"], 0.001), 1)
+    return results
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Compare reads of the JSON and binary history formats.")
+    parser.add_argument("--messages", type=int, default=100000, help="Messages in the history (default: 100000)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs of each read, the best is kept (default: 3)")
+    parser.add_argument("--min-speedup", type=float, default=10,
+                        help="Minimum speedup of reading one chat from the binary file (default: 10)")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT_DIR)
+    results = run(args.messages, args.repeat)
+
+    megabyte = 1024 * 1024
+    print(f"{'format':<8} {'size MB':>9} {'load ms':>10} {'open ms':>10} {'chat ms':>10} {'page ms':>10}")
+    for name in ("json", "binary"):
+        result = results[name]
+        print(f"{name:<8} {result['bytes'] / megabyte:>9.1f} {result['load_ms']:>10.1f} {result['open_ms']:>10.2f} "
+              f"{result['chat_ms']:>10.2f} {result['page_ms']:>10.2f}")
+    print(f"Binary is {results['load_speedup']}x faster to load, {results['open_speedup']}x to open, "
+          f"{results['chat_speedup']}x for one chat "
+          f"and {results['page_speedup']}x for one page of {args.messages} messages")
+
+    if args.output:
+        write_report(args.output, {"metadata": report_metadata(), "messages": args.messages, "results": results})
+        print(f"Report written to {args.output}")
+
+    if results["chat_speedup"] < args.min_speedup:
+        print(f"Reading one chat is less than {args.min_speedup}x faster")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
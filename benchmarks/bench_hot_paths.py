@@ -0,0 +1,346 @@
+"""
+Benchmarks of the history, session, rendering, streaming and caching hot paths.
+
+Measured:
+
+- history: save_chats / load_chats (cold cache) at each --sizes message count
+- session: initialize_session_state for a new session, get_visible_messages
+  and display_messages, run headlessly with AppTest
+- streaming: each provider's streaming buffer loop over --stream-tokens
+  chunks from an in-memory fake SDK stream (no network)
+- cache: a cached_llm_response cache hit and the single-flight key, which
+  both hash the whole history, at each --chat-sizes message count
+
+Every metric is the median of --repeat runs with the garbage collector
+paused, on deterministic synthetic data. With --baseline, the run fails
+(exit code 1) when a metric is more than --threshold slower than in the
+baseline report; --save-baseline records one.
+
+Usage:
+    python -m benchmarks.bench_hot_paths --save-baseline bench_baseline.json
+    python -m benchmarks.bench_hot_paths --baseline bench_baseline.json --threshold 0.25
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import tempfile
+import importlib
+import statistics
+from types import SimpleNamespace
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List
+
+from benchmarks.common import ROOT_DIR, report_metadata, synthetic_history, write_report
+
+
+GROUPS = ["history", "session", "streaming", "cache"]
+
+# Secrets given to the app in session benchmarks: no provider is contacted
+BENCH_SECRETS = {
+    "api_keys": {"openai": "", "anthropic": "", "gemini": "", "mistral": "", "deepseek": "", "ollama": "", "mock": ""},
+    "app_settings": {"use_streaming": False},
+}
+
+# Provider name used for the caching benchmarks, answering instantly
+BENCH_PROVIDER = "Bench"
+
+
+def measure(func: Callable[[], Any], repeat: int, warmup: int = 1) -> Dict[str, float]:
+    """
+    Time a function with the garbage collector paused.
+
+    Args:
+        func: Function to time
+        repeat: Number of timed runs
+        warmup: Untimed runs first
+
+    Returns:
+        Dict[str, float]: Median and minimum in milliseconds
+    """
+    for _ in range(warmup):
+        func()
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            samples.append((time.perf_counter() - start) * 1000)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {"value": round(statistics.median(samples), 4), "min": round(min(samples), 4), "unit": "ms"}
+
+
+def bench_history(sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time save_chats and cold load_chats at each history size."""
+    from history.history import save_chats, load_chats, load_history
+
+    results = {}
+    for size in sizes:
+        history = synthetic_history(size)
+        chats, chat_counter = history["chats"], history["chat_counter"]
+        results[f"save_chats[{size}]"] = measure(lambda: save_chats(chats, chat_counter), repeat)
+
+        def load_cold():
+            load_history.clear()
+            load_chats()
+        results[f"load_chats[{size}]"] = measure(load_cold, repeat)
+    return results
+
+
+def _session_script():
+    """Script run by AppTest: times the session start and rendering of the active chat."""
+    import time
+    import streamlit as st
+    from state.state_manager import initialize_session_state, get_visible_messages
+    from ui.components import display_messages
+
+    start = time.perf_counter()
+    initialize_session_state()
+    st.session_state.bench_initialize_ms = (time.perf_counter() - start) * 1000
+
+    active_chat = st.session_state.chats[next(iter(st.session_state.chats))]
+    start = time.perf_counter()
+    visible_messages = get_visible_messages(active_chat)
+    st.session_state.bench_visible_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    display_messages(visible_messages)
+    st.session_state.bench_display_ms = (time.perf_counter() - start) * 1000
+
+
+def bench_session(size: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time initialize_session_state, get_visible_messages and display_messages in new sessions."""
+    from streamlit.testing.v1 import AppTest
+    from history.history import save_chats, load_history
+
+    history = synthetic_history(size)
+    save_chats(history["chats"], history["chat_counter"])
+    load_history.clear()
+
+    samples = {"bench_initialize_ms": [], "bench_visible_ms": [], "bench_display_ms": []}
+    # The first session loads the history into the cache and is not counted
+    for run in range(repeat + 1):
+        app = AppTest.from_function(_session_script, default_timeout=120)
+        app.secrets.update(BENCH_SECRETS)
+        app.run()
+        if app.exception:
+            raise RuntimeError(f"Session benchmark raised: {app.exception[0].message}")
+        if run:
+            for key in samples:
+                samples[key].append(app.session_state[key])
+
+    names = {
+        "bench_initialize_ms": f"initialize_session_state[{size}]",
+        "bench_visible_ms": f"get_visible_messages[{size}]",
+        "bench_display_ms": "display_messages",
+    }
+    return {
+        names[key]: {"value": round(statistics.median(values), 4), "min": round(min(values), 4), "unit": "ms"}
+        for key, values in samples.items()
+    }
+
+
+def _fake_clients(tokens: List[str]) -> Dict[str, Any]:
+    """In-memory stand-ins for each SDK client, streaming the given tokens."""
+    def openai_chunks():
+        return iter([SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=t))], usage=None) for t in tokens])
+
+    openai_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: openai_chunks()
+    )))
+    anthropic_client = SimpleNamespace(messages=SimpleNamespace(
+        create=lambda **kwargs: iter([
+            SimpleNamespace(type="content_block_delta", delta=SimpleNamespace(text=t)) for t in tokens
+        ])
+    ))
+    gemini_client = SimpleNamespace(models=SimpleNamespace(
+        generate_content_stream=lambda **kwargs: iter([SimpleNamespace(text=t, usage_metadata=None) for t in tokens])
+    ))
+    mistral_client = SimpleNamespace(chat=SimpleNamespace(
+        stream=lambda **kwargs: nullcontext(iter([
+            SimpleNamespace(data=SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=t))], usage=None))
+            for t in tokens
+        ]))
+    ))
+    ollama_client = SimpleNamespace(
+        chat=lambda **kwargs: iter([{"message": {"role": "assistant", "content": t}, "done": False} for t in tokens])
+    )
+    return {
+        "OpenAI": openai_client,
+        "Deepseek": openai_client,
+        "Anthropic": anthropic_client,
+        "Gemini": gemini_client,
+        "Mistral": mistral_client,
+        "Ollama": ollama_client,
+    }
+
+
+def bench_streaming(stream_tokens: int, repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time every provider's streaming buffer loop over an instant in-memory stream."""
+    from llms.llm import PROVIDER_CONFIGS
+    from benchmarks.common import synthetic_text
+    import random
+
+    words = synthetic_text(random.Random(7), stream_tokens).split(" ")
+    tokens = [words[0]] + [" " + word for word in words[1:]]
+    messages = [{"role": "user", "content": "Benchmark the streaming loop"}]
+    clients = _fake_clients(tokens)
+
+    results = {}
+    for provider, config in PROVIDER_CONFIGS.items():
+        if provider == "Mock":
+            key = f"ttft=0,tps=0,jitter=0,tokens={stream_tokens}"
+            streaming_func = config["streaming_func"]
+            results[f"stream_loop[{provider}]"] = measure(
+                lambda: sum(1 for _ in streaming_func("mock-model", messages, key)), repeat
+            )
+            continue
+        if provider not in clients:
+            continue
+
+        module = importlib.import_module(config["module"])
+        original = module._get_client
+        module._get_client = lambda *args, client=clients[provider]: client
+        try:
+            streaming_func = config["streaming_func"]
+            results[f"stream_loop[{provider}]"] = measure(
+                lambda: sum(1 for _ in streaming_func("bench-model", messages, "key")), repeat
+            )
+        finally:
+            module._get_client = original
+    return results
+
+
+def bench_cache(chat_sizes: List[int], repeat: int) -> Dict[str, Dict[str, float]]:
+    """Time a cached_llm_response cache hit and the single-flight key for long chats."""
+    from llms import llm
+
+    if BENCH_PROVIDER not in llm.PROVIDER_CONFIGS:
+        llm.PROVIDER_CONFIGS.register(BENCH_PROVIDER, {
+            "key_name": "bench",
+            "models_func": lambda key: ["bench-model"],
+            "chat_func": lambda model, messages, key: "ok",
+            "streaming_func": lambda model, messages, key: iter(["ok"]),
+            "requires_key": True,
+        })
+    api_keys = {"bench": "key"}
+
+    results = {}
+    for size in chat_sizes:
+        messages = synthetic_history(size, messages_per_chat=size)["chats"]["chat_0"]["messages"]
+        results[f"cached_llm_response_hit[{size}]"] = measure(
+            lambda: llm.cached_llm_response(BENCH_PROVIDER, "bench-model", messages, api_keys), repeat
+        )
+
+        def flight_key():
+            llm._flight_key("chat", BENCH_PROVIDER, "key", "bench-model", llm._normalize_messages(messages))
+        results[f"flight_key[{size}]"] = measure(flight_key, repeat)
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """
+    Find metrics slower than the baseline by more than the threshold.
+
+    Args:
+        results: Metrics of this run
+        baseline: A report written by this benchmark
+        threshold: Allowed slowdown as a fraction, e.g. 0.25 for 25%
+
+    Returns:
+        List[str]: One description per regression
+    """
+    regressions = []
+    for name, previous in baseline.get("results", {}).items():
+        current = results.get(name)
+        if current is None or not previous.get("value"):
+            continue
+        ratio = current["value"] / previous["value"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{name}: {current['value']:.3f} {current['unit']} vs {previous['value']:.3f} baseline (+{(ratio - 1) * 100:.0f}%)"
+            )
+    return regressions
+
+
+def run(args) -> Dict[str, Any]:
+    """Run the selected benchmark groups and build the report."""
+    groups = [group.strip() for group in args.only.split(",") if group.strip()]
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    chat_sizes = [int(size) for size in args.chat_sizes.split(",") if size.strip()]
+
+    results = {}
+    if "history" in groups:
+        results.update(bench_history(sizes, args.repeat))
+    if "session" in groups:
+        results.update(bench_session(args.session_size, args.repeat))
+    if "streaming" in groups:
+        results.update(bench_streaming(args.stream_tokens, args.repeat))
+    if "cache" in groups:
+        results.update(bench_cache(chat_sizes, args.repeat))
+
+    return {
+        "benchmark": "hot_paths",
+        "metadata": report_metadata(),
+        "parameters": {
+            "sizes": sizes, "session_size": args.session_size, "chat_sizes": chat_sizes,
+            "stream_tokens": args.stream_tokens, "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Benchmark history, session, streaming and caching hot paths.")
+    parser.add_argument("--sizes", default="10000,100000", help="History sizes in messages for save/load (default: 10000,100000)")
+    parser.add_argument("--session-size", type=int, default=10000, help="History size for session benchmarks (default: 10000)")
+    parser.add_argument("--chat-sizes", default="1000,10000", help="Messages in the chat hashed by the cache benchmarks")
+    parser.add_argument("--stream-tokens", type=int, default=5000, help="Chunks per streaming benchmark (default: 5000)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per metric (default: 5)")
+    parser.add_argument("--only", default=",".join(GROUPS), help=f"Comma-separated groups to run ({', '.join(GROUPS)})")
+    parser.add_argument("--baseline", help="Fail when slower than this report by more than --threshold")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown as a fraction (default: 0.25)")
+    parser.add_argument("--save-baseline", help="Also write the report to this baseline file")
+    parser.add_argument("--output", default="bench_hot_paths.json", help="Report file (default: bench_hot_paths.json)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="promptly-bench-") as data_dir:
+        # Set before the app modules are imported, they read it once
+        os.environ["PROMPTLY_DATA_DIR"] = data_dir
+        sys.path.insert(0, ROOT_DIR)
+        report = run(args)
+
+    for name, result in report["results"].items():
+        print(f"{name:<40} {result['value']:>12.3f} {result['unit']}  (min {result['min']:.3f})")
+
+    write_report(args.output, report)
+    print(f"Report written to {args.output}")
+    if args.save_baseline:
+        write_report(args.save_baseline, report)
+        print(f"Baseline written to {args.save_baseline}")
+
+    if args.baseline:
+        if not os.path.exists(args.baseline):
+            print(f"No baseline at {args.baseline}, skipping the comparison (record one with --save-baseline)")
+            return 0
+        with open(args.baseline, "r") as f:
+            regressions = compare(report["results"], json.load(f), args.threshold)
+        if regressions:
+            print(f"Regressions over {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print(f"No regressions over {args.threshold:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Import-time benchmark for the modules loaded on every server start.
+
+Runs `python -X importtime` in fresh interpreters for each entry module and
+reports the cumulative import time of that module, the time spent in
+provider SDKs, and which SDKs were imported at all. Fails (exit code 1)
+when an SDK is imported eagerly or the median time exceeds --max-ms
+(IMPORT_BUDGET_MS by default). tests/test_import_time.py checks the same.
+
+Usage:
+    python -m benchmarks.bench_import_time [--runs 5] [--max-ms 2000] [--json report.json]
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+
+# Modules imported by Chat.py, state/state_manager.py and pages/Settings.py
+ENTRY_MODULES = ["llms.llm", "state.state_manager"]
+
+# Provider SDKs that must only be imported when their provider is used
+SDK_MODULES = ["openai", "anthropic", "mistralai", "google.genai", "ollama"]
+
+# Median import time allowed for each entry module, in milliseconds
+IMPORT_BUDGET_MS = 2000
+
+
+def parse_importtime(stderr: str) -> Dict[str, int]:
+    """
+    Parse the output of `python -X importtime`.
+
+    Args:
+        stderr: Standard error of the interpreter
+
+    Returns:
+        Dict[str, int]: Cumulative microseconds of every imported module
+    """
+    cumulative = {}
+    for line in stderr.splitlines():
+        # Format: "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us)
+    return cumulative
+
+
+def measure_import(module: str) -> Dict[str, object]:
+    """
+    Import a module in a fresh interpreter and parse the -X importtime output.
+
+    Args:
+        module: Dotted module name
+
+    Returns:
+        Dict[str, object]: Cumulative milliseconds for the module and the SDKs imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True
+    )
+
+    cumulative = parse_importtime(result.stderr)
+    sdks = [sdk for sdk in SDK_MODULES if sdk in cumulative]
+    return {
+        "total_ms": cumulative.get(module, 0) / 1000,
+        "sdk_ms": sum(cumulative[sdk] for sdk in sdks) / 1000,
+        "sdks": sdks,
+    }
+
+
+def run(runs: int) -> Dict[str, Dict[str, object]]:
+    """
+    Measure every entry module several times.
+
+    Args:
+        runs: Number of fresh interpreters per module
+
+    Returns:
+        Dict[str, Dict[str, object]]: Median timings and imported SDKs per module
+    """
+    report = {}
+    for module in ENTRY_MODULES:
+        samples: List[Dict[str, object]] = [measure_import(module) for _ in range(runs)]
+        report[module] = {
+            "median_ms": round(statistics.median(s["total_ms"] for s in samples), 1),
+            "min_ms": round(min(s["total_ms"] for s in samples), 1),
+            "sdk_ms": round(statistics.median(s["sdk_ms"] for s in samples), 1),
+            "sdks_imported": sorted({sdk for s in samples for sdk in s["sdks"]}),
+        }
+    return report
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Measure import time of the app entry modules.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module (default: 5)")
+    parser.add_argument("--max-ms", type=float, default=IMPORT_BUDGET_MS,
+                        help=f"Fail when a module's median import time exceeds this (default: {IMPORT_BUDGET_MS})")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = run(args.runs)
+    failures = []
+    for module, result in report.items():
+        print(f"{module}: median {result['median_ms']} ms, min {result['min_ms']} ms, "
+              f"SDKs {result['sdks_imported'] or 'none'}")
+        if result["sdks_imported"]:
+            failures.append(f"{module} imports provider SDKs eagerly: {', '.join(result['sdks_imported'])}")
+        if result["median_ms"] > args.max_ms:
+            failures.append(f"{module} imports in {result['median_ms']} ms (budget {args.max_ms} ms)")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
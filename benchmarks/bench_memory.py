@@ -0,0 +1,103 @@
+"""
+Memory benchmark of the in-memory chat representation.
+
+Loads the same synthetic history (--messages messages, 100k by default)
+twice under tracemalloc: as the plain dicts json.load returns, and as the
+Chat/Message records the chat repository keeps (history.models). Reports
+the memory held by each, in total and per message, and the per-message
+overhead: what is held besides the message texts, which both share and
+which dominate the total. Fails (exit code 1) when the records do not cut
+that overhead by at least --min-saving.
+
+Usage:
+    python -m benchmarks.bench_memory [--messages 100000] [--min-saving 0.3] [--output bench_memory.json]
+"""
+import sys
+import json
+import argparse
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from benchmarks.common import ROOT_DIR, report_metadata, synthetic_history, write_report
+
+
+def measure_memory(load: Callable[[], Any]) -> Dict[str, int]:
+    """
+    Measure the memory held by the object a function builds.
+
+    Args:
+        load: Builds the object; temporary allocations it frees are not counted
+
+    Returns:
+        Dict[str, int]: held and peak bytes
+    """
+    tracemalloc.start()
+    try:
+        loaded = load()
+        held, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del loaded
+    return {"held": held, "peak": peak}
+
+
+def run(messages: int) -> Dict[str, Any]:
+    """Measure both representations of a history with the given number of messages."""
+    from history.models import Chat
+
+    history = synthetic_history(messages)
+    content_bytes = sum(
+        sys.getsizeof(message["content"]) for chat in history["chats"].values() for message in chat["messages"]
+    )
+    text = json.dumps(history)
+    del history
+
+    def load_dicts():
+        return json.loads(text)["chats"]
+
+    def load_records():
+        return {chat_id: Chat.from_dict(chat) for chat_id, chat in json.loads(text)["chats"].items()}
+
+    results = {"dict": measure_memory(load_dicts), "records": measure_memory(load_records)}
+    for result in results.values():
+        result["bytes_per_message"] = round(result["held"] / messages, 1)
+        result["overhead_per_message"] = round((result["held"] - content_bytes) / messages, 1)
+    results["saving"] = round(1 - results["records"]["held"] / results["dict"]["held"], 3)
+    results["overhead_saving"] = round(
+        1 - results["records"]["overhead_per_message"] / results["dict"]["overhead_per_message"], 3
+    )
+    return results
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Compare the memory of dict and record chat histories.")
+    parser.add_argument("--messages", type=int, default=100000, help="Messages in the history (default: 100000)")
+    parser.add_argument("--min-saving", type=float, default=0.3,
+                        help="Minimum cut of the per-message overhead as a fraction (default: 0.3)")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, ROOT_DIR)
+    results = run(args.messages)
+
+    megabyte = 1024 * 1024
+    for name in ("dict", "records"):
+        result = results[name]
+        print(f"{name:<8} {result['held'] / megabyte:>8.1f} MB held  {result['peak'] / megabyte:>8.1f} MB peak  "
+              f"{result['bytes_per_message']:>8.1f} bytes/message  {result['overhead_per_message']:>8.1f} overhead")
+    print(f"Records save {results['saving']:.0%} in total and {results['overhead_saving']:.0%} of the "
+          f"per-message overhead for {args.messages} messages")
+
+    if args.output:
+        write_report(args.output, {"metadata": report_metadata(), "messages": args.messages, "results": results})
+        print(f"Report written to {args.output}")
+
+    if results["overhead_saving"] < args.min_saving:
+        print(f"Overhead saving below {args.min_saving:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
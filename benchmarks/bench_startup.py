@@ -0,0 +1,168 @@
+"""
+Cold and warm script run times for Chat.py and each page.
+
+Every measurement uses Streamlit's headless app testing (AppTest) against a
+synthetic history of the requested size in a temporary data directory:
+
+- cold: first run in a fresh interpreter (imports, history load, theme, logo)
+- new_session: first run of another session in the same, already warm process
+- rerun: median of further reruns of that session
+
+Cold runs are measured in subprocesses so each one really starts cold. The
+report is written as JSON so it can be diffed between releases.
+
+Usage:
+    python -m benchmarks.bench_startup --sizes 0,1000,10000 --output startup.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from typing import Any, Dict, List, Tuple
+
+from benchmarks.common import ROOT_DIR, report_metadata, synthetic_history, write_history, write_report
+
+
+PAGES = ["Chat.py", "pages/Settings.py", "pages/File_input.py", "pages/Realtime.py", "pages/Usage.py"]
+
+# API keys given to the app: none, so no run waits on a provider
+BENCH_SECRETS = {
+    "api_keys": {"openai": "", "anthropic": "", "gemini": "", "mistral": "", "deepseek": "", "ollama": "", "mock": ""},
+    "app_settings": {"use_streaming": False},
+}
+
+APP_TIMEOUT = 120
+
+
+def run_page(page: str) -> Tuple[float, Any]:
+    """Run a page once in a new session, return the duration in milliseconds and the app."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(os.path.join(ROOT_DIR, page), default_timeout=APP_TIMEOUT)
+    app.secrets.update(BENCH_SECRETS)
+    start = time.perf_counter()
+    app.run()
+    elapsed = (time.perf_counter() - start) * 1000
+    if app.exception:
+        raise RuntimeError(f"{page} raised: {app.exception[0].message}")
+    return elapsed, app
+
+
+def worker(page: str, reruns: int) -> Dict[str, Any]:
+    """
+    Measure one page inside this (fresh) interpreter.
+
+    Args:
+        page: Script path relative to the repository root
+        reruns: Number of warm reruns to time
+
+    Returns:
+        Dict[str, Any]: Timings in milliseconds
+    """
+    cold_ms, _ = run_page(page)
+    new_session_ms, app = run_page(page)
+
+    rerun_samples = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_samples.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "cold_ms": round(cold_ms, 1),
+        "new_session_ms": round(new_session_ms, 1),
+        "rerun_ms": round(statistics.median(rerun_samples), 1) if rerun_samples else None,
+    }
+
+
+def measure(page: str, data_dir: str, runs: int, reruns: int) -> Dict[str, Any]:
+    """
+    Measure a page in `runs` fresh interpreters and keep the medians.
+
+    Args:
+        page: Script path relative to the repository root
+        data_dir: Data directory holding the synthetic history
+        runs: Number of fresh interpreters
+        reruns: Warm reruns per interpreter
+
+    Returns:
+        Dict[str, Any]: Median timings in milliseconds
+    """
+    env = dict(os.environ, PROMPTLY_DATA_DIR=data_dir)
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_startup", "--worker", page, "--reruns", str(reruns)],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Benchmark worker for {page} failed:\n{result.stderr[-2000:]}")
+        samples.append(json.loads(result.stdout.strip().splitlines()[-1]))
+
+    return {
+        key: round(statistics.median(s[key] for s in samples), 1) if samples[0][key] is not None else None
+        for key in samples[0]
+    }
+
+
+def run(sizes: List[int], pages: List[str], runs: int, reruns: int) -> Dict[str, Any]:
+    """
+    Benchmark every page against every history size.
+
+    Args:
+        sizes: Total message counts of the synthetic histories
+        pages: Scripts to measure
+        runs: Fresh interpreters per measurement
+        reruns: Warm reruns per interpreter
+
+    Returns:
+        Dict[str, Any]: The full report
+    """
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="promptly-bench-") as data_dir:
+            history_file = write_history(data_dir, synthetic_history(size))
+            history_bytes = os.path.getsize(history_file)
+            for page in pages:
+                timings = measure(page, data_dir, runs, reruns)
+                results.append(dict(timings, page=page, messages=size, history_bytes=history_bytes))
+                print(f"{page:<22} {size:>7} messages: cold {timings['cold_ms']:>8} ms, "
+                      f"new session {timings['new_session_ms']:>8} ms, rerun {timings['rerun_ms']} ms")
+
+    return {
+        "benchmark": "startup",
+        "metadata": report_metadata(),
+        "parameters": {"sizes": sizes, "runs": runs, "reruns": reruns},
+        "results": results,
+    }
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Measure cold and warm script run times of the app pages.")
+    parser.add_argument("--sizes", default="0,1000,10000", help="Comma-separated history sizes in messages")
+    parser.add_argument("--pages", default=",".join(PAGES), help="Comma-separated scripts to measure")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement (default: 3)")
+    parser.add_argument("--reruns", type=int, default=5, help="Warm reruns per interpreter (default: 5)")
+    parser.add_argument("--output", default="bench_startup.json", help="Report file (default: bench_startup.json)")
+    parser.add_argument("--worker", metavar="PAGE", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.reruns)))
+        return 0
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    pages = [page.strip() for page in args.pages.split(",") if page.strip()]
+    report = run(sizes, pages, args.runs, args.reruns)
+    write_report(args.output, report)
+    print(f"Report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
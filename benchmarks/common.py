@@ -0,0 +1,98 @@
+import os
+import json
+import time
+import random
+import platform
+import subprocess
+from typing import Any, Dict
+
+
+# Repository root, so benchmarks can be started from anywhere
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORDS = (
+    "the model returns a short answer with code examples and explains each step "
+    "python stream token latency cache provider history message chat render"
+).split()
+
+
+def synthetic_text(rng: random.Random, words: int) -> str:
+    """Generate deterministic filler text of roughly the given number of words."""
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def synthetic_history(total_messages: int, messages_per_chat: int = 200, seed: int = 42) -> Dict[str, Any]:
+    """
+    Build a history.json payload with the given number of messages.
+
+    Args:
+        total_messages: Total number of messages across all chats
+        messages_per_chat: Messages per chat before starting a new one
+        seed: Random seed, so every run produces the same history
+
+    Returns:
+        Dict[str, Any]: A payload in the history.json format
+    """
+    rng = random.Random(seed)
+    chats = {}
+    chat_index = 0
+    remaining = total_messages
+    while remaining > 0:
+        count = min(messages_per_chat, remaining)
+        messages = []
+        for i in range(count):
+            role = "user" if i % 2 == 0 else "assistant"
+            words = rng.randint(5, 40) if role == "user" else rng.randint(40, 300)
+            messages.append({"role": role, "content": synthetic_text(rng, words), "id": i})
+        chats[f"chat_{chat_index}"] = {
+            "chat_started": True,
+            "messages": messages,
+            "selected_provider": "Ollama",
+            "selected_model": "llama3",
+            "title": f"Ollama - llama3 #{chat_index}",
+            "next_message_id": count,
+        }
+        chat_index += 1
+        remaining -= count
+    return {"chats": chats, "chat_counter": chat_index}
+
+
+def write_history(data_dir: str, history: Dict[str, Any]) -> str:
+    """Write a history payload into a data directory and return the file path."""
+    os.makedirs(data_dir, exist_ok=True)
+    history_file = os.path.join(data_dir, "history.json")
+    with open(history_file, "w") as f:
+        json.dump(history, f, indent=2)
+    return history_file
+
+
+def report_metadata() -> Dict[str, Any]:
+    """Describe the environment a benchmark report was produced in."""
+    try:
+        revision = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    try:
+        import streamlit
+        streamlit_version = streamlit.__version__
+    except ImportError:
+        streamlit_version = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": revision,
+        "python": platform.python_version(),
+        "streamlit": streamlit_version,
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def write_report(path: str, report: Dict[str, Any]) -> None:
+    """Write a benchmark report as stable, diff-friendly JSON."""
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# Level of the app's own loggers and of everything else (third-party libraries)
+DEFAULT_APP_LEVEL = os.environ.get("PROMPTLY_LOG_LEVEL", "INFO")
+DEFAULT_ROOT_LEVEL = "WARNING"
+
+# Per-module overrides, e.g. "llms.providers=DEBUG,history=WARNING,httpx=INFO"
+LOG_LEVELS = os.environ.get("PROMPTLY_LOG_LEVELS", "")
+
+# "text" or "json" (one JSON object per line)
+LOG_FORMAT = os.environ.get("PROMPTLY_LOG_FORMAT", "text")
+
+# Top-level loggers of the app. Chat.py logs as "chat" since Streamlit runs it as __main__.
+APP_LOGGERS = ("chat", "pages", "llms", "state", "history", "ui", "diagnostics", "tools")
+
+# Records waiting for the writer thread; when full, new records are dropped rather than blocking
+LOG_QUEUE_SIZE = 10000
+
+_request_id: contextvars.ContextVar = contextvars.ContextVar("promptly_request_id", default=None)
+_chat_id: contextvars.ContextVar = contextvars.ContextVar("promptly_chat_id", default=None)
+
+_configure_lock = threading.Lock()
+_listener = None
+
+
+@contextmanager
+def request_context(request_id: Optional[str] = None, chat_id: Optional[str] = None):
+    """
+    Attach a request id and chat id to every log line emitted inside the block.
+
+    The ids live in context variables, so they follow work into threads
+    started with a copied context (such as the upstream streaming thread).
+
+    Args:
+        request_id: Request identifier, e.g. a gateway or batch record id
+        chat_id: Chat the request belongs to
+    """
+    request_token = _request_id.set(request_id)
+    chat_token = _chat_id.set(chat_id)
+    try:
+        yield
+    finally:
+        _chat_id.reset(chat_token)
+        _request_id.reset(request_token)
+
+
+class _ContextFilter(logging.Filter):
+    """Copy the request and chat ids onto records in the logging thread."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get()
+        record.chat_id = _chat_id.get()
+        return True
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the writer falls behind."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "thread": record.threadName,
+        }
+        for field in ("request_id", "chat_id"):
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class TextFormatter(logging.Formatter):
+    """Human-readable format with the request and chat ids when present."""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s%(ids)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        ids = [f"{field}={getattr(record, field)}" for field in ("request_id", "chat_id") if getattr(record, field, None)]
+        record.ids = f" [{' '.join(ids)}]" if ids else ""
+        return super().format(record)
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """
+    Parse per-module levels like "llms=DEBUG,history=WARNING".
+
+    Args:
+        spec: Comma-separated logger=LEVEL pairs
+
+    Returns:
+        Dict[str, str]: Level name per logger name
+    """
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(
+    level: Optional[str] = None,
+    levels: Optional[Dict[str, str]] = None,
+    log_format: Optional[str] = None,
+    stream=None
+) -> None:
+    """
+    Route logging through a queue to a background writer thread (idempotent).
+
+    Callers only pay for putting the record on a bounded queue; formatting
+    and writing to stderr happen in the writer thread.
+
+    Args:
+        level: Level of the app's loggers (default PROMPTLY_LOG_LEVEL or INFO)
+        levels: Per-logger levels (default parsed from PROMPTLY_LOG_LEVELS)
+        log_format: "text" or "json" (default PROMPTLY_LOG_FORMAT)
+        stream: Output stream (default stderr)
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if (log_format or LOG_FORMAT) == "json" else TextFormatter())
+
+        log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+        handler = _NonBlockingQueueHandler(log_queue)
+        handler.addFilter(_ContextFilter())
+
+        root = logging.getLogger()
+        root.addHandler(handler)
+        root.setLevel(DEFAULT_ROOT_LEVEL)
+        for name in APP_LOGGERS:
+            logging.getLogger(name).setLevel((level or DEFAULT_APP_LEVEL).upper())
+        for name, module_level in (levels if levels is not None else parse_levels(LOG_LEVELS)).items():
+            logging.getLogger(name).setLevel(module_level)
+
+        _listener = logging.handlers.QueueListener(log_queue, output)
+        _listener.start()
+        atexit.register(_listener.stop)
@@ -0,0 +1,288 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+METRICS_FILE = os.path.join(DATA_DIR, "metrics.prom")
+
+# Seconds between rewrites of the Prometheus text file
+METRICS_WRITE_INTERVAL = 15
+
+# Log-spaced bucket upper bounds. Memory per series is fixed whatever the traffic.
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+RATE_BUCKETS = (1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 250, 500, 1000)
+
+HISTOGRAMS = {
+    "queue_wait_seconds": ("Time between a request being queued and reaching the provider", SECONDS_BUCKETS),
+    "ttft_seconds": ("Time to first streamed token", SECONDS_BUCKETS),
+    "inter_chunk_seconds": ("Gap between consecutive streamed chunks", SECONDS_BUCKETS),
+    "request_duration_seconds": ("Total duration of provider calls", SECONDS_BUCKETS),
+    "output_tokens_per_second": ("Output tokens per second of successful calls", RATE_BUCKETS),
+}
+
+COUNTERS = {
+    "requests_total": "Provider calls",
+    "errors_total": "Provider calls that failed",
+}
+
+METRIC_PREFIX = "promptly_"
+
+# Rough characters per token, used until providers report token usage
+CHARS_PER_TOKEN = 4
+
+
+class Histogram:
+    """Cumulative-bucket histogram with fixed memory, like Prometheus histograms."""
+
+    __slots__ = ("bounds", "counts", "count", "total")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate a quantile by linear interpolation inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.bounds[index - 1] if index > 0 else 0.0
+                if index >= len(self.bounds):
+                    return lower
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.bounds[-1]
+
+
+_lock = threading.Lock()
+_histograms: Dict[Tuple[str, str, str], Histogram] = {}
+_counters: Dict[Tuple[str, str, str], int] = {}
+_writer_thread = None
+_changed = False
+
+
+def _start_writer() -> None:
+    """Start the thread that rewrites METRICS_FILE. Caller holds the lock."""
+    global _writer_thread
+    if _writer_thread is None:
+        _writer_thread = threading.Thread(target=_write_periodically, name="metrics-writer", daemon=True)
+        _writer_thread.start()
+
+
+def observe(name: str, provider: str, model: str, value: float) -> None:
+    """
+    Record a value in a histogram.
+
+    Args:
+        name: Histogram name from HISTOGRAMS
+        provider: Name of the provider
+        model: Name of the model
+        value: Observed value
+    """
+    global _changed
+    key = (name, provider, model or "")
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+        _changed = True
+        _start_writer()
+
+
+def increment(name: str, provider: str, model: str, amount: int = 1) -> None:
+    """
+    Increase a counter.
+
+    Args:
+        name: Counter name from COUNTERS
+        provider: Name of the provider
+        model: Name of the model
+        amount: Increment
+    """
+    global _changed
+    key = (name, provider, model or "")
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+        _changed = True
+        _start_writer()
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a text."""
+    return max(1, len(text) // CHARS_PER_TOKEN) if text else 0
+
+
+def record_call(provider: str, model: str, duration: float, text: str, ok: bool) -> None:
+    """
+    Record a complete (non-streaming) provider call.
+
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+        duration: Call duration in seconds
+        text: Response text
+        ok: Whether the call succeeded
+    """
+    increment("requests_total", provider, model)
+    observe("request_duration_seconds", provider, model, duration)
+    if not ok:
+        increment("errors_total", provider, model)
+    elif duration > 0:
+        observe("output_tokens_per_second", provider, model, estimate_tokens(text) / duration)
+
+
+def record_queue_wait(provider: str, model: str, seconds: float) -> None:
+    """Record how long a request waited before being sent to the provider."""
+    observe("queue_wait_seconds", provider, model, max(0.0, seconds))
+
+
+class StreamTimer:
+    """Collect TTFT, inter-chunk gaps, duration and throughput for one stream."""
+
+    def __init__(self, provider: str, model: str):
+        self.provider = provider
+        self.model = model
+        self.started_at = time.perf_counter()
+        self.last_chunk_at = None
+        self.characters = 0
+
+    def chunk(self, text: str) -> None:
+        """Record the arrival of a chunk."""
+        now = time.perf_counter()
+        if self.last_chunk_at is None:
+            observe("ttft_seconds", self.provider, self.model, now - self.started_at)
+        else:
+            observe("inter_chunk_seconds", self.provider, self.model, now - self.last_chunk_at)
+        self.last_chunk_at = now
+        self.characters += len(text)
+
+    def finish(self, ok: bool) -> None:
+        """Record the end of the stream."""
+        duration = time.perf_counter() - self.started_at
+        increment("requests_total", self.provider, self.model)
+        observe("request_duration_seconds", self.provider, self.model, duration)
+        if not ok:
+            increment("errors_total", self.provider, self.model)
+        elif self.last_chunk_at is not None and duration > 0:
+            tokens = max(1, self.characters // CHARS_PER_TOKEN)
+            observe("output_tokens_per_second", self.provider, self.model, tokens / duration)
+
+
+def _labels(provider: str, model: str, extra: str = "") -> str:
+    provider = provider.replace("\\", "\\\\").replace('"', '\\"')
+    model = model.replace("\\", "\\\\").replace('"', '\\"')
+    return f'{{provider="{provider}",model="{model}"{extra}}}'
+
+
+def render_prometheus() -> str:
+    """
+    Render every metric in the Prometheus text exposition format.
+
+    Returns:
+        str: Metrics text
+    """
+    with _lock:
+        histograms = {key: (list(h.counts), h.count, h.total, h.bounds) for key, h in _histograms.items()}
+        counters = dict(_counters)
+
+    lines = []
+    for name, description in COUNTERS.items():
+        metric = METRIC_PREFIX + name
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} counter")
+        for (counter_name, provider, model), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f"{metric}{_labels(provider, model)} {value}")
+
+    for name, (description, _bounds) in HISTOGRAMS.items():
+        metric = METRIC_PREFIX + name
+        lines.append(f"# HELP {metric} {description}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (histogram_name, provider, model), (counts, count, total, bounds) in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                bucket_labels = _labels(provider, model, ',le="%s"' % bound)
+                lines.append(f"{metric}_bucket{bucket_labels} {cumulative}")
+            bucket_labels = _labels(provider, model, ',le="+Inf"')
+            lines.append(f"{metric}_bucket{bucket_labels} {count}")
+            lines.append(f"{metric}_sum{_labels(provider, model)} {total}")
+            lines.append(f"{metric}_count{_labels(provider, model)} {count}")
+
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path: str = METRICS_FILE) -> None:
+    """Write the Prometheus text atomically, e.g. for node_exporter's textfile collector."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _write_periodically() -> None:
+    global _changed
+    while True:
+        time.sleep(METRICS_WRITE_INTERVAL)
+        with _lock:
+            changed, _changed = _changed, False
+        if changed:
+            try:
+                write_prometheus_file()
+            except OSError as e:
+                logger.warning("Could not write metrics file: %s", e)
+
+
+def summary() -> List[Dict[str, object]]:
+    """
+    Summarize metrics per provider and model for display.
+
+    Returns:
+        List[Dict[str, object]]: One row per provider/model with percentiles and counts
+    """
+    def rounded(value):
+        return round(value, 3) if value is not None else None
+
+    with _lock:
+        series = sorted({(provider, model) for (_name, provider, model) in list(_histograms) + list(_counters)})
+        rows = []
+        for provider, model in series:
+            ttft = _histograms.get(("ttft_seconds", provider, model))
+            duration = _histograms.get(("request_duration_seconds", provider, model))
+            queue = _histograms.get(("queue_wait_seconds", provider, model))
+            rate = _histograms.get(("output_tokens_per_second", provider, model))
+            gaps = _histograms.get(("inter_chunk_seconds", provider, model))
+            rows.append({
+                "provider": provider,
+                "model": model,
+                "requests": _counters.get(("requests_total", provider, model), 0),
+                "errors": _counters.get(("errors_total", provider, model), 0),
+                "queue_p50_s": rounded(queue.quantile(0.5)) if queue else None,
+                "ttft_p50_s": rounded(ttft.quantile(0.5)) if ttft else None,
+                "ttft_p95_s": rounded(ttft.quantile(0.95)) if ttft else None,
+                "gap_p95_s": rounded(gaps.quantile(0.95)) if gaps else None,
+                "duration_p50_s": rounded(duration.quantile(0.5)) if duration else None,
+                "duration_p95_s": rounded(duration.quantile(0.95)) if duration else None,
+                "tokens_per_s_p50": rounded(rate.quantile(0.5)) if rate else None,
+            })
+    return rows
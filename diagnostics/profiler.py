@@ -0,0 +1,229 @@
+import os
+import time
+import json
+import pstats
+import cProfile
+import logging
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+PROFILE_DIR = os.path.join(DATA_DIR, "profiles")
+
+# Functions listed in a profile summary
+TOP_FUNCTIONS = 15
+
+# Profile of the script run in progress in this thread/context, if any
+_current_profile: contextvars.ContextVar = contextvars.ContextVar("promptly_current_profile", default=None)
+
+
+class RunProfile:
+    """cProfile statistics and phase timings of one script run."""
+
+    __slots__ = ("started", "duration", "phases", "stats", "_profiler", "_start", "_summary")
+
+    def __init__(self):
+        self.started = time.time()
+        self.duration = 0.0
+        self.phases: Dict[str, float] = {}
+        self.stats: Optional[pstats.Stats] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._start = 0.0
+        self._summary: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        self._start = time.perf_counter()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            self._profiler = profiler
+        except ValueError as e:
+            # Another profiler is active in this thread: keep the phase timings only
+            logger.warning("Function profiling unavailable: %s", e)
+
+    def stop(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        if self._profiler is not None:
+            self._profiler.disable()
+            self.stats = pstats.Stats(self._profiler)
+            self._profiler = None
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        """Add time spent in a phase; a phase entered several times adds up."""
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def top_functions(self, limit: int = TOP_FUNCTIONS) -> List[Dict[str, Any]]:
+        """
+        Functions taking the most time, including the functions they call.
+
+        Args:
+            limit: Number of functions returned
+
+        Returns:
+            List[Dict[str, Any]]: function, calls, own_ms and cumulative_ms, slowest first
+        """
+        if self.stats is None:
+            return []
+        rows = []
+        for (filename, line, name), (_, calls, own, cumulative, _) in self.stats.stats.items():
+            if filename == "~":
+                location = name
+            else:
+                location = f"{name} ({os.path.join(os.path.basename(os.path.dirname(filename)), os.path.basename(filename))}:{line})"
+            rows.append({
+                "function": location,
+                "calls": calls,
+                "own_ms": round(own * 1000, 2),
+                "cumulative_ms": round(cumulative * 1000, 2),
+            })
+        rows.sort(key=lambda row: row["cumulative_ms"], reverse=True)
+        return rows[:limit]
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the run for display, once the run has ended.
+
+        Returns:
+            Dict[str, Any]: started, duration_ms, phases (name and ms, slowest first) and top functions
+        """
+        if self._summary is None:
+            self._summary = self._summarize()
+        return self._summary
+
+    def _summarize(self) -> Dict[str, Any]:
+        return {
+            "started": self.started,
+            "duration_ms": round(self.duration * 1000, 1),
+            "phases": [
+                {"phase": name, "ms": round(seconds * 1000, 1)}
+                for name, seconds in sorted(self.phases.items(), key=lambda item: item[1], reverse=True)
+            ],
+            "top": self.top_functions(),
+        }
+
+    def dump(self, directory: str = PROFILE_DIR) -> str:
+        """
+        Write the run to disk: a .prof file for pstats, snakeviz or similar tools,
+        and the summary next to it as .json.
+
+        Args:
+            directory: Directory the files are written to
+
+        Returns:
+            str: Path of the .prof file
+        """
+        os.makedirs(directory, exist_ok=True)
+        base = os.path.join(
+            directory,
+            time.strftime("rerun-%Y%m%d-%H%M%S", time.localtime(self.started)) + f"-{int(self.started * 1000) % 1000:03d}"
+        )
+        if self.stats is not None:
+            self.stats.dump_stats(base + ".prof")
+        with open(base + ".json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        return base + ".prof"
+
+
+class _ProfileScope:
+    """Context manager profiling the block and handing the profile to a callback."""
+
+    __slots__ = ("on_finish", "profile", "token")
+
+    def __init__(self, on_finish: Callable[[RunProfile], None]):
+        self.on_finish = on_finish
+        self.profile = RunProfile()
+        self.token = None
+
+    def __enter__(self) -> RunProfile:
+        self.token = _current_profile.set(self.profile)
+        self.profile.start()
+        return self.profile
+
+    def __exit__(self, exc_type, exc, tb):
+        # Also runs when the block ends with a Streamlit rerun or stop
+        self.profile.stop()
+        _current_profile.reset(self.token)
+        try:
+            self.on_finish(self.profile)
+        except Exception as e:
+            logger.error("Could not keep the run profile: %s", e)
+        return False
+
+
+class _PhaseScope:
+    """Context manager adding the block's duration to a phase of the current profile."""
+
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile: RunProfile, name: str):
+        self.profile = profile
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.add_phase(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class _NoopScope:
+    """Shared do-nothing context manager used when profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SCOPE = _NoopScope()
+
+
+def profile_run(enabled: bool, on_finish: Callable[[RunProfile], None]) -> Any:
+    """
+    Profile a script run with cProfile and collect its phase timings.
+
+    The profile is handed to on_finish however the block ends, including
+    st.rerun() and st.stop(), which leave the script through an exception.
+    When disabled this returns a shared no-op object.
+
+    Usage:
+        with profile_run(settings.get("profile_reruns", False), keep_profile):
+            show_chat()
+
+    Args:
+        enabled: Whether to profile
+        on_finish: Called with the RunProfile when the block ends
+
+    Returns:
+        A context manager
+    """
+    if not enabled:
+        return _NOOP_SCOPE
+    return _ProfileScope(on_finish)
+
+
+def phase(name: str) -> Any:
+    """
+    Time a block as a named phase of the run being profiled.
+
+    Costs one context variable lookup when no run is being profiled.
+
+    Args:
+        name: Phase name, e.g. "sidebar" or "save"
+
+    Returns:
+        A context manager
+    """
+    profile = _current_profile.get()
+    if profile is None:
+        return _NOOP_SCOPE
+    return _PhaseScope(profile, name)
@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import queue
+import random
+import logging
+import functools
+import threading
+import contextvars
+from typing import Any, Dict, List
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+TRACE_FILE = os.environ.get("PROMPTLY_TRACE_FILE", os.path.join(DATA_DIR, "traces.jsonl"))
+
+SERVICE_NAME = "promptly"
+
+# Fraction of root spans (and their whole trace) that are recorded. 0 disables tracing.
+_sample_rate = float(os.environ.get("PROMPTLY_TRACE_SAMPLE_RATE", "0") or 0)
+
+# Span currently active in this thread/context, or _UNSAMPLED inside a dropped trace
+_current_span: contextvars.ContextVar = contextvars.ContextVar("promptly_current_span", default=None)
+
+_export_queue: "queue.SimpleQueue[Span]" = queue.SimpleQueue()
+_writer_lock = threading.Lock()
+_writer_thread = None
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+def set_sample_rate(rate: float) -> None:
+    """
+    Set the fraction of traces recorded, process-wide.
+
+    Args:
+        rate: Between 0 (tracing off) and 1 (every trace)
+    """
+    global _sample_rate
+    _sample_rate = min(1.0, max(0.0, float(rate)))
+
+
+def get_sample_rate() -> float:
+    """Return the fraction of traces recorded."""
+    return _sample_rate
+
+
+class Span:
+    """A timed operation, exported in the OpenTelemetry (OTLP/JSON) span format."""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status", "message")
+
+    def __init__(self, name: str, trace_id: str, parent_id: str, attributes: Dict[str, Any]):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Attach an attribute to the span."""
+        self.attributes[key] = value
+
+    def record_error(self, error: Any) -> None:
+        """Mark the span as failed."""
+        self.status = STATUS_ERROR
+        self.message = str(error)[:500]
+
+    def end(self) -> None:
+        """Finish the span and queue it for export (idempotent)."""
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _export(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Convert to an OTLP/JSON span."""
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status, "message": self.message} if self.message else {"code": self.status},
+        }
+
+
+class _NoopSpan:
+    """Stand-in returned when a span is not recorded; every method does nothing."""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: Any) -> None:
+        pass
+
+    def end(self) -> None:
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+# Marker set as the current span inside a trace that was not sampled, so
+# nested spans do not start traces of their own
+_UNSAMPLED = object()
+
+
+class _SpanScope:
+    """Context manager making a span (or the unsampled marker) current."""
+
+    __slots__ = ("span", "token")
+
+    def __init__(self, span):
+        self.span = span
+        self.token = None
+
+    def __enter__(self):
+        self.token = _current_span.set(self.span)
+        return self.span if self.span is not _UNSAMPLED else _NOOP_SPAN
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self.token)
+        if self.span is not _UNSAMPLED:
+            # Control flow like Streamlit reruns derives from BaseException, not an error
+            if isinstance(exc, Exception):
+                self.span.record_error(exc)
+            self.span.end()
+        return False
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def _new_span(name: str, attributes: Dict[str, Any], parent) -> Any:
+    """Create a span under parent, a new root span, or _UNSAMPLED."""
+    if parent is _UNSAMPLED:
+        return _UNSAMPLED
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    if random.random() >= _sample_rate:
+        return _UNSAMPLED
+    return Span(name, f"{random.getrandbits(128):032x}", "", attributes)
+
+
+def span(name: str, **attributes) -> Any:
+    """
+    Time a block of code as a span, nested under the current span.
+
+    A new trace is sampled when there is no current span. When tracing is
+    off this returns a shared no-op object without touching any state.
+
+    Usage:
+        with span("history.save_chats", chats=len(chats)) as current:
+            current.set_attribute("bytes", size)
+
+    Args:
+        name: Span name
+        **attributes: Span attributes
+
+    Returns:
+        A context manager yielding the span
+    """
+    parent = _current_span.get()
+    if parent is None and _sample_rate <= 0:
+        return _NOOP_SPAN
+    return _SpanScope(_new_span(name, attributes, parent))
+
+
+def start_span(name: str, **attributes) -> Any:
+    """
+    Start a span under the current span without making it current.
+
+    Meant for generators, which must not change the caller's context between
+    yields. Call .end() on the result when the operation finishes.
+
+    Args:
+        name: Span name
+        **attributes: Span attributes
+
+    Returns:
+        Span or a no-op span
+    """
+    parent = _current_span.get()
+    if parent is None and _sample_rate <= 0:
+        return _NOOP_SPAN
+    new_span = _new_span(name, attributes, parent)
+    return _NOOP_SPAN if new_span is _UNSAMPLED else new_span
+
+
+def context_with(current) -> contextvars.Context:
+    """
+    Copy the current context with the given span made current.
+
+    Used to run work in another thread as a child of a span started with
+    start_span().
+
+    Args:
+        current: Span returned by start_span()
+
+    Returns:
+        contextvars.Context: Context to run the work in
+    """
+    context = contextvars.copy_context()
+    if isinstance(current, Span):
+        context.run(_current_span.set, current)
+    return context
+
+
+def traced(name: str):
+    """
+    Decorator running a function inside a span.
+
+    Args:
+        name: Span name
+
+    Returns:
+        The decorator
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _export(finished: Span) -> None:
+    """Queue a finished span; the writer thread does the file I/O."""
+    global _writer_thread
+    _export_queue.put(finished)
+    if _writer_thread is None:
+        with _writer_lock:
+            if _writer_thread is None:
+                _writer_thread = threading.Thread(target=_write_spans, name="trace-writer", daemon=True)
+                _writer_thread.start()
+
+
+def _write_spans() -> None:
+    """Append queued spans to TRACE_FILE, one OTLP/JSON export request per line."""
+    while True:
+        batch: List[Span] = [_export_queue.get()]
+        # Let the rest of the trace finish so it lands in the same batch
+        time.sleep(0.5)
+        while True:
+            try:
+                batch.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME)]},
+                "scopeSpans": [{
+                    "scope": {"name": SERVICE_NAME},
+                    "spans": [finished.to_otlp() for finished in batch],
+                }],
+            }]
+        }
+        try:
+            os.makedirs(os.path.dirname(TRACE_FILE) or ".", exist_ok=True)
+            with open(TRACE_FILE, "a") as f:
+                f.write(json.dumps(payload) + "\n")
+        except OSError as e:
+            logger.warning("Could not write traces: %s", e)
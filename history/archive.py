@@ -0,0 +1,239 @@
+import os
+import json
+import gzip
+import time
+import logging
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from history.history import DATA_DIR, MANIFEST_FILE, history_file
+from history.models import content_digest
+
+
+logger = logging.getLogger(__name__)
+
+# Compressed segments of archived chats and their index
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+INDEX_FILE = os.path.join(ARCHIVE_DIR, "index.json")
+
+# Chats not changed for this many days move to the archive (0 disables archiving)
+ARCHIVE_AFTER_DAYS = float(os.environ.get("PROMPTLY_ARCHIVE_AFTER_DAYS", "30") or 0)
+
+# Archived chats older than this many days are deleted or summarized (0 keeps them)
+RETENTION_DAYS = float(os.environ.get("PROMPTLY_ARCHIVE_RETENTION_DAYS", "0") or 0)
+
+# "delete" or "summarize": keep the first prompt and the last answer only
+RETENTION_ACTIONS = ("delete", "summarize")
+RETENTION_ACTION = os.environ.get("PROMPTLY_ARCHIVE_RETENTION_ACTION", "delete")
+if RETENTION_ACTION not in RETENTION_ACTIONS:
+    # A typo must not fall back to deleting
+    logger.error("Unknown PROMPTLY_ARCHIVE_RETENTION_ACTION %r (expected %s): archive retention is disabled",
+                 RETENTION_ACTION, " or ".join(RETENTION_ACTIONS))
+
+DAY = 24 * 60 * 60
+
+
+def read_index() -> Dict[str, Dict[str, Any]]:
+    """
+    Read the archive index.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: Chat ID to segment, title, updated_at, archived_at, messages, digest and summarized
+    """
+    try:
+        with open(INDEX_FILE, "r") as f:
+            return json.load(f).get("chats", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index: Dict[str, Dict[str, Any]]) -> None:
+    """Save the archive index atomically and delete the segments it no longer references."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    tmp_file = f"{INDEX_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({"chats": index}, f)
+    os.replace(tmp_file, INDEX_FILE)
+
+    referenced = {entry["segment"] for entry in index.values()}
+    for name in os.listdir(ARCHIVE_DIR):
+        if name.endswith(".json.gz") and name not in referenced:
+            try:
+                os.remove(os.path.join(ARCHIVE_DIR, name))
+            except OSError:
+                pass
+
+
+def _write_segment(chats: Dict[str, Dict[str, Any]]) -> str:
+    """Write chats to a new gzip segment and return its file name."""
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    name = f"segment-{time.time_ns()}-{os.getpid()}.json.gz"
+    tmp_file = os.path.join(ARCHIVE_DIR, name + ".tmp")
+    with gzip.open(tmp_file, "wt", encoding="utf-8", compresslevel=6) as f:
+        json.dump({"chats": chats}, f)
+    os.replace(tmp_file, os.path.join(ARCHIVE_DIR, name))
+    return name
+
+
+def _read_segment(name: str) -> Dict[str, Dict[str, Any]]:
+    with gzip.open(os.path.join(ARCHIVE_DIR, name), "rt", encoding="utf-8") as f:
+        return json.load(f)["chats"]
+
+
+def archive_chats(chats: Dict[str, Dict[str, Any]], summarized: bool = False) -> None:
+    """
+    Write chats to a new segment and add them to the index. The caller
+    holds the history lock and removes them from the history afterwards.
+
+    Args:
+        chats: Chat ID to the chat's history.json dict
+        summarized: Whether the chats were reduced by the retention rules
+    """
+    if not chats:
+        return
+    segment = _write_segment(chats)
+    index = read_index()
+    now = time.time()
+    for chat_id, chat in chats.items():
+        index[chat_id] = {
+            "segment": segment,
+            "title": chat.get("title", chat_id),
+            "updated_at": chat.get("updated_at"),
+            "archived_at": index.get(chat_id, {}).get("archived_at", now),
+            "messages": len(chat.get("messages", [])),
+            "digest": content_digest(chat.get("messages", [])),
+            "summarized": summarized,
+        }
+    _save_index(index)
+
+
+def read_archived_chat(chat_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Read one archived chat from its segment.
+
+    Returns:
+        Optional[Dict[str, Any]]: The chat's history.json dict, None if it is not archived
+    """
+    entry = read_index().get(chat_id)
+    if entry is None:
+        return None
+    try:
+        return _read_segment(entry["segment"]).get(chat_id)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def iter_archived_chats() -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Read every archived chat, one segment at a time.
+
+    Yields:
+        Tuple[str, Dict[str, Any]]: Chat ID and the chat's history.json dict
+    """
+    segments: Dict[str, List[str]] = {}
+    for chat_id, entry in read_index().items():
+        segments.setdefault(entry["segment"], []).append(chat_id)
+    for segment, chat_ids in segments.items():
+        try:
+            chats = _read_segment(segment)
+        except (OSError, ValueError, KeyError):
+            # Restored or deleted meanwhile
+            continue
+        for chat_id in chat_ids:
+            if chat_id in chats:
+                yield chat_id, chats[chat_id]
+
+
+def forget_chats(chat_ids: List[str]) -> None:
+    """Remove chats from the archive (restored or deleted). The caller holds the history lock."""
+    index = read_index()
+    if any(chat_id in index for chat_id in chat_ids):
+        for chat_id in chat_ids:
+            index.pop(chat_id, None)
+        _save_index(index)
+
+
+def summarize_chat(chat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Reduce a chat to its first prompt and its last answer, noting how many messages were dropped.
+
+    Branches are dropped; the chat record keeps its other fields.
+    """
+    messages = chat.get("messages", [])
+    first_prompt = next((message for message in messages if message.get("role") == "user"), None)
+    last_answer = next((message for message in reversed(messages) if message.get("role") == "assistant"), None)
+    kept = [message for message in (first_prompt, last_answer) if message is not None]
+    dropped = len(messages) - len(kept)
+    summary = {key: value for key, value in chat.items() if key not in ("messages", "branches")}
+    summary["messages"] = kept
+    if dropped:
+        summary["title"] = f"{chat.get('title', '')} (summarized, {dropped} messages removed)"
+    return summary
+
+
+def apply_retention(now: Optional[float] = None, days: Optional[float] = None, action: Optional[str] = None) -> int:
+    """
+    Delete or summarize chats archived more than the retention period ago.
+    The caller holds the history lock.
+
+    Args:
+        now: Current time, for tests
+        days: Retention period, 0 keeps archived chats forever (default: RETENTION_DAYS)
+        action: "delete" or "summarize" (default: RETENTION_ACTION)
+
+    Returns:
+        int: Number of chats deleted or summarized (0 for an unknown action)
+    """
+    days = RETENTION_DAYS if days is None else days
+    action = RETENTION_ACTION if action is None else action
+    if days <= 0:
+        return 0
+    if action not in RETENTION_ACTIONS:
+        logger.error("Skipping archive retention: unknown action %r", action)
+        return 0
+    now = time.time() if now is None else now
+    index = read_index()
+    expired = [
+        chat_id for chat_id, entry in index.items()
+        if entry["archived_at"] < now - days * DAY and not (action == "summarize" and entry.get("summarized"))
+    ]
+    if not expired:
+        return 0
+    if action == "summarize":
+        summaries = {}
+        for chat_id in expired:
+            chat = read_archived_chat(chat_id)
+            if chat is not None:
+                summaries[chat_id] = summarize_chat(chat)
+        archive_chats(summaries, summarized=True)
+    else:
+        forget_chats(expired)
+    return len(expired)
+
+
+def _size(path: str) -> int:
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+def disk_usage() -> Dict[str, Dict[str, Any]]:
+    """
+    Report the disk used by each storage tier.
+
+    Returns:
+        Dict[str, Dict[str, Any]]: "hot" (history file and manifest) and "archive" (segments and index) bytes and files
+    """
+    segments = []
+    if os.path.isdir(ARCHIVE_DIR):
+        segments = [name for name in os.listdir(ARCHIVE_DIR) if name.endswith(".json.gz")]
+    index = read_index()
+    return {
+        "hot": {"bytes": _size(history_file()) + _size(MANIFEST_FILE), "files": 2},
+        "archive": {
+            "bytes": sum(_size(os.path.join(ARCHIVE_DIR, name)) for name in segments) + _size(INDEX_FILE),
+            "files": len(segments) + (1 if os.path.exists(INDEX_FILE) else 0),
+            "chats": len(index),
+            "messages": sum(entry.get("messages", 0) for entry in index.values()),
+        },
+    }
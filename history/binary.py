@@ -0,0 +1,205 @@
+"""
+Binary history format: length-prefixed msgpack records with an offset index.
+
+Layout of history.pack:
+
+    header   MAGIC, revision (u64), offset of the index (u64)
+    chats    per chat: one record of its fields (all but the messages),
+             then one record per message
+    index    one record: {"chat_counter", "extra": other top-level keys,
+             "chats": {chat_id: [fields offset, messages start, messages end, message count]}}
+
+A record is a big-endian u32 length followed by that many bytes of msgpack.
+The file is memory-mapped and only the records asked for are decoded, so
+one chat, or one page of a chat's messages, is read without touching the
+rest of the history. A chat's message records are contiguous, so their
+byte span can be copied unchanged into the next file, like the JSON spans.
+"""
+import mmap
+import struct
+from typing import Any, Dict, Iterator, List, Optional
+
+import msgpack
+
+from history.models import to_json
+
+
+MAGIC = b"PRMPTLY1"
+HEADER = struct.Struct(">8sQQ")
+LENGTH = struct.Struct(">I")
+
+
+def _pack(value: Any) -> bytes:
+    payload = msgpack.packb(value, default=to_json, use_bin_type=True)
+    return LENGTH.pack(len(payload)) + payload
+
+
+def _unpack(payload) -> Any:
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+def iter_records(buffer, start: int = 0, end: Optional[int] = None) -> Iterator[memoryview]:
+    """
+    Iterate over the records between two offsets of a buffer, without decoding them.
+
+    Args:
+        buffer: bytes or mmap holding the records
+        start: Offset of the first record
+        end: Offset after the last record (default: end of the buffer)
+
+    Yields:
+        memoryview: The msgpack payload of each record
+    """
+    view = memoryview(buffer)
+    end = len(view) if end is None else end
+    offset = start
+    while offset < end:
+        (length,) = LENGTH.unpack_from(view, offset)
+        offset += LENGTH.size
+        yield view[offset:offset + length]
+        offset += length
+
+
+def decode_messages(raw: bytes) -> List[Dict[str, Any]]:
+    """Decode the message records of a chat's span."""
+    return [_unpack(payload) for payload in iter_records(raw)]
+
+
+def is_binary(head: bytes) -> bool:
+    """Whether the first bytes of a file are those of a binary history."""
+    return head[:len(MAGIC)] == MAGIC
+
+
+def read_rev(head: bytes) -> Optional[int]:
+    """Revision in the header of a binary history, None for another file."""
+    if len(head) < HEADER.size or not is_binary(head):
+        return None
+    return HEADER.unpack_from(head)[1]
+
+
+def write_history(f, history: Dict[str, Any], raw_messages: Dict[str, bytes]) -> Dict[str, List[int]]:
+    """
+    Write a history to an open binary file.
+
+    Args:
+        f: File opened for binary writing
+        history: {"rev", "chat_counter", "chats", ...}
+        raw_messages: Chat ID to the message records of its span in the current file, for evicted chats
+
+    Returns:
+        Dict[str, List[int]]: Byte span of each chat's message records
+    """
+    f.write(HEADER.pack(MAGIC, history.get("rev") or 0, 0))
+    spans, entries = {}, {}
+    for chat_id, chat in history.get("chats", {}).items():
+        fields_offset = f.tell()
+        f.write(_pack({key: value for key, value in chat.items() if key != "messages"}))
+        start = f.tell()
+        if chat_id in raw_messages:
+            raw = raw_messages[chat_id]
+            f.write(raw)
+            count = sum(1 for _ in iter_records(raw))
+        else:
+            messages = chat.get("messages", [])
+            f.write(b"".join(_pack(message) for message in messages))
+            count = len(messages)
+        spans[chat_id] = [start, f.tell()]
+        entries[chat_id] = [fields_offset, start, f.tell(), count]
+    index_offset = f.tell()
+    extra = {key: value for key, value in history.items() if key not in ("rev", "chat_counter", "chats")}
+    f.write(_pack({"chat_counter": history.get("chat_counter", 0), "extra": extra, "chats": entries}))
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, history.get("rev") or 0, index_offset))
+    return spans
+
+
+class BinaryHistory:
+    """
+    Read access to a binary history file through a memory map.
+
+    Use as a context manager:
+
+        with BinaryHistory(path) as history:
+            chat = history.read_chat("chat_3")
+            page = history.read_messages("chat_3", start=100, count=20)
+    """
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self._file.close()
+            raise ValueError(f"{path} is not a binary history") from None
+        if not is_binary(self._map[:HEADER.size]):
+            self.close()
+            raise ValueError(f"{path} is not a binary history")
+        _, self.rev, index_offset = HEADER.unpack_from(self._map)
+        index = _unpack(next(iter_records(self._map, index_offset)))
+        self.chat_counter = index["chat_counter"]
+        self.extra = index["extra"]
+        self._chats = index["chats"]
+
+    def __enter__(self) -> "BinaryHistory":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if getattr(self, "_map", None) is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def chat_ids(self) -> List[str]:
+        """IDs of the chats, in file order."""
+        return list(self._chats)
+
+    def message_count(self, chat_id: str) -> int:
+        return self._chats[chat_id][3]
+
+    def spans(self) -> Dict[str, List[int]]:
+        """Byte span of each chat's message records, as returned by write_history()."""
+        return {chat_id: [entry[1], entry[2]] for chat_id, entry in self._chats.items()}
+
+    def read_fields(self, chat_id: str) -> Dict[str, Any]:
+        """A chat's fields without its messages."""
+        return _unpack(next(iter_records(self._map, self._chats[chat_id][0])))
+
+    def read_messages(self, chat_id: str, start: int = 0, count: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Decode a page of a chat's messages; the ones before it are skipped by their length only.
+
+        Args:
+            chat_id: The chat
+            start: Position of the first message
+            count: Number of messages (default: to the end)
+
+        Returns:
+            List[Dict[str, Any]]: The messages as history.json dicts
+        """
+        _, span_start, span_end, _ = self._chats[chat_id]
+        messages = []
+        for position, payload in enumerate(iter_records(self._map, span_start, span_end)):
+            if count is not None and position >= start + count:
+                break
+            if position >= start:
+                messages.append(_unpack(payload))
+        return messages
+
+    def read_chat(self, chat_id: str) -> Dict[str, Any]:
+        """A chat with its messages, as its history.json dict."""
+        chat = self.read_fields(chat_id)
+        chat["messages"] = self.read_messages(chat_id)
+        return chat
+
+    def read_history(self) -> Dict[str, Any]:
+        """The whole history, as the history.json dict."""
+        # Revision 0 is a history written without one
+        history = {"rev": self.rev} if self.rev else {}
+        history.update(self.extra)
+        history["chat_counter"] = self.chat_counter
+        history["chats"] = {chat_id: self.read_chat(chat_id) for chat_id in self._chats}
+        return history
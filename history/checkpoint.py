@@ -0,0 +1,97 @@
+"""
+Checkpoints of answers being generated.
+
+Each answer being streamed has a small file in data/checkpoints/ with its
+text so far, rewritten at every checkpoint instead of the whole history.
+The chat repository folds it into the history when the answer ends or is
+interrupted, or, after a crash, once the process that wrote it is gone.
+
+A checkpoint's name is "<chat id>.<pid>.<random>.json", so a process can
+tell its own checkpoints and those of processes still running from the
+ones left behind.
+"""
+import os
+import json
+import uuid
+from typing import Any, Dict, Iterable, List, Optional
+
+from history.history import DATA_DIR
+
+
+CHECKPOINT_DIR = os.path.join(DATA_DIR, "checkpoints")
+
+
+def new_name(chat_id: str) -> str:
+    """A checkpoint name for an answer of a chat, unique across processes."""
+    return f"{chat_id}.{os.getpid()}.{uuid.uuid4().hex[:12]}.json"
+
+
+def write_checkpoint(name: str, record: Dict[str, Any]) -> None:
+    """
+    Replace a checkpoint, through a temporary file.
+
+    Args:
+        name: Name from new_name()
+        record: {"chat_id", "message_id": the message continued or None, "content"}
+    """
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    path = os.path.join(CHECKPOINT_DIR, name)
+    tmp_file = path + ".tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(record, f)
+    os.replace(tmp_file, path)
+
+
+def read_checkpoint(name: str) -> Optional[Dict[str, Any]]:
+    """A checkpoint's record, None if it was removed or is unreadable."""
+    try:
+        with open(os.path.join(CHECKPOINT_DIR, name), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_checkpoint(name: str) -> None:
+    """Remove a checkpoint if it exists."""
+    try:
+        os.remove(os.path.join(CHECKPOINT_DIR, name))
+    except FileNotFoundError:
+        pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running under another user
+        return True
+    return True
+
+
+def orphaned(live: Iterable[str]) -> List[str]:
+    """
+    Names of the checkpoints no answer is being written to anymore.
+
+    Args:
+        live: Names of the checkpoints of answers this process is generating
+
+    Returns:
+        List[str]: Checkpoints of this process not in live, and those of processes that are gone
+    """
+    try:
+        names = os.listdir(CHECKPOINT_DIR)
+    except FileNotFoundError:
+        return []
+    live = set(live)
+    pid = os.getpid()
+    orphans = []
+    for name in names:
+        parts = name.rsplit(".", 3)
+        if len(parts) != 4 or parts[3] != "json" or not parts[1].isdigit():
+            continue
+        owner = int(parts[1])
+        if (owner == pid and name not in live) or (owner != pid and not _alive(owner)):
+            orphans.append(name)
+    return orphans
@@ -1,42 +1,227 @@
 import os
+import re
 import json
 import streamlit as st
 
+from diagnostics.tracing import traced
+from diagnostics.profiler import phase
+from history.models import to_json
+from history import binary
+
+
+# Data directory, overridable for benchmarks and separate profiles
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
+# Held by the process writing the history, see history.store
+LOCK_FILE = HISTORY_FILE + ".lock"
+# Revision and chat versions of the history, small enough to check on every run
+MANIFEST_FILE = os.path.join(DATA_DIR, "history.manifest.json")
+# The history in the binary format (see history.binary), used instead of HISTORY_FILE when it exists
+BINARY_HISTORY_FILE = os.path.join(DATA_DIR, "history.pack")
+HISTORY_FORMATS = ("json", "binary")
+
+
+def history_format():
+    """ Format of the current history file: "binary" if there is a history.pack, else "json" """
+    return "binary" if os.path.exists(BINARY_HISTORY_FILE) else "json"
+
+
+def history_file(file_format=None):
+    """ Path of the history file in a format (default: the current one) """
+    return BINARY_HISTORY_FILE if (file_format or history_format()) == "binary" else HISTORY_FILE
+
 
 def ensure_data_directory():
     """Ensure the data directory and history file exist"""
-    os.makedirs("data", exist_ok=True)
-    if not os.path.exists("data/history.json"):
-        with open("data/history.json", "w") as f:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if os.path.exists(BINARY_HISTORY_FILE):
+        return
+    try:
+        # Exclusive creation, so a history written meanwhile by another process is kept
+        with open(HISTORY_FILE, "x") as f:
             json.dump({"chats": {}, "chat_counter": 0}, f, indent=2)
+    except FileExistsError:
+        pass
 
 
-@st.cache_data(ttl=60)
-def load_history():
-    """ Load chat history from JSON file and cache it for 1 minute """
+def read_history():
+    """ Read chat history from the JSON file, without caching """
     ensure_data_directory()
-    if os.path.exists("data/history.json"):
-        with open("data/history.json", "r") as f:
+    if history_format() == "binary":
+        try:
+            with binary.BinaryHistory(BINARY_HISTORY_FILE) as history:
+                return history.read_history()
+        except FileNotFoundError:
+            # Converted back to JSON meanwhile
+            pass
+    if os.path.exists(HISTORY_FILE):
+        with open(HISTORY_FILE, "r") as f:
             return json.load(f)
     else:
         return {}
 
 
-def save_history(history):
-    """ Save chat history to JSON file and clear the cache """
+@st.cache_data(ttl=60)
+def load_history():
+    """ Load chat history from JSON file and cache it for 1 minute """
+    return read_history()
+
+
+def _write_history(f, history, raw_messages):
+    """
+    Write the history as compact JSON, each chat's messages last, and
+    return the byte span of every chat's messages array.
+    """
+    spans = {}
+    head = json.dumps({key: value for key, value in history.items() if key != "chats"})[:-1]
+    f.write((head + (", " if len(head) > 1 else "") + '"chats": {').encode())
+    for index, (chat_id, chat) in enumerate(history.get("chats", {}).items()):
+        fields = json.dumps({key: value for key, value in chat.items() if key != "messages"}, default=to_json)[:-1]
+        f.write((
+            (", " if index else "") + json.dumps(chat_id) + ": " + fields + (", " if len(fields) > 1 else "") + '"messages": '
+        ).encode())
+        start = f.tell()
+        if chat_id in raw_messages:
+            f.write(raw_messages[chat_id])
+        else:
+            # ASCII only (json.dumps escapes the rest), so characters and bytes line up
+            f.write(json.dumps(chat.get("messages", []), default=to_json).encode())
+        spans[chat_id] = [start, f.tell()]
+        f.write(b"}")
+    f.write(b"}}")
+    return spans
+
+
+def save_history(history, raw_messages=None, file_format=None):
+    """
+    Save chat history to the history file and clear the cache
+
+    Args:
+        history: {"rev", "chat_counter", "chats"}, "rev" first so read_history_rev() finds it
+        raw_messages: Chat ID to the bytes of its messages span in the current file (a dict or a SpanReader), for chats whose messages are not in memory
+        file_format: "json" or "binary" (default: the current format)
+
+    Returns:
+        Dict[str, List[int]]: Byte span of each chat's messages in the file
+    """
     ensure_data_directory()
-    with open("data/history.json", "w") as f:
-        json.dump(history, f, indent=2)
+    path = history_file(file_format)
+    # Write a temporary file and rename it, so readers never see a partial file
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_file, "wb") as f:
+        if path == BINARY_HISTORY_FILE:
+            spans = binary.write_history(f, history, raw_messages or {})
+        else:
+            spans = _write_history(f, history, raw_messages or {})
+    os.replace(tmp_file, path)
     load_history.clear()
+    return spans
+
+
+def read_history_rev(f):
+    """ Read the revision at the start of an open history file (JSON or binary), None if it has none """
+    f.seek(0)
+    head = f.read(32)
+    if binary.is_binary(head):
+        return binary.read_rev(head)
+    match = re.match(rb'\{"rev": (\d+)', head)
+    return int(match.group(1)) if match else None
+
+
+def decode_messages(raw):
+    """ Decode the messages span read by read_spans() """
+    # A JSON span is an array; a binary one is a sequence of length-prefixed records
+    if raw[:1] == b"[":
+        return json.loads(raw)
+    return binary.decode_messages(raw)
+
+
+class SpanReader:
+    """
+    The messages spans of chats in one revision of the history file, read
+    one at a time when the history is written, so saving never holds the
+    messages of every evicted chat at once. The open file stays that
+    revision even if the history is replaced meanwhile.
+    """
+
+    def __init__(self, f, spans):
+        self._file = f
+        self._spans = spans
+
+    def __contains__(self, chat_id):
+        return chat_id in self._spans
+
+    def __getitem__(self, chat_id):
+        start, end = self._spans[chat_id]
+        self._file.seek(start)
+        return self._file.read(end - start)
+
+    def close(self):
+        self._file.close()
+
+
+def open_spans(spans, rev):
+    """ Open the history file for reading spans with a SpanReader, None if the file has another revision """
+    try:
+        f = open(history_file(), "rb")
+    except OSError:
+        return None
+    if read_history_rev(f) != rev:
+        f.close()
+        return None
+    return SpanReader(f, spans)
+
+
+def read_spans(spans, rev):
+    """
+    Read the raw messages of chats from the history file, without parsing the rest.
+
+    Args:
+        spans: Chat ID to byte span, as returned by save_history()
+        rev: Revision the spans belong to
+
+    Returns:
+        Optional[Dict[str, bytes]]: Chat ID to its messages span, None if the file has another revision
+    """
+    try:
+        with open(history_file(), "rb") as f:
+            if read_history_rev(f) != rev:
+                return None
+            raw = {}
+            for chat_id, (start, end) in spans.items():
+                f.seek(start)
+                raw[chat_id] = f.read(end - start)
+            return raw
+    except OSError:
+        return None
+
+
+def read_manifest():
+    """ Read the history manifest, None if there is none yet """
+    try:
+        with open(MANIFEST_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_manifest(manifest):
+    """ Save the history manifest atomically """
+    tmp_file = f"{MANIFEST_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_file, MANIFEST_FILE)
 
 
-def save_chats(chats, chat_counter):
-    """ Save the current chats and chat counter to history """
-    history = {
-        "chats": chats,
-        "chat_counter": chat_counter
-    }
-    save_history(history)
+@traced("history.save_chats")
+def save_chats(chats, chat_counter, rev=None, raw_messages=None):
+    """ Save the current chats and chat counter to history, with the revision if given.
+    Returns the byte span of each chat's messages, see save_history() """
+    history = {"rev": rev} if rev is not None else {}
+    history["chat_counter"] = chat_counter
+    history["chats"] = chats
+    with phase("save"):
+        return save_history(history, raw_messages)
 
 
 def load_chats():
@@ -0,0 +1,146 @@
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import psutil
+
+
+# Bytes of chat messages kept in memory before the least recently used chats are evicted
+MEMORY_BUDGET_MB = float(os.environ.get("PROMPTLY_MEMORY_BUDGET_MB", "256") or 256)
+
+# Chats used more recently than this are never evicted, they may be in use by a script run
+MIN_IDLE_SECONDS = float(os.environ.get("PROMPTLY_MIN_IDLE_SECONDS", "120") or 120)
+
+
+def message_bytes(message: Dict[str, Any]) -> int:
+    """
+    Estimate the memory held by one message.
+
+    Counts the record and its values (one level of nesting, for "usage"),
+    not the keys, which are shared between messages.
+
+    Args:
+        message: A chat message, as a Message or its dict
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    size = sys.getsizeof(message)
+    for value in message.values():
+        size += sys.getsizeof(value)
+        if isinstance(value, dict):
+            size += sum(sys.getsizeof(item) for item in value.values())
+    return size
+
+
+class MemoryBudget:
+    """
+    Accounting of the chat messages held in memory, per chat.
+
+    Tracks the estimated size of each resident chat's messages and when
+    each chat was last used, and picks the chats to evict, least recently
+    used first, when the total goes over the budget.
+
+    The messages of a chat's other branches (edited prompts, regenerated
+    answers) count against the budget too, but are never evicted: they
+    are saved with the chat's fields, not in the message span that an
+    evicted chat is reloaded from, so they stay in memory (and, with the
+    binary format, are decoded at startup) as long as the chat is in the
+    history. They usually are a small share of a chat, and archiving the
+    chat releases them.
+    """
+
+    def __init__(self, budget_mb: float = MEMORY_BUDGET_MB, min_idle_seconds: float = MIN_IDLE_SECONDS):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.min_idle_seconds = min_idle_seconds
+        self._sizes: Dict[str, int] = {}
+        self._branch_sizes: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self.resident_bytes = 0
+        self.evictions = 0
+        self.reloads = 0
+
+    def set_budget(self, budget_mb: float) -> None:
+        """Change the budget, in megabytes of messages."""
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+
+    def track(self, chat_id: str, messages: List[Dict[str, Any]],
+              branches: Optional[Dict[Any, Dict[str, Any]]] = None) -> None:
+        """Account for a chat whose messages are (now) in memory, and for its other branches."""
+        self.resident_bytes -= self._sizes.get(chat_id, 0)
+        size = sum(message_bytes(message) for message in messages)
+        self._sizes[chat_id] = size
+        self.resident_bytes += size
+        self._last_used.setdefault(chat_id, time.monotonic())
+        self.track_branches(chat_id, branches)
+
+    def track_branches(self, chat_id: str, branches: Optional[Dict[Any, Dict[str, Any]]]) -> None:
+        """Account for the messages of a chat's other branches (Chat.branches), resident even when the chat is evicted."""
+        self.resident_bytes -= self._branch_sizes.pop(chat_id, 0)
+        size = sum(message_bytes(message) for branch in (branches or {}).values() for message in branch["messages"])
+        if size:
+            self._branch_sizes[chat_id] = size
+            self.resident_bytes += size
+
+    def add(self, chat_id: str, message: Dict[str, Any]) -> None:
+        """Account for a message added to a resident chat."""
+        size = message_bytes(message)
+        self._sizes[chat_id] = self._sizes.get(chat_id, 0) + size
+        self.resident_bytes += size
+
+    def release(self, chat_id: str) -> None:
+        """Stop accounting for a chat's messages (evicted); its other branches stay."""
+        self.resident_bytes -= self._sizes.pop(chat_id, 0)
+
+    def forget(self, chat_id: str) -> None:
+        """Drop a deleted or archived chat."""
+        self.release(chat_id)
+        self.resident_bytes -= self._branch_sizes.pop(chat_id, 0)
+        self._last_used.pop(chat_id, None)
+
+    def touch(self, chat_id: str) -> None:
+        """Mark a chat as just used."""
+        self._last_used[chat_id] = time.monotonic()
+
+    def over_budget(self) -> bool:
+        return self.resident_bytes > self.budget_bytes
+
+    def victims(self, evictable: Callable[[str], bool]) -> Iterator[str]:
+        """
+        Chats to evict, least recently used first, until the total is within the budget.
+
+        The caller evicts each chat (and calls release()) before taking the next one.
+
+        Args:
+            evictable: Whether a chat can be evicted now
+        """
+        idle_before = time.monotonic() - self.min_idle_seconds
+        candidates = sorted(
+            (last_used, chat_id) for chat_id, last_used in self._last_used.items()
+            if chat_id in self._sizes and last_used < idle_before
+        )
+        for _, chat_id in candidates:
+            if not self.over_budget():
+                return
+            if evictable(chat_id):
+                yield chat_id
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report the accounting and the process memory.
+
+        Returns:
+            Dict[str, Any]: Budget, resident message size (branches included) and chats, size of the
+            other branches, evictions, reloads and process RSS
+        """
+        megabyte = 1024 * 1024
+        return {
+            "budget_mb": round(self.budget_bytes / megabyte, 1),
+            "resident_mb": round(self.resident_bytes / megabyte, 2),
+            "resident_chats": len(self._sizes),
+            "branch_mb": round(sum(self._branch_sizes.values()) / megabyte, 2),
+            "evictions": self.evictions,
+            "reloads": self.reloads,
+            "rss_mb": round(psutil.Process().memory_info().rss / megabyte, 1),
+        }
@@ -0,0 +1,380 @@
+import sys
+import json
+import hashlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def intern_name(value: Any) -> Any:
+    """Intern a short, often repeated string (role, provider or model name), so all records share one copy."""
+    return sys.intern(value) if type(value) is str else value
+
+
+class _Record:
+    """
+    Base of the compact records: a fixed set of fields stored in __slots__,
+    with any other key kept in an optional "extra" dict.
+
+    Records can be read and written like the dicts they replace
+    (record["role"], record.get("usage"), "id" in record, ...), so code
+    written for the history's dicts works on them unchanged. A field that
+    was never set is missing, like an absent dict key; to_dict() and
+    from_dict() convert losslessly to and from the history.json format.
+    """
+
+    __slots__ = ("extra",)
+
+    # Fields stored in slots, in the order they are written
+    FIELDS: Tuple[str, ...] = ()
+    # Fields whose string values are interned
+    INTERNED: frozenset = frozenset()
+
+    def __getitem__(self, key: str) -> Any:
+        if key in self.FIELDS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self.extra is not None and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in self.FIELDS:
+            setattr(self, key, intern_name(value) if key in self.INTERNED else value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in self.FIELDS:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self.extra is not None and key in self.extra:
+            del self.extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key: object) -> bool:
+        if key in self.FIELDS:
+            return hasattr(self, key)
+        return self.extra is not None and key in self.extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            self[key] = default
+            return self[key]
+
+    def keys(self) -> List[str]:
+        keys = [field for field in self.FIELDS if hasattr(self, field)]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.keys())
+
+    def __len__(self) -> int:
+        return len(self.keys())
+
+    def values(self) -> List[Any]:
+        return [self[key] for key in self.keys()]
+
+    def items(self) -> List[Tuple[str, Any]]:
+        return [(key, self[key]) for key in self.keys()]
+
+    def copy(self):
+        """Shallow copy, like dict.copy()."""
+        return type(self)._from_items(self.items())
+
+    @classmethod
+    def _from_items(cls, items):
+        record = cls.__new__(cls)
+        record.extra = None
+        for key, value in items:
+            record[key] = value
+        return record
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]):
+        """Build a record from its history.json dict."""
+        return cls._from_items(data.items())
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert to the history.json dict."""
+        return dict(self.items())
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (_Record, dict)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickling (st.cache_data hashing, copies of session state) goes through the items
+        return type(self)._from_items, (self.items(),)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self.items())!r})"
+
+
+class Message(_Record):
+    """
+    One chat message: role, content, id and, for answers, the usage record.
+
+    About half the size of the equivalent dict, and the role is shared
+    between all messages instead of being a string per message.
+    """
+
+    __slots__ = ("role", "content", "id", "usage")
+
+    FIELDS = ("role", "content", "id", "usage")
+    INTERNED = frozenset({"role"})
+
+    def __init__(self, role: str, content: str, id: Any = None, usage: Optional[Dict[str, Any]] = None):
+        self.extra = None
+        self.role = intern_name(role)
+        self.content = content
+        if id is not None:
+            self.id = id
+        if usage is not None:
+            self.usage = usage
+
+
+class Chat(_Record):
+    """
+    One chat: its settings, title and messages, as Message records.
+
+    Message ids are integers from a per-chat counter, next_message_id,
+    saved with the chat. Chats saved by older versions have no counter;
+    number_messages() gives their messages integer ids once.
+
+    A chat can have branches: editing a prompt or regenerating an answer
+    keeps the previous version as an alternative. The messages form a tree,
+    stored without repeating any message: "messages" is the active branch,
+    from the first message to the last, and "branches" holds every other
+    branch as the part it does not share with the others, keyed by its
+    last message id: {"fork": id of the message it continues (None at the
+    start), "messages": [...]}. A branch shares its prefix by referencing
+    the same Message records, so memory and history.json grow with the
+    divergent parts only.
+
+    "updated_at" is the time of the chat's last saved change, which
+    decides when it moves to the archive (see history.archive).
+    """
+
+    __slots__ = (
+        "chat_started", "messages", "selected_provider", "selected_model", "title", "version", "next_message_id",
+        "branches", "updated_at"
+    )
+
+    FIELDS = (
+        "chat_started", "messages", "selected_provider", "selected_model", "title", "version", "next_message_id",
+        "branches", "updated_at"
+    )
+    INTERNED = frozenset({"selected_provider", "selected_model"})
+
+    def __init__(self, title: str = "New Chat", chat_started: bool = False,
+                 selected_provider: Optional[str] = None, selected_model: Optional[str] = None):
+        self.extra = None
+        self.chat_started = chat_started
+        self.messages: List[Message] = []
+        self.selected_provider = intern_name(selected_provider)
+        self.selected_model = intern_name(selected_model)
+        self.title = title
+        self.next_message_id = 0
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Chat":
+        """Build a chat and its Message records from its history.json dict."""
+        chat = cls._from_items(data.items())
+        chat.messages = messages_from_dicts(data.get("messages", []))
+        if "branches" in data:
+            chat.branches = {
+                key: {"fork": branch["fork"], "messages": messages_from_dicts(branch["messages"])}
+                for key, branch in data["branches"].items()
+            }
+        return chat
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convert the chat and its messages to the history.json dict."""
+        data = dict(self.items())
+        data["messages"] = [message.to_dict() for message in self.messages]
+        if "branches" in data:
+            data["branches"] = {
+                key: {"fork": branch["fork"], "messages": [message.to_dict() for message in branch["messages"]]}
+                for key, branch in self.branches.items()
+            }
+        return data
+
+    @property
+    def numbered(self) -> bool:
+        """Whether the chat's messages have integer ids from its counter."""
+        return hasattr(self, "next_message_id")
+
+    def number_messages(self) -> bool:
+        """
+        Give the messages of a chat saved by an older version (time stamp,
+        content hash or no ids) their position as id, and start the counter
+        after them. Does nothing for a chat already numbered.
+
+        Returns:
+            bool: Whether the chat changed
+        """
+        if self.numbered:
+            return False
+        for position, message in enumerate(self.messages):
+            message.id = position
+        self.next_message_id = len(self.messages)
+        return True
+
+    def allocate_message_id(self) -> int:
+        """Take the next message id of the chat."""
+        self.number_messages()
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        return message_id
+
+    def new_message(self, role: str, content: str, usage: Optional[Dict[str, Any]] = None) -> Message:
+        """
+        Create a message with the chat's next id (not added to the chat).
+
+        Args:
+            role: "user", "assistant" or "system"
+            content: Message text
+            usage: Usage record of an answer
+
+        Returns:
+            Message: The new message
+        """
+        return Message(role, content, self.allocate_message_id(), usage)
+
+    def _tree(self) -> Tuple[Dict[Any, Message], Dict[Any, Any], Dict[Any, List[Any]]]:
+        """Every message of every branch by id, the id of each one's parent and of each one's children."""
+        records, parents, children = {}, {}, {}
+        chains = [(None, self.messages)]
+        chains.extend((branch["fork"], branch["messages"]) for branch in self.get("branches", {}).values())
+        for parent, messages in chains:
+            for message in messages:
+                records[message.id] = message
+                parents[message.id] = parent
+                children.setdefault(parent, []).append(message.id)
+                parent = message.id
+        return records, parents, children
+
+    def _activate(self, path: List[Message], records: Dict[Any, Message], parents: Dict[Any, Any],
+                  children: Dict[Any, List[Any]]) -> None:
+        """Make a path from the first message the active branch and store every other message in branches."""
+        assigned = {message.id for message in path}
+        branches = {}
+        # Most recent leaves first, so the newest branch keeps a shared part
+        for leaf in sorted((message_id for message_id in records if message_id not in children), reverse=True):
+            chain = []
+            node = leaf
+            while node is not None and node not in assigned:
+                chain.append(records[node])
+                assigned.add(node)
+                node = parents[node]
+            if chain:
+                chain.reverse()
+                branches[str(leaf)] = {"fork": node, "messages": chain}
+        self.messages = list(path)
+        if branches:
+            self.branches = branches
+        elif "branches" in self:
+            del self.branches
+
+    def alternatives(self) -> Dict[Any, List[Any]]:
+        """
+        Versions of the active branch's messages that have others (edited
+        prompts, regenerated answers).
+
+        Returns:
+            Dict[Any, List[Any]]: Message id to the ids of all its versions, oldest first
+        """
+        if not self.get("branches"):
+            return {}
+        _, parents, children = self._tree()
+        versions = {}
+        for message in self.messages:
+            siblings = children[parents[message.id]]
+            if len(siblings) > 1:
+                versions[message.id] = sorted(siblings)
+        return versions
+
+    def switch_to(self, message_id: Any) -> None:
+        """
+        Make the branch through a message active, continued to its most
+        recent last message.
+
+        Args:
+            message_id: A message of any branch
+        """
+        records, parents, children = self._tree()
+        if message_id not in records:
+            return
+        leaf = message_id
+        while leaf in children:
+            leaf = max(children[leaf])
+        path = []
+        while leaf is not None:
+            path.append(records[leaf])
+            leaf = parents[leaf]
+        path.reverse()
+        self._activate(path, records, parents, children)
+
+    def branch_before(self, message_id: Any) -> bool:
+        """
+        Start a new branch just before a message of the active branch: the
+        message and the ones after it become an alternative branch, and the
+        next message added is a new version of it.
+
+        Args:
+            message_id: A message of the active branch
+
+        Returns:
+            bool: Whether the message is in the active branch
+        """
+        for position, message in enumerate(self.messages):
+            if message.id == message_id:
+                self._activate(self.messages[:position], *self._tree())
+                return True
+        return False
+
+
+def messages_from_dicts(messages: List[Any]) -> List[Message]:
+    """Convert history.json message dicts to Message records (records are kept as they are)."""
+    return [message if isinstance(message, Message) else Message.from_dict(message) for message in messages]
+
+
+def content_digest(messages: List[Any]) -> str:
+    """
+    SHA-256 of a conversation's roles and texts, in order.
+
+    Ids, usage and branches are left out, so the same conversation
+    exported and imported again, or saved on two machines, has the same
+    digest.
+    """
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(json.dumps([message["role"], message["content"]], ensure_ascii=False).encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def to_json(record: Any) -> Dict[str, Any]:
+    """json.dump(s) default= hook writing records as their history.json dicts."""
+    if isinstance(record, _Record):
+        return record.to_dict()
+    raise TypeError(f"Object of type {type(record).__name__} is not JSON serializable")
@@ -0,0 +1,949 @@
+import os
+import logging
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from history.history import (
+    BINARY_HISTORY_FILE,
+    LOCK_FILE,
+    MANIFEST_FILE,
+    decode_messages,
+    history_file,
+    history_format,
+    load_history,
+    open_spans,
+    read_history,
+    read_manifest,
+    read_spans,
+    save_chats,
+    save_history,
+    save_manifest,
+)
+from history import archive, checkpoint
+from history.binary import BinaryHistory
+from history.filelock import file_lock
+from history.memory import MemoryBudget
+from history.models import Chat, Message, content_digest, messages_from_dicts
+
+
+logger = logging.getLogger(__name__)
+
+
+def merge_messages(theirs: List[Message], ours: List[Message]) -> List[Message]:
+    """
+    Merge two diverged message lists of one chat.
+
+    Args:
+        theirs: Messages saved by another process
+        ours: Messages of this process
+
+    Returns:
+        List[Message]: Their messages in order, then ours that they do not have (by id)
+    """
+    known = {message.get("id") for message in theirs}
+    return theirs + [message for message in ours if message.get("id") not in known]
+
+
+def _find_message(chat: Chat, message_id: Any) -> Optional[Message]:
+    """The message of a chat's active branch with an id, searched from the end."""
+    for message in reversed(chat.messages):
+        if message.get("id") == message_id:
+            return message
+    return None
+
+
+def _fold_message(chat: Chat, message_id: Any, content: str, incomplete: bool,
+                  usage: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Save an answer into a chat: into the message it continues, or as a new
+    last message if there is none. Returns the message's id.
+    """
+    message = _find_message(chat, message_id) if message_id is not None else None
+    if message is None:
+        message = chat.new_message("assistant", content)
+        chat.messages.append(message)
+    message.content = content
+    if usage:
+        message.usage = usage
+    if incomplete:
+        message["incomplete"] = True
+    elif "incomplete" in message:
+        del message["incomplete"]
+    return message.id
+
+
+def _stamp(path: str) -> Optional[Tuple[int, int]]:
+    """Modification time and size of a file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class EvictedMessages:
+    """
+    Stand-in for the messages of a chat evicted from memory.
+
+    Behaves like the message list: any use reloads the messages from the
+    history file through the repository and forwards to the reloaded list.
+    """
+
+    __slots__ = ("_load",)
+
+    def __init__(self, load: Callable[[], List[Message]]):
+        self._load = load
+
+    def __len__(self):
+        return len(self._load())
+
+    def __bool__(self):
+        return bool(self._load())
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __reversed__(self):
+        return reversed(self._load())
+
+    def __getitem__(self, index):
+        return self._load()[index]
+
+    def __contains__(self, item):
+        return item in self._load()
+
+    def __eq__(self, other):
+        return self._load() == other
+
+    def __getattr__(self, name):
+        # append, copy, index, ...
+        return getattr(self._load(), name)
+
+    def __repr__(self):
+        return "<evicted messages>"
+
+
+class ChatRepository:
+    """
+    Process-wide store of every chat, shared by all browser sessions.
+
+    The history is loaded once per server process instead of once per
+    session. Chats and messages are held as the compact Chat and Message
+    records of history.models. Sessions hold references to the shared
+    chat records (see snapshot()) and change them only through the repository, which applies
+    every change and the following save under one lock, so sessions no
+    longer overwrite each other's messages.
+
+    Several server processes can share the history file. Changes are made
+    optimistically in memory, then written under a file lock: if another
+    process wrote since this one last read the file (the revision in the
+    manifest moved), its changes are merged in first, message by message
+    for chats changed on both sides. Every chat carries a version number,
+    bumped on each change, which the manifest lists; other processes
+    check the manifest's modification time on every access and reread
+    the history only when a chat version changed.
+
+    Message bodies count against a memory budget (see enforce_budget()):
+    the least recently used chats are evicted and their messages replaced
+    by an EvictedMessages stand-in, which reads them back from their byte
+    span in the history file when they are next used. With the binary
+    history format (history.binary) every chat starts out that way, so
+    loading the history decodes the chats' fields only.
+
+    Chats not changed for archive.ARCHIVE_AFTER_DAYS move out of the history
+    file to the compressed archive (see archive_idle()), and come back
+    when they are selected (see restore_chat()).
+
+    An answer being generated is checkpointed to its own small file (see
+    start_partial()), not to the history, and saved to the history once
+    when it ends or is interrupted, or by recover_partials() after a crash.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._chats: Optional[Dict[str, Chat]] = None
+        self._chat_counter = 0
+        # Revision of the history file this process last read or wrote
+        self._rev = 0
+        # Version of each chat in that revision
+        self._synced_versions: Dict[str, int] = {}
+        self._manifest_stamp: Optional[Tuple[int, int]] = None
+        # Byte span of each chat's messages in the history file, valid while the file has revision _rev
+        self._spans: Dict[str, List[int]] = {}
+        self.memory = MemoryBudget()
+        # Monotonic time of the last archive pass of this process
+        self._archived_at: Optional[float] = None
+        # Checkpoint name to the chat and continued message of each answer this process is generating
+        self._partials: Dict[str, Dict[str, Any]] = {}
+
+    def _load(self) -> Dict[str, Chat]:
+        """Load the history on first use. Caller holds the lock."""
+        if self._chats is None:
+            self._manifest_stamp = _stamp(MANIFEST_FILE)
+            if history_format() != "binary" or not self._load_binary():
+                history = read_history()
+                self._chats = {chat_id: Chat.from_dict(chat) for chat_id, chat in history.get("chats", {}).items()}
+                self._chat_counter = history.get("chat_counter", 0)
+                self._rev = history.get("rev", 0)
+                self._synced_versions = {chat_id: chat.get("version", 0) for chat_id, chat in self._chats.items()}
+                self._adopt_spans(read_manifest())
+                for chat_id, chat_data in self._chats.items():
+                    self._track(chat_id)
+
+            # Histories saved by older versions have time stamp or content hash ids
+            if not all(chat.numbered for chat in self._chats.values()):
+                threading.Thread(target=self.migrate_message_ids, name="message-id-migration", daemon=True).start()
+        return self._chats
+
+    def _load_binary(self) -> bool:
+        """
+        Load a binary history without its messages: each chat's messages
+        start evicted and are decoded from their span when the chat is
+        first used. Caller holds the lock.
+
+        Returns:
+            bool: Whether the binary history was loaded (False if it was converted back to JSON meanwhile)
+        """
+        try:
+            with BinaryHistory(BINARY_HISTORY_FILE) as history:
+                chats = {chat_id: Chat.from_dict(history.read_fields(chat_id)) for chat_id in history.chat_ids()}
+                self._chat_counter = history.chat_counter
+                self._rev = history.rev
+                self._spans = history.spans()
+        except FileNotFoundError:
+            return False
+        self._chats = chats
+        self._synced_versions = {chat_id: chat.get("version", 0) for chat_id, chat in chats.items()}
+        for chat_id, chat in chats.items():
+            chat.messages = EvictedMessages(lambda chat_id=chat_id: self._load_messages(chat_id))
+            # Decoded with the fields
+            self.memory.track_branches(chat_id, chat.get("branches"))
+        return True
+
+    def _adopt_spans(self, manifest: Optional[Dict[str, Any]]) -> None:
+        """Use the message spans listed in the manifest if it describes the revision held. Caller holds the lock."""
+        if manifest is not None and manifest.get("rev", 0) == self._rev:
+            self._spans = manifest.get("spans", {})
+        else:
+            self._spans = {}
+        if self._chats and any(chat_id not in self._spans for chat_id in self._evicted()):
+            # Written without spans (older version): reload the evicted chats from the file
+            self._merge(read_history())
+
+    def _refresh(self) -> Dict[str, Chat]:
+        """Pick up changes saved by other processes. Caller holds the lock."""
+        chats = self._load()
+        stamp = _stamp(MANIFEST_FILE)
+        if stamp == self._manifest_stamp:
+            return chats
+        self._manifest_stamp = stamp
+        manifest = read_manifest()
+        if manifest is None or manifest.get("rev", 0) == self._rev:
+            return chats
+        if manifest.get("chats") == self._synced_versions:
+            # Nothing this process holds has changed
+            self._rev = manifest["rev"]
+            self._chat_counter = max(self._chat_counter, manifest.get("chat_counter", 0))
+            self._adopt_spans(manifest)
+            return chats
+        self._merge(read_history())
+        load_history.clear()
+        return chats
+
+    def _merge(self, history: Dict[str, Any], changed: Iterable[str] = (), deleted: Iterable[str] = ()) -> None:
+        """
+        Apply a history saved by another process. Caller holds the lock.
+
+        Args:
+            history: The history file's content
+            changed: Chats changed here and not yet saved, merged instead of replaced
+            deleted: Chats deleted here and not yet saved
+        """
+        disk_chats = history.get("chats", {})
+        self._chat_counter = max(self._chat_counter, history.get("chat_counter", 0))
+        self._rev = history.get("rev", 0)
+        # The spans describe the previous file: take evicted messages from the parsed one instead
+        self._spans = {}
+        for chat_id, chat in self._chats.items():
+            if isinstance(chat.messages, EvictedMessages) and chat_id in disk_chats:
+                chat.messages = messages_from_dicts(disk_chats[chat_id].get("messages", []))
+                self._track(chat_id)
+
+        for chat_id, disk_chat in disk_chats.items():
+            disk_version = disk_chat.get("version", 0)
+            if chat_id in deleted or disk_version == self._synced_versions.get(chat_id):
+                continue
+            local_chat = self._chats.get(chat_id)
+            if chat_id in changed and local_chat is not None:
+                logger.info("Merging changes saved by another process into chat %s", chat_id)
+                local_chat.messages = merge_messages(messages_from_dicts(disk_chat.get("messages", [])), local_chat.messages)
+                local_chat.version = disk_version
+                if "next_message_id" in disk_chat:
+                    local_chat.next_message_id = max(local_chat.get("next_message_id", 0), disk_chat["next_message_id"])
+            elif local_chat is not None:
+                # Update the record in place, sessions hold references to it
+                disk_record = Chat.from_dict(disk_chat)
+                for key in local_chat.keys():
+                    if key not in disk_record:
+                        del local_chat[key]
+                for key, value in disk_record.items():
+                    local_chat[key] = value
+            else:
+                self._chats[chat_id] = Chat.from_dict(disk_chat)
+            self._synced_versions[chat_id] = disk_version
+            self._track(chat_id)
+
+        # Chats deleted by another process
+        for chat_id in list(self._chats):
+            if chat_id not in disk_chats and chat_id in self._synced_versions and chat_id not in changed:
+                del self._chats[chat_id]
+                del self._synced_versions[chat_id]
+                self.memory.forget(chat_id)
+
+    def _sync_locked(self, changed: Iterable[str] = (), deleted: Iterable[str] = ()) -> None:
+        """Merge what other processes saved since the last sync. Caller holds both locks."""
+        manifest = read_manifest()
+        if manifest is not None and manifest.get("rev", 0) != self._rev:
+            self._merge(read_history(), changed, deleted)
+
+    def _write_locked(self, changed: Iterable[str] = ()) -> None:
+        """Save every chat as a new revision. Caller holds both locks."""
+        now = time.time()
+        for chat_id in changed:
+            chat = self._chats.get(chat_id)
+            if chat is not None:
+                chat["version"] = chat.get("version", 0) + 1
+                chat["updated_at"] = now
+        # Messages of evicted chats are copied from the current file without parsing them, one chat at a time
+        evicted = {chat_id: self._spans[chat_id] for chat_id in self._evicted()}
+        raw_messages = open_spans(evicted, self._rev) if evicted else None
+        if evicted and raw_messages is None:
+            # The file changed under the spans: take every chat from it
+            self._merge(read_history(), changed)
+        self._rev += 1
+        try:
+            self._spans = save_chats(self._chats, self._chat_counter, rev=self._rev, raw_messages=raw_messages)
+        finally:
+            if raw_messages is not None:
+                raw_messages.close()
+        versions = {chat_id: chat.get("version", 0) for chat_id, chat in self._chats.items()}
+        save_manifest({"rev": self._rev, "chat_counter": self._chat_counter, "chats": versions, "spans": self._spans})
+        self._synced_versions = versions
+        self._manifest_stamp = _stamp(MANIFEST_FILE)
+
+    def _evicted(self) -> List[str]:
+        """IDs of the chats whose messages are not in memory. Caller holds the lock."""
+        return [chat_id for chat_id, chat in self._chats.items() if isinstance(chat.messages, EvictedMessages)]
+
+    def _load_messages(self, chat_id: str) -> List[Message]:
+        """
+        Bring the messages of an evicted chat back into memory.
+
+        Args:
+            chat_id: The chat whose messages are used
+
+        Returns:
+            List[Message]: The chat's messages, empty if the chat was deleted meanwhile
+        """
+        with self._lock:
+            chat = self._load().get(chat_id)
+            if chat is None:
+                return []
+            if isinstance(chat.messages, EvictedMessages):
+                raw = read_spans({chat_id: self._spans[chat_id]}, self._rev) if chat_id in self._spans else None
+                if raw is not None:
+                    chat.messages = messages_from_dicts(decode_messages(raw[chat_id]))
+                    self._track(chat_id)
+                else:
+                    # Another process rewrote the file: sync with it, which reloads every evicted chat
+                    self._merge(read_history())
+                    load_history.clear()
+                    chat = self._chats.get(chat_id)
+                    if chat is None:
+                        return []
+                self.memory.reloads += 1
+                logger.debug("Reloaded the messages of chat %s", chat_id)
+            self.memory.touch(chat_id)
+            return chat.messages
+
+    def _track(self, chat_id: str) -> None:
+        """Account for a resident chat's messages and its other branches in the memory budget. Caller holds the lock."""
+        chat = self._chats[chat_id]
+        self.memory.track(chat_id, chat.messages, chat.get("branches"))
+
+    def _evict(self, chat_id: str) -> None:
+        """Drop a chat's messages from memory. Caller holds the lock."""
+        self._chats[chat_id].messages = EvictedMessages(lambda: self._load_messages(chat_id))
+        self.memory.release(chat_id)
+        self.memory.evictions += 1
+
+    def _commit(self, changed: Iterable[str] = (), deleted: Iterable[str] = ()) -> None:
+        """Save changes made in memory, merging concurrent ones. Caller holds the lock."""
+        changed, deleted = set(changed), set(deleted)
+        with file_lock(LOCK_FILE):
+            self._sync_locked(changed, deleted)
+            self._write_locked(changed)
+
+    @property
+    def chat_counter(self) -> int:
+        """Number of chats ever created, used to name new chats."""
+        with self._lock:
+            self._load()
+            return self._chat_counter
+
+    @property
+    def rev(self) -> int:
+        """Revision of the history file last read or written by this process."""
+        with self._lock:
+            self._load()
+            return self._rev
+
+    def touch(self, chat_id: str) -> None:
+        """Mark a chat as in use, so it is the last to be evicted."""
+        with self._lock:
+            self.memory.touch(chat_id)
+
+    def enforce_budget(self) -> int:
+        """
+        Evict the messages of least recently used chats until the resident
+        messages fit the memory budget.
+
+        Chats used within the last MIN_IDLE_SECONDS are kept.
+
+        Returns:
+            int: Number of chats evicted
+        """
+        with self._lock:
+            self._refresh()
+            if not self.memory.over_budget():
+                return 0
+            if not self._spans:
+                # Write the file once to learn where every chat's messages are
+                self._commit()
+            evicted = 0
+            for chat_id in self.memory.victims(lambda chat_id: chat_id in self._spans):
+                self._evict(chat_id)
+                evicted += 1
+            if evicted:
+                logger.info("Evicted the messages of %d chats to stay within the memory budget", evicted)
+            return evicted
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """
+        Report memory use for diagnostics.
+
+        Returns:
+            Dict[str, Any]: Budget, resident message size, resident and evicted chats, evictions, reloads and process RSS
+        """
+        with self._lock:
+            self._load()
+            stats = self.memory.stats()
+            stats["evicted_chats"] = len(self._evicted())
+            return stats
+
+    def snapshot(self) -> Dict[str, Chat]:
+        """
+        Get the current chats for one script run.
+
+        The dict is a new one, so it can be iterated while other sessions
+        add or delete chats, but the chat records in it are the shared ones:
+        it costs one reference per chat, not a copy of the messages.
+
+        Returns:
+            Dict[str, Chat]: Chat ID to chat record
+        """
+        with self._lock:
+            return dict(self._refresh())
+
+    def get(self, chat_id: str) -> Optional[Chat]:
+        """Get the shared record of a chat, None if it does not exist."""
+        with self._lock:
+            return self._refresh().get(chat_id)
+
+    def create_chat(self) -> str:
+        """
+        Create a new, not yet started chat.
+
+        Returns:
+            str: The ID of the new chat, unique across sessions and processes
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            chats = self._load()
+            # Take the chat counter of every process into account
+            self._sync_locked()
+            chat_id = f"chat_{self._chat_counter}"
+            chats[chat_id] = Chat()
+            self._track(chat_id)
+            self._chat_counter += 1
+            self._write_locked([chat_id])
+            return chat_id
+
+    def delete_chat(self, chat_id: str) -> bool:
+        """
+        Delete a chat.
+
+        Returns:
+            bool: Whether the chat existed
+        """
+        with self._lock:
+            if self._load().pop(chat_id, None) is None:
+                return False
+            self.memory.forget(chat_id)
+            self._commit(deleted=[chat_id])
+            return True
+
+    def start_chat(self, chat_id: str, provider: str, model: str) -> None:
+        """
+        Start a chat with a provider and model.
+
+        Args:
+            chat_id: The chat to start
+            provider: The selected provider
+            model: The selected model
+        """
+        with self._lock:
+            chat = self._load().get(chat_id)
+            if chat is None:
+                return
+            chat["chat_started"] = True
+            chat["selected_provider"] = provider
+            chat["selected_model"] = model
+            chat.messages = []
+            chat["title"] = f"{provider} - {model}"
+            self._track(chat_id)
+            self._commit(changed=[chat_id])
+
+    def append_message(self, chat_id: str, message: Union[Message, Dict[str, Any]]) -> bool:
+        """
+        Add a message at the end of a chat and save it.
+
+        The message gets the chat's next id. Ids are taken under the file
+        lock, after merging what other processes saved, so they are unique
+        across processes.
+
+        Args:
+            chat_id: The chat to add to
+            message: The message, with role and content, as a Message or its dict
+
+        Returns:
+            bool: Whether the chat still exists (another session may have deleted it)
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            self._sync_locked()
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                logger.warning("Dropping a message for deleted chat %s", chat_id)
+                return False
+            if not isinstance(message, Message):
+                message = Message.from_dict(message)
+            message.id = chat.allocate_message_id()
+            chat.messages.append(message)
+            self.memory.add(chat_id, message)
+            self.memory.touch(chat_id)
+            self._write_locked([chat_id])
+            return True
+
+    def _change_chat(self, chat_id: str, change: Callable[[Chat], Any]) -> Any:
+        """
+        Apply a change to a chat under the file lock, after merging what
+        other processes saved, and save it.
+
+        Args:
+            chat_id: The chat to change
+            change: Called with the chat record; nothing is saved when it returns False
+
+        Returns:
+            The change's result, False if the chat does not exist
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            self._sync_locked()
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                return False
+            result = change(chat)
+            if result is not False:
+                self._track(chat_id)
+                self.memory.touch(chat_id)
+                self._write_locked([chat_id])
+            return result
+
+    def start_partial(self, chat_id: str, message_id: Any = None) -> str:
+        """
+        Start checkpointing an answer being generated (see history.checkpoint).
+
+        Args:
+            chat_id: The chat being answered
+            message_id: The interrupted answer being continued, None for a new answer
+
+        Returns:
+            str: Name of the answer's checkpoint, for the other *_partial() calls and complete_message()
+        """
+        name = checkpoint.new_name(chat_id)
+        with self._lock:
+            self._partials[name] = {"chat_id": chat_id, "message_id": message_id}
+        return name
+
+    def save_partial(self, name: str, content: str) -> None:
+        """
+        Save the answer so far to its checkpoint file. Only that small file
+        is written, so this can run every few seconds during an answer
+        whatever the size of the history.
+
+        Args:
+            name: Name from start_partial()
+            content: The whole answer so far
+        """
+        with self._lock:
+            record = dict(self._partials[name], content=content)
+        checkpoint.write_checkpoint(name, record)
+
+    def discard_partial(self, name: str) -> None:
+        """Stop checkpointing an answer without saving it."""
+        checkpoint.remove_checkpoint(name)
+        with self._lock:
+            self._partials.pop(name, None)
+
+    def keep_partial(self, name: str, content: str) -> Any:
+        """
+        Save an interrupted answer to the history, marked incomplete, and
+        remove its checkpoint.
+
+        Args:
+            name: Name from start_partial()
+            content: The whole answer so far
+
+        Returns:
+            The message's id, None if the chat no longer exists
+        """
+        return self._fold_partial(name, content, incomplete=True)
+
+    def complete_message(self, name: str, content: str, usage: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Save the final version of an answer to the history and remove its
+        checkpoint. A continued answer replaces the interrupted message, or
+        is added if that message is gone.
+
+        Args:
+            name: Name from start_partial()
+            content: The whole answer
+            usage: Usage record of the answer
+
+        Returns:
+            bool: Whether the chat still exists
+        """
+        return self._fold_partial(name, content, usage=usage) is not None
+
+    def _fold_partial(self, name: str, content: str, incomplete: bool = False,
+                      usage: Optional[Dict[str, Any]] = None) -> Any:
+        """Save an answer of start_partial() to the history and remove its checkpoint. Returns its id."""
+        with self._lock:
+            partial = self._partials[name]
+            with file_lock(LOCK_FILE):
+                self._load()
+                self._sync_locked()
+                chat = self._chats.get(partial["chat_id"])
+                message_id = None
+                if chat is not None:
+                    message_id = _fold_message(chat, partial["message_id"], content, incomplete, usage)
+                    self._track(partial["chat_id"])
+                    self.memory.touch(partial["chat_id"])
+                    self._write_locked([partial["chat_id"]])
+                else:
+                    logger.warning("Dropping an answer for deleted chat %s", partial["chat_id"])
+            checkpoint.remove_checkpoint(name)
+            del self._partials[name]
+            return message_id
+
+    def recover_partials(self) -> int:
+        """
+        Save to the history, marked incomplete, the answers whose process
+        stopped without saving them (a crash or a restart), from their
+        checkpoints.
+
+        Returns:
+            int: Number of answers recovered
+        """
+        with self._lock:
+            orphans = checkpoint.orphaned(self._partials)
+            if not orphans:
+                return 0
+            with file_lock(LOCK_FILE):
+                self._load()
+                self._sync_locked()
+                changed = set()
+                for name in orphans:
+                    # Another process may have recovered it meanwhile
+                    record = checkpoint.read_checkpoint(name)
+                    chat = self._chats.get(record["chat_id"]) if record else None
+                    if chat is not None:
+                        _fold_message(chat, record.get("message_id"), record["content"], True)
+                        self._track(record["chat_id"])
+                        changed.add(record["chat_id"])
+                if changed:
+                    self._write_locked(changed)
+                    logger.info("Recovered %d interrupted answers from their checkpoints", len(changed))
+                for name in orphans:
+                    checkpoint.remove_checkpoint(name)
+                return len(changed)
+
+    def switch_branch(self, chat_id: str, message_id: Any) -> bool:
+        """
+        Make the branch through a message the chat's active branch.
+
+        Args:
+            chat_id: The chat
+            message_id: A message of the branch, see Chat.alternatives()
+
+        Returns:
+            bool: Whether the chat exists
+        """
+        return self._change_chat(chat_id, lambda chat: chat.switch_to(message_id)) is not False
+
+    def branch_before(self, chat_id: str, message_id: Any) -> bool:
+        """
+        Start a new branch before a message, keeping it and the messages
+        after it as an alternative branch (to edit a prompt or regenerate
+        an answer).
+
+        Args:
+            chat_id: The chat
+            message_id: A message of the active branch
+
+        Returns:
+            bool: Whether the message was found
+        """
+        return self._change_chat(chat_id, lambda chat: chat.branch_before(message_id)) is True
+
+    def migrate_message_ids(self) -> int:
+        """
+        Give the messages of chats saved by older versions integer ids and
+        save them, once. Runs in the background after loading such a history.
+
+        Returns:
+            int: Number of chats migrated
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            # Another process may have migrated them already
+            self._sync_locked()
+            migrated = [chat_id for chat_id, chat in self._chats.items() if chat.number_messages()]
+            if migrated:
+                self._write_locked(migrated)
+                logger.info("Gave %d chats saved by an older version integer message ids", len(migrated))
+            return len(migrated)
+
+    def archive_idle(self, force: bool = False, now: Optional[float] = None) -> int:
+        """
+        Move the chats not changed for archive.ARCHIVE_AFTER_DAYS to the
+        compressed archive, then apply the archive's retention rules.
+
+        Runs at most once an hour per process unless forced. Chats saved by
+        older versions have no change time: the first pass stamps them with
+        the current one.
+
+        Args:
+            force: Run even if a pass ran within the hour
+            now: Current time, for tests
+
+        Returns:
+            int: Number of chats archived
+        """
+        with self._lock:
+            checked = time.monotonic()
+            if archive.ARCHIVE_AFTER_DAYS <= 0 or (
+                not force and self._archived_at is not None and checked - self._archived_at < 60 * 60
+            ):
+                return 0
+            self._archived_at = checked
+            now = time.time() if now is None else now
+            with file_lock(LOCK_FILE):
+                self._load()
+                self._sync_locked()
+                unstamped = [chat_id for chat_id, chat in self._chats.items() if "updated_at" not in chat]
+                cutoff = now - archive.ARCHIVE_AFTER_DAYS * archive.DAY
+                idle = [
+                    chat_id for chat_id, chat in self._chats.items()
+                    if chat.get("chat_started") and chat.get("updated_at", now) < cutoff
+                ]
+                if idle:
+                    # Segment first: a crash before the history is saved leaves the chat in both tiers, never in none
+                    archive.archive_chats({chat_id: self._chats[chat_id].to_dict() for chat_id in idle})
+                    for chat_id in idle:
+                        del self._chats[chat_id]
+                        self.memory.forget(chat_id)
+                    logger.info("Archived %d chats idle for %g days", len(idle), archive.ARCHIVE_AFTER_DAYS)
+                if idle or unstamped:
+                    self._write_locked(unstamped)
+                removed = archive.apply_retention(now)
+                if removed:
+                    logger.info("Applied the archive retention rule (%s) to %d chats", archive.RETENTION_ACTION, removed)
+                return len(idle)
+
+    def archived_chats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        List the archived chats, most recently changed first.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Chat ID to its title, updated_at, archived_at and number of messages
+        """
+        with self._lock:
+            chats = self._refresh()
+            index = archive.read_index()
+        return dict(sorted(
+            ((chat_id, entry) for chat_id, entry in index.items() if chat_id not in chats),
+            key=lambda item: item[1].get("updated_at") or 0, reverse=True,
+        ))
+
+    def restore_chat(self, chat_id: str) -> bool:
+        """
+        Bring an archived chat back into the history.
+
+        Args:
+            chat_id: An archived chat
+
+        Returns:
+            bool: Whether the chat is in the history now
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            self._sync_locked()
+            if chat_id not in self._chats:
+                data = archive.read_archived_chat(chat_id)
+                if data is None:
+                    return False
+                chat = Chat.from_dict(data)
+                chat.number_messages()
+                self._chats[chat_id] = chat
+                self._track(chat_id)
+                self.memory.touch(chat_id)
+                self._write_locked([chat_id])
+                logger.info("Restored chat %s from the archive", chat_id)
+            archive.forget_chats([chat_id])
+            return True
+
+    def storage_stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report the disk used by each storage tier, for diagnostics.
+
+        Returns:
+            Dict[str, Dict[str, Any]]: "hot" and "archive" tiers with their bytes, files and chats
+        """
+        with self._lock:
+            chats = self._refresh()
+            usage = archive.disk_usage()
+            usage["hot"]["chats"] = len(chats)
+            return usage
+
+    def import_chats(self, chats: List[Dict[str, Any]]) -> List[str]:
+        """
+        Add a batch of chats with one save, for imports.
+
+        Every chat gets a new ID. The imported messages are evicted from
+        memory once saved, so an import of any size holds one batch at a time.
+
+        Args:
+            chats: Chats as history.json dicts
+
+        Returns:
+            List[str]: IDs of the new chats
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            self._sync_locked()
+            chat_ids = []
+            for data in chats:
+                chat = Chat.from_dict(data)
+                chat.number_messages()
+                chat_id = f"chat_{self._chat_counter}"
+                self._chat_counter += 1
+                self._chats[chat_id] = chat
+                self._track(chat_id)
+                chat_ids.append(chat_id)
+            self._write_locked(chat_ids)
+            for chat_id in chat_ids:
+                self._evict(chat_id)
+            return chat_ids
+
+    def content_digests(self) -> Dict[str, str]:
+        """
+        Digest of every chat's conversation (see models.content_digest),
+        archived ones included, to skip duplicates on import. Evicted
+        messages are read from the file without being kept in memory.
+
+        Returns:
+            Dict[str, str]: Digest to the ID of a chat with that conversation
+        """
+        with self._lock:
+            chats = self._refresh()
+            digests = {}
+            for chat_id, entry in archive.read_index().items():
+                if "digest" in entry:
+                    digests[entry["digest"]] = chat_id
+            evicted = {chat_id: self._spans[chat_id] for chat_id in self._evicted() if chat_id in self._spans}
+            spans = open_spans(evicted, self._rev) if evicted else None
+            try:
+                for chat_id, chat in chats.items():
+                    if spans is not None and chat_id in spans:
+                        messages = decode_messages(spans[chat_id])
+                    else:
+                        messages = chat.messages
+                    digests[content_digest(messages)] = chat_id
+            finally:
+                if spans is not None:
+                    spans.close()
+            return digests
+
+    def convert_history(self, file_format: str) -> bool:
+        """
+        Rewrite the history file in another format ("json" or "binary",
+        see history.binary) and remove the file in the old one.
+
+        Other processes pick the new file up through the manifest, like any
+        other revision.
+
+        Args:
+            file_format: The format to convert to
+
+        Returns:
+            bool: Whether the history was converted (False if already in that format)
+        """
+        with self._lock, file_lock(LOCK_FILE):
+            self._load()
+            self._sync_locked()
+            old_format = history_format()
+            if file_format == old_format:
+                return False
+            # Spans cannot be copied between formats: write every chat from the parsed file
+            history = read_history()
+            self._merge(history)
+            self._rev += 1
+            self._spans = save_history(
+                {"rev": self._rev, "chat_counter": self._chat_counter, "chats": history.get("chats", {})},
+                file_format=file_format,
+            )
+            os.remove(history_file(old_format))
+            versions = {chat_id: chat.get("version", 0) for chat_id, chat in self._chats.items()}
+            save_manifest({"rev": self._rev, "chat_counter": self._chat_counter, "chats": versions, "spans": self._spans})
+            self._synced_versions = versions
+            self._manifest_stamp = _stamp(MANIFEST_FILE)
+            logger.info("Converted the history from %s to %s", old_format, file_format)
+            return True
+
+    def reload(self) -> None:
+        """Forget the loaded chats; the next access reads the history file again."""
+        with self._lock:
+            self._chats = None
+            self._chat_counter = 0
+            self._rev = 0
+            self._synced_versions = {}
+            self._manifest_stamp = None
+            self._spans = {}
+            self._archived_at = None
+            self.memory = MemoryBudget(self.memory.budget_bytes / (1024 * 1024), self.memory.min_idle_seconds)
+
+
+# Shared by every session of this server process
+chat_repository = ChatRepository()
@@ -0,0 +1,399 @@
+"""
+Streaming import and export of conversation archives.
+
+Imports read ChatGPT and Claude data exports (conversations.json) and
+Promptly histories (history.json or history.pack, from another machine or
+an export), optionally gzip-compressed. The file is parsed incrementally,
+one conversation at a time (JsonStream), so memory holds one conversation
+and one batch of chats whatever the size of the archive. Conversations
+already in the history, by content digest, are skipped.
+
+Exports write every chat, archived ones included, as a history.json
+(gzip-compressed for a .gz path) that the import reads back. They read
+the history file on disk, not the repository, one chat at a time.
+"""
+import io
+import os
+import json
+import gzip
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from history import archive, binary
+from history.history import history_file
+from history.models import content_digest
+
+
+CHUNK_SIZE = 1024 * 1024
+# Close to the smallest gzip size, several times faster than the default level 9
+GZIP_LEVEL = 6
+
+# Chats and megabytes of messages written per save of the history
+BATCH_CHATS = 500
+BATCH_MB = 64
+
+
+class JsonStream:
+    """
+    Incremental reader of one JSON document.
+
+    Walks the containers the caller asks for (iter_array(), iter_object())
+    and decodes the values inside them one at a time with raw_decode(), so
+    only the value being read is in memory.
+    """
+
+    _WHITESPACE = " \t\n\r"
+    # Characters that may follow the part of a number decoded so far
+    _NUMBER_CHARACTERS = ".eE+-0123456789"
+
+    def __init__(self, f, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            f: Text file to read
+            chunk_size: Characters read at a time
+        """
+        self._file = f
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        self._decoder = json.JSONDecoder()
+
+    def _fill(self, size: Optional[int] = None) -> bool:
+        """Read more of the file, dropping what was consumed. Returns False at the end of the file."""
+        if self._eof:
+            return False
+        data = self._file.read(size or self._chunk_size)
+        if not data:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + data
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next character after whitespace, "" at the end of the file."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in self._WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, characters: str) -> str:
+        """Consume the next character, which must be one of the given ones."""
+        character = self.peek()
+        if not character or character not in characters:
+            raise ValueError(f"Expected one of {characters!r}, found {character or 'the end of the file'!r}")
+        self._pos += 1
+        return character
+
+    def value(self) -> Any:
+        """Decode the next value."""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+                # A number cut by the end of the buffer ("12", "12.", "1e") may continue in the next chunk
+                cut = (
+                    isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and (end == len(self._buffer) or self._buffer[end] in self._NUMBER_CHARACTERS)
+                )
+                if not cut or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            # The value is larger than the buffer: read more, in growing chunks
+            if not self._fill(size):
+                continue
+            size *= 2
+
+    def iter_array(self) -> Iterator[Any]:
+        """Decode the items of the next array, one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                return
+
+    def iter_object(self) -> Iterator[str]:
+        """
+        Walk the next object: yields each key, after which the caller reads
+        its value (value(), iter_array(), iter_object()) before the next one.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            if self.expect(",}") == "}":
+                return
+
+
+def open_archive(path: str) -> Tuple[io.TextIOBase, Any]:
+    """
+    Open an archive for reading as text, gzip-compressed or not.
+
+    Returns:
+        Tuple: The text stream and the underlying file, whose position gives the progress
+    """
+    raw = open(path, "rb")
+    if raw.read(2) == b"\x1f\x8b":
+        raw.seek(0)
+        return io.TextIOWrapper(gzip.GzipFile(fileobj=raw), encoding="utf-8"), raw
+    raw.seek(0)
+    return io.TextIOWrapper(raw, encoding="utf-8"), raw
+
+
+def _text(parts: List[Any]) -> str:
+    return "\n".join(part for part in parts if isinstance(part, str) and part)
+
+
+def from_chatgpt(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert a ChatGPT export conversation: the branch ending at its current
+    node, user and assistant messages only.
+    """
+    mapping = conversation.get("mapping") or {}
+    node_id = conversation.get("current_node")
+    if node_id not in mapping:
+        # No current node: follow the last child from the root
+        node_id = next((key for key, node in mapping.items() if not node.get("parent")), None)
+        while node_id in mapping and mapping[node_id].get("children"):
+            node_id = mapping[node_id]["children"][-1]
+    path = []
+    while node_id in mapping:
+        path.append(mapping[node_id].get("message"))
+        node_id = mapping[node_id].get("parent")
+    messages, model = [], None
+    for message in reversed(path):
+        if not message:
+            continue
+        role = (message.get("author") or {}).get("role")
+        content = message.get("content") or {}
+        text = _text(content.get("parts") or []) or content.get("text") or ""
+        if role in ("user", "assistant") and text:
+            messages.append({"role": role, "content": text})
+            model = (message.get("metadata") or {}).get("model_slug") or model
+    return {
+        "title": conversation.get("title") or "ChatGPT conversation",
+        "selected_provider": "OpenAI",
+        "selected_model": conversation.get("default_model_slug") or model,
+        "messages": messages,
+    }
+
+
+def from_claude(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a Claude export conversation."""
+    messages = []
+    for message in conversation.get("chat_messages") or []:
+        role = {"human": "user", "assistant": "assistant"}.get(message.get("sender"))
+        text = message.get("text") or _text([
+            block.get("text") for block in message.get("content") or []
+            if isinstance(block, dict) and block.get("type") == "text"
+        ])
+        if role and text:
+            messages.append({"role": role, "content": text})
+    return {
+        "title": conversation.get("name") or "Claude conversation",
+        "selected_provider": "Anthropic",
+        "selected_model": conversation.get("model"),
+        "messages": messages,
+    }
+
+
+def _promptly_chat(chat: Dict[str, Any]) -> Dict[str, Any]:
+    """A chat of a Promptly history, without the fields that belong to the history it came from."""
+    return {key: value for key, value in chat.items() if key not in ("version", "updated_at")}
+
+
+def iter_conversations(path: str, on_read: Optional[Callable[[int], None]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Read the conversations of an archive one at a time, as history.json chat dicts.
+
+    Args:
+        path: ChatGPT or Claude export, or Promptly history (JSON, binary, gzip-compressed or not)
+        on_read: Called with the bytes of the file read so far after each conversation
+
+    Yields:
+        Dict[str, Any]: One chat
+    """
+    with open(path, "rb") as f:
+        head = f.read(len(binary.MAGIC))
+    if binary.is_binary(head):
+        with binary.BinaryHistory(path) as history:
+            for chat_id in history.chat_ids():
+                yield _promptly_chat(history.read_chat(chat_id))
+        return
+
+    text, raw = open_archive(path)
+    with raw, text:
+        stream = JsonStream(text)
+        if stream.peek() == "[":
+            # ChatGPT and Claude exports: an array of conversations
+            for conversation in stream.iter_array():
+                if "mapping" in conversation:
+                    yield from_chatgpt(conversation)
+                elif "chat_messages" in conversation:
+                    yield from_claude(conversation)
+                elif isinstance(conversation.get("messages"), list):
+                    yield _promptly_chat(conversation)
+                if on_read:
+                    on_read(raw.tell())
+        else:
+            # Promptly history: {"rev", "chat_counter", "chats": {chat_id: chat}}
+            for key in stream.iter_object():
+                if key != "chats":
+                    stream.value()
+                    continue
+                for _ in stream.iter_object():
+                    yield _promptly_chat(stream.value())
+                    if on_read:
+                        on_read(raw.tell())
+
+
+def import_archive(path: str, repository, provider: Optional[str] = None, model: Optional[str] = None,
+                   batch_chats: int = BATCH_CHATS, batch_mb: float = BATCH_MB,
+                   on_progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Import the conversations of an archive into the history, in batches.
+
+    Args:
+        path: The archive, see iter_conversations()
+        repository: The ChatRepository to add the chats to
+        provider: Provider of the imported chats when the archive does not say
+        model: Model of the imported chats when the archive does not say
+        batch_chats: Chats per save of the history
+        batch_mb: Megabytes of message text per save of the history
+        on_progress: Called with the stats after each batch
+
+    Returns:
+        Dict[str, Any]: bytes_read, total_bytes, imported, duplicates, empty, messages and seconds
+    """
+    start = time.perf_counter()
+    stats = {"bytes_read": 0, "total_bytes": os.path.getsize(path), "imported": 0, "duplicates": 0, "empty": 0,
+             "messages": 0, "seconds": 0.0}
+    known = repository.content_digests()
+    batch, batch_bytes = [], 0
+
+    def on_read(position: int) -> None:
+        stats["bytes_read"] = position
+
+    def flush() -> None:
+        nonlocal batch, batch_bytes
+        if batch:
+            repository.import_chats(batch)
+            stats["imported"] += len(batch)
+            stats["messages"] += sum(len(chat["messages"]) for chat in batch)
+            batch, batch_bytes = [], 0
+        stats["seconds"] = round(time.perf_counter() - start, 1)
+        if on_progress:
+            on_progress(stats)
+
+    for chat in iter_conversations(path, on_read):
+        messages = chat.get("messages") or []
+        if not messages:
+            stats["empty"] += 1
+            continue
+        digest = content_digest(messages)
+        if digest in known:
+            stats["duplicates"] += 1
+            continue
+        known[digest] = None
+        chat["chat_started"] = True
+        chat["selected_provider"] = chat.get("selected_provider") or provider
+        chat["selected_model"] = chat.get("selected_model") or model
+        batch.append(chat)
+        batch_bytes += sum(len(message["content"]) for message in messages)
+        if len(batch) >= batch_chats or batch_bytes >= batch_mb * 1024 * 1024:
+            flush()
+    if batch or not stats["imported"]:
+        stats["bytes_read"] = stats["total_bytes"]
+        flush()
+    return stats
+
+
+def export_history(path: str, include_archived: bool = True,
+                   on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                   progress_every: int = BATCH_CHATS) -> Dict[str, Any]:
+    """
+    Write every chat to a history.json file, one chat at a time.
+
+    Reads the history file on disk: the open file stays the same revision
+    even if the app saves meanwhile, so the export is consistent. Archived
+    chats follow the chats of the history.
+
+    Args:
+        path: Output file, gzip-compressed if it ends with .gz
+        include_archived: Also export the archived chats
+        on_progress: Called with the stats every progress_every chats and at the end
+        progress_every: Chats between progress reports
+
+    Returns:
+        Dict[str, Any]: chats, archived, messages, bytes and seconds
+    """
+    start = time.perf_counter()
+    stats = {"chats": 0, "archived": 0, "messages": 0, "bytes": 0, "seconds": 0.0}
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    chat_counter = 0
+    if path.endswith(".gz"):
+        out_file = gzip.open(tmp_file, "wt", encoding="utf-8", compresslevel=GZIP_LEVEL)
+    else:
+        out_file = open(tmp_file, "w", encoding="utf-8")
+    with out_file as out:
+        out.write('{"chats": {')
+
+        def write(chat_id: str, chat: Dict[str, Any], archived: bool = False) -> None:
+            out.write((", " if stats["chats"] else "") + json.dumps(chat_id) + ": " + json.dumps(chat))
+            stats["chats"] += 1
+            stats["archived"] += archived
+            stats["messages"] += len(chat.get("messages", []))
+            if on_progress and stats["chats"] % progress_every == 0:
+                stats["seconds"] = round(time.perf_counter() - start, 1)
+                on_progress(stats)
+
+        exported = set()
+        source = history_file()
+        if os.path.exists(source):
+            with open(source, "rb") as f:
+                is_binary = binary.is_binary(f.read(len(binary.MAGIC)))
+            if is_binary:
+                with binary.BinaryHistory(source) as history:
+                    chat_counter = history.chat_counter
+                    for chat_id in history.chat_ids():
+                        write(chat_id, history.read_chat(chat_id))
+                        exported.add(chat_id)
+            else:
+                with open(source, "r", encoding="utf-8") as f:
+                    stream = JsonStream(f)
+                    for key in stream.iter_object():
+                        if key == "chat_counter":
+                            chat_counter = stream.value()
+                        elif key == "chats":
+                            for chat_id in stream.iter_object():
+                                write(chat_id, stream.value())
+                                exported.add(chat_id)
+                        else:
+                            stream.value()
+        if include_archived:
+            for chat_id, chat in archive.iter_archived_chats():
+                # A chat being restored can be in both for a moment
+                if chat_id not in exported:
+                    write(chat_id, chat, archived=True)
+        out.write('}, "chat_counter": ' + json.dumps(chat_counter) + "}")
+    os.replace(tmp_file, path)
+    stats["bytes"] = os.path.getsize(path)
+    stats["seconds"] = round(time.perf_counter() - start, 1)
+    if on_progress:
+        on_progress(stats)
+    return stats
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import concurrent.futures
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+DISCOVERY_FILE = os.path.join(DATA_DIR, "discovery.json")
+
+# Listings younger than this are served without asking the provider again
+DISCOVERY_TTL = 300
+
+# Empty listings (bad key, Ollama not running) are retried sooner
+EMPTY_DISCOVERY_TTL = 30
+
+# Stale listings are still served (while refreshing in the background) up to this age
+DISCOVERY_MAX_STALE = 24 * 3600
+
+
+class ProviderDiscovery:
+    """
+    One model listing per provider, shared by availability checks and model selection.
+
+    Listings are kept in memory and on disk, keyed by provider and a digest of
+    the API key (keys themselves are never written). Fresh listings are
+    served directly, stale ones are served immediately while a background
+    refresh runs, and missing ones are fetched synchronously. A failed
+    refresh leaves a non-empty listing in place, so it keeps being served
+    until DISCOVERY_MAX_STALE.
+    """
+
+    def __init__(
+        self,
+        provider_configs: Dict[str, Dict[str, Any]],
+        list_models: Callable[[str, Dict[str, str]], Optional[List[str]]],
+        cache_file: str = DISCOVERY_FILE
+    ):
+        """
+        Args:
+            provider_configs: Provider configuration mapping (PROVIDER_CONFIGS)
+            list_models: Function performing one upstream listing for (provider, api_keys), None when it failed
+            cache_file: JSON file where listings are persisted
+        """
+        self.provider_configs = provider_configs
+        self.list_models = list_models
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.entries = None
+        self.refreshing = set()
+        self.executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix="discovery")
+
+    def _api_key(self, provider: str, api_keys: Dict[str, str]) -> Optional[str]:
+        """Return the key used for a provider, or None when it is not configured."""
+        try:
+            key_name = self.provider_configs[provider]["key_name"]
+        except KeyError:
+            # Provider plugin that could not be loaded (already logged)
+            return None
+        api_key = api_keys.get(key_name, "")
+        if not api_key:
+            return None
+        return api_key
+
+    def _entry_key(self, provider: str, api_key: str) -> str:
+        digest = hashlib.sha256(str(api_key).encode("utf-8")).hexdigest()[:16]
+        return f"{provider}:{digest}"
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        """Load persisted listings once per process. Caller holds the lock."""
+        if self.entries is None:
+            self.entries = {}
+            try:
+                with open(self.cache_file, "r") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                pass
+        return self.entries
+
+    def _save(self) -> None:
+        """Persist listings atomically. Caller holds the lock."""
+        try:
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            tmp_file = f"{self.cache_file}.tmp"
+            with open(tmp_file, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_file, self.cache_file)
+        except OSError as e:
+            logger.warning("Could not save provider discovery cache: %s", e)
+
+    def _age_limit(self, entry: Dict[str, Any]) -> int:
+        return DISCOVERY_TTL if entry["models"] else EMPTY_DISCOVERY_TTL
+
+    def discover(self, provider: str, api_keys: Dict[str, str]) -> List[str]:
+        """
+        List a provider's models upstream and record the result.
+
+        When the listing fails, a previous non-empty listing younger than
+        DISCOVERY_MAX_STALE is kept (and returned) rather than replaced.
+
+        Args:
+            provider: Name of the provider
+            api_keys: Dictionary of API keys
+
+        Returns:
+            List[str]: Model names, empty when the provider is unavailable
+        """
+        api_key = self._api_key(provider, api_keys)
+        if api_key is None:
+            return []
+
+        entry_key = self._entry_key(provider, api_key)
+        models = self.list_models(provider, api_keys)
+        with self.lock:
+            entries = self._load()
+            if models is None:
+                entry = entries.get(entry_key)
+                if entry is not None and entry["models"] and time.time() - entry["fetched_at"] < DISCOVERY_MAX_STALE:
+                    return entry["models"]
+                # Recorded empty so the provider is retried after EMPTY_DISCOVERY_TTL, not on every call
+                models = []
+            entries[entry_key] = {
+                "provider": provider,
+                "models": models,
+                "fetched_at": time.time(),
+            }
+            self._save()
+        return models
+
+    def _refresh_in_background(self, provider: str, api_keys: Dict[str, str]) -> None:
+        """Schedule a refresh unless one is already running for this provider and key."""
+        entry_key = self._entry_key(provider, self._api_key(provider, api_keys))
+        with self.lock:
+            if entry_key in self.refreshing:
+                return
+            self.refreshing.add(entry_key)
+
+        def refresh():
+            try:
+                self.discover(provider, api_keys)
+            except Exception as e:
+                logger.warning("Error discovering provider %s: %s", provider, e)
+            finally:
+                with self.lock:
+                    self.refreshing.discard(entry_key)
+
+        self.executor.submit(refresh)
+
+    def models(self, provider: str, api_keys: Dict[str, str], wait: bool = True) -> Optional[List[str]]:
+        """
+        Get a provider's models, from the cache when possible.
+
+        Args:
+            provider: Name of the provider
+            api_keys: Dictionary of API keys
+            wait: When nothing usable is cached, list upstream (True) or return None (False)
+
+        Returns:
+            Optional[List[str]]: Model names, or None when not known yet and wait is False
+        """
+        if provider not in self.provider_configs:
+            return []
+        api_key = self._api_key(provider, api_keys)
+        if api_key is None:
+            return []
+
+        with self.lock:
+            entry = self._load().get(self._entry_key(provider, api_key))
+
+        if entry is not None:
+            age = time.time() - entry["fetched_at"]
+            if age < self._age_limit(entry):
+                return entry["models"]
+            if age < DISCOVERY_MAX_STALE:
+                # Stale while revalidate: answer now, refresh for next time
+                self._refresh_in_background(provider, dict(api_keys))
+                return entry["models"]
+
+        if not wait:
+            self._refresh_in_background(provider, dict(api_keys))
+            return None
+        return self.discover(provider, api_keys)
+
+    def providers(self, api_keys: Dict[str, str]) -> List[str]:
+        """
+        Get the providers that currently list at least one model.
+
+        Providers without a cached listing are discovered concurrently.
+
+        Args:
+            api_keys: Dictionary of API keys
+
+        Returns:
+            List[str]: Available provider names, in configuration order
+        """
+        providers = list(self.provider_configs.keys())
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(providers)) as executor:
+            listings = list(executor.map(lambda provider: self.models(provider, api_keys), providers))
+        return [provider for provider, models in zip(providers, listings) if models]
+
+    def start(self, api_keys: Dict[str, str]) -> None:
+        """
+        Warm up listings for every configured provider without blocking.
+
+        Args:
+            api_keys: Dictionary of API keys
+        """
+        for provider in self.provider_configs:
+            if self._api_key(provider, api_keys) is not None:
+                self.models(provider, api_keys, wait=False)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Describe the cached listings for diagnostics.
+
+        Returns:
+            List[Dict[str, Any]]: One row per cached provider listing
+        """
+        now = time.time()
+        with self.lock:
+            entries = list(self._load().values())
+        return [
+            {
+                "provider": entry["provider"],
+                "models": len(entry["models"]),
+                "age_seconds": round(now - entry["fetched_at"], 1),
+                "stale": now - entry["fetched_at"] >= self._age_limit(entry),
+            }
+            for entry in entries
+        ]
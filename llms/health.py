@@ -0,0 +1,210 @@
+import time
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Consecutive failures that open a provider's circuit
+FAILURE_THRESHOLD = 3
+
+# Seconds an open circuit rejects requests before letting one trial through
+OPEN_COOLDOWN = 30
+
+# Seconds between background probes of each configured provider
+PROBE_INTERVAL = 60
+
+# Number of recent calls used for the error rate
+OUTCOME_WINDOW = 20
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Per-provider circuit breaker.
+
+    Closed: requests go through. After FAILURE_THRESHOLD consecutive
+    failures it opens and requests fail fast. After OPEN_COOLDOWN seconds it
+    half-opens: a single trial request goes through, and its outcome closes
+    or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD, cooldown: float = OPEN_COOLDOWN):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+
+    def allow_request(self) -> bool:
+        """Return whether a request may be sent now. Caller holds the monitor lock."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN and time.time() - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self.trial_in_flight = False
+        if self.state == HALF_OPEN and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call. Caller holds the monitor lock."""
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failure and open the circuit if needed. Caller holds the monitor lock."""
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.state == HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = OPEN
+            self.opened_at = time.time()
+
+
+class ProviderHealth:
+    """Circuit breaker plus recent outcomes and latency for one provider."""
+
+    def __init__(self):
+        self.breaker = CircuitBreaker()
+        self.outcomes = deque(maxlen=OUTCOME_WINDOW)
+        self.latency = None
+        self.last_error = None
+        self.last_checked = None
+        self.rejected = 0
+
+
+class HealthMonitor:
+    """
+    Track provider health from real calls and scheduled background probes.
+
+    Every upstream call reports its outcome and latency with record(). The
+    monitor thread probes each configured provider every PROBE_INTERVAL
+    seconds so an outage is noticed (and recovery tested) without a user
+    request having to wait on a dead connection.
+    """
+
+    def __init__(self, provider_configs: Dict[str, Dict[str, Any]], probe: Callable[[str, Dict[str, str]], bool]):
+        """
+        Args:
+            provider_configs: Provider configuration mapping (PROVIDER_CONFIGS)
+            probe: Function checking one provider, returns True when healthy
+        """
+        self.provider_configs = provider_configs
+        self.probe = probe
+        self.lock = threading.Lock()
+        self.providers: Dict[str, ProviderHealth] = {}
+        self.api_keys: Dict[str, str] = {}
+        self.thread = None
+
+    def _health(self, provider: str) -> ProviderHealth:
+        """Get or create a provider's health record. Caller holds the lock."""
+        if provider not in self.providers:
+            self.providers[provider] = ProviderHealth()
+        return self.providers[provider]
+
+    def allow(self, provider: str) -> bool:
+        """
+        Check whether a call to a provider may go upstream.
+
+        Args:
+            provider: Name of the provider
+
+        Returns:
+            bool: False when the provider's circuit is open
+        """
+        with self.lock:
+            health = self._health(provider)
+            allowed = health.breaker.allow_request()
+            if not allowed:
+                health.rejected += 1
+            return allowed
+
+    def record(self, provider: str, ok: bool, latency: float, error: Optional[str] = None) -> None:
+        """
+        Record the outcome of an upstream call.
+
+        Args:
+            provider: Name of the provider
+            ok: Whether the call succeeded
+            latency: Duration of the call in seconds
+            error: Error text for failed calls
+        """
+        with self.lock:
+            health = self._health(provider)
+            health.outcomes.append(ok)
+            # Exponentially weighted so one slow call does not dominate
+            health.latency = latency if health.latency is None else 0.8 * health.latency + 0.2 * latency
+            health.last_checked = time.time()
+            if ok:
+                health.breaker.record_success()
+            else:
+                health.last_error = (error or "")[:300]
+                health.breaker.record_failure()
+
+    def _probe_all(self) -> None:
+        """Probe every configured provider whose circuit lets a request through."""
+        with self.lock:
+            api_keys = dict(self.api_keys)
+        for provider, config in self.provider_configs.items():
+            try:
+                if not api_keys.get(config["key_name"]):
+                    continue
+            except KeyError:
+                # Provider plugin that could not be loaded (already logged)
+                continue
+            try:
+                # The probe goes through the normal call path, which records its outcome
+                self.probe(provider, api_keys)
+            except Exception as e:
+                logger.warning("Health probe error for %s: %s", provider, e)
+
+    def _run(self) -> None:
+        while True:
+            self._probe_all()
+            time.sleep(PROBE_INTERVAL)
+
+    def start(self, api_keys: Dict[str, str]) -> None:
+        """
+        Start the background probe thread (once per process) with the latest keys.
+
+        Args:
+            api_keys: Dictionary of API keys
+        """
+        with self.lock:
+            self.api_keys = dict(api_keys)
+            if self.thread is not None:
+                return
+            self.thread = threading.Thread(target=self._run, name="provider-health", daemon=True)
+        self.thread.start()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """
+        Describe every provider's health for display.
+
+        Returns:
+            List[Dict[str, Any]]: One row per provider seen so far
+        """
+        now = time.time()
+        rows = []
+        with self.lock:
+            for provider, health in sorted(self.providers.items()):
+                calls = len(health.outcomes)
+                failures = calls - sum(health.outcomes)
+                rows.append({
+                    "provider": provider,
+                    "circuit": health.breaker.state,
+                    "error_rate": round(failures / calls, 2) if calls else None,
+                    "latency_s": round(health.latency, 2) if health.latency is not None else None,
+                    "rejected": health.rejected,
+                    "last_checked_s_ago": round(now - health.last_checked) if health.last_checked else None,
+                    "last_error": health.last_error or "",
+                })
+        return rows
@@ -1,106 +1,481 @@
 import sys
+import json
 import time
+import hashlib
+import logging
 import importlib
+import threading
+import contextvars
 import streamlit as st
 import concurrent.futures
-from typing import List, Dict, Any, Optional, Tuple, Callable
-
-
-# Import provider modules
-from .providers.llm_ollama import check_ollama, get_available_models_ollama, ollama_chat, get_ollama_streaming
-from .providers.llm_deepseek import check_deepseek, get_available_models_deepseek, deepseek_chat, get_deepseek_streaming
-from .providers.llm_mistral import check_mistral, get_available_models_mistral, mistral_chat, get_mistral_streaming
-from .providers.llm_anthropic import check_anthropic, get_available_models_anthropic, anthropic_chat, get_anthropic_streaming
-from .providers.llm_openai import check_openai, get_available_models_openai, openai_chat, get_openai_streaming
-from .providers.llm_gemini import check_gemini, get_available_models_gemini, gemini_chat, get_gemini_streaming
-
-# Define provider mappings for cleaner code
-PROVIDER_CONFIGS = {
-    "Ollama": {
-        "key_name": "ollama",
-        "check_func": check_ollama,
-        "models_func": get_available_models_ollama,
-        "chat_func": ollama_chat,
-        "streaming_func": get_ollama_streaming,
-        "requires_key": False,  # Ollama just needs a port, not an API key
-    },
-    "Deepseek": {
-        "key_name": "deepseek",
-        "check_func": check_deepseek,
-        "models_func": get_available_models_deepseek,
-        "chat_func": deepseek_chat,
-        "streaming_func": get_deepseek_streaming,
-        "requires_key": True,
-    },
-    "Mistral": {
-        "key_name": "mistral",
-        "check_func": check_mistral,
-        "models_func": get_available_models_mistral,
-        "chat_func": mistral_chat,
-        "streaming_func": get_mistral_streaming,
-        "requires_key": True,
-    },
-    "Anthropic": {
-        "key_name": "anthropic",
-        "check_func": check_anthropic,
-        "models_func": get_available_models_anthropic,
-        "chat_func": anthropic_chat,
-        "streaming_func": get_anthropic_streaming,
-        "requires_key": True,
-    },
-    "OpenAI": {
-        "key_name": "openai",
-        "check_func": check_openai,
-        "models_func": get_available_models_openai,
-        "chat_func": openai_chat,
-        "streaming_func": get_openai_streaming,
-        "requires_key": True,
-    },
-    "Gemini": {
-        "key_name": "gemini",
-        "check_func": check_gemini,
-        "models_func": get_available_models_gemini,
-        "chat_func": gemini_chat,
-        "streaming_func": get_gemini_streaming,
-        "requires_key": True,
-    }
-}
+from typing import List, Dict, Any, Iterator, Optional, Tuple, Callable
 
+from .registry import ProviderRegistry, BUILTIN_PROVIDERS
+from .discovery import ProviderDiscovery
+from .health import HealthMonitor
+from . import usage
+from diagnostics import metrics, tracing
 
-def get_provider_state(provider: str, api_keys: Dict[str, str]) -> bool:
+
+logger = logging.getLogger(__name__)
+
+# Provider plugins are resolved lazily: a provider's module and SDK are only
+# imported the first time one of its functions is used
+PROVIDER_CONFIGS = ProviderRegistry(BUILTIN_PROVIDERS)
+
+
+class _Flight:
+    """A single upstream call shared by every caller that asks for the same thing."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _StreamFlight:
+    """A single upstream stream whose chunks are replayed to every subscriber."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.finished = False
+        self.closed = False
+        self.subscribers = 0
+
+
+# In-flight upstream calls and streams, shared by all sessions of the process
+_inflight_lock = threading.Lock()
+_inflight_calls: Dict[str, _Flight] = {}
+_inflight_streams: Dict[str, _StreamFlight] = {}
+
+# Set by _cached_llm_response() when it runs, i.e. on a cache miss
+_cache_missed: contextvars.ContextVar = contextvars.ContextVar("cache_missed", default=False)
+
+
+def _normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
     """
-    Check if a provider is available with the given API key.
+    Reduce messages to the role and content sent upstream.
     
     Args:
-        provider: Name of the provider to check
+        messages: List of message dictionaries, possibly with extra fields like 'id'
+        
+    Returns:
+        List[Dict[str, str]]: Messages with only 'role' and 'content'
+    """
+    return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+
+def _flight_key(kind: str, provider: str, api_key: str, model: str = "", messages: Optional[List[Dict[str, str]]] = None, **params) -> str:
+    """
+    Build the key identifying identical upstream requests.
+    
+    The API key is part of the key (hashed) so calls are never shared
+    between different accounts.
+    
+    Args:
+        kind: Type of call (chat, stream, models, state)
+        provider: Name of the provider
+        api_key: API key or port used for the call
+        model: Name of the model
+        messages: Normalized messages
+        **params: Any other parameter that changes the upstream result
+        
+    Returns:
+        str: Hex digest identifying the request
+    """
+    payload = json.dumps(
+        [kind, provider, str(api_key), model, messages or [], params],
+        sort_keys=True,
+        ensure_ascii=False,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _single_flight(key: str, func: Callable[..., Any], *args) -> Tuple[Any, bool]:
+    """
+    Run func(*args) once for all concurrent callers using the same key.
+    
+    The first caller (the leader) runs the call; callers arriving while it
+    is in flight wait for it and get the same result (or exception).
+    
+    Args:
+        key: Key from _flight_key
+        func: Function performing the upstream call
+        *args: Arguments for func
+        
+    Returns:
+        Tuple[Any, bool]: The result of func, and whether this caller ran the call
+    """
+    with _inflight_lock:
+        flight = _inflight_calls.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _Flight()
+            _inflight_calls[key] = flight
+
+    if not is_leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, False
+
+    try:
+        flight.result = func(*args)
+        return flight.result, True
+    except Exception as e:
+        flight.error = e
+        raise
+    except BaseException:
+        # Don't hand a rerun/stop signal of one session to the others
+        flight.error = RuntimeError("Shared request was interrupted")
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight_calls.pop(key, None)
+        flight.done.set()
+
+
+def _single_flight_stream(
+    key: str,
+    streaming_func: Callable[..., Iterator[str]],
+    *args,
+    context: Optional[contextvars.Context] = None,
+    flight_out: Optional[Dict[str, Any]] = None
+) -> Iterator[str]:
+    """
+    Subscribe to a shared upstream stream, starting it if needed.
+    
+    The upstream generator runs in its own thread. Every subscriber gets all
+    chunks from the beginning, so late joiners catch up before following
+    live deltas. The upstream stream is closed once every subscriber left.
+    
+    Args:
+        key: Key from _flight_key
+        streaming_func: Provider streaming function
+        *args: Arguments for streaming_func
+        context: Context the upstream thread runs in (defaults to a copy of the caller's)
+        flight_out: Filled with {"leader": whether this subscriber started the upstream stream}
+        
+    Yields:
+        str: Response chunks
+    """
+    with _inflight_lock:
+        flight = _inflight_streams.get(key)
+        if flight is not None:
+            with flight.cond:
+                if flight.closed:
+                    flight = None
+                else:
+                    flight.subscribers += 1
+        is_leader = flight is None
+        if is_leader:
+            flight = _StreamFlight()
+            flight.subscribers = 1
+            _inflight_streams[key] = flight
+    if flight_out is not None:
+        flight_out["leader"] = is_leader
+
+    def produce():
+        generator = streaming_func(*args)
+        try:
+            for chunk in generator:
+                with _inflight_lock:
+                    with flight.cond:
+                        if flight.subscribers == 0:
+                            # Everyone went away (e.g. reruns): stop reading upstream
+                            flight.closed = True
+                            _inflight_streams.pop(key, None)
+                            return
+                        flight.chunks.append(chunk)
+                        flight.cond.notify_all()
+        except Exception as e:
+            with flight.cond:
+                flight.chunks.append(f"Error: {str(e)}")
+        finally:
+            generator.close()
+            with _inflight_lock:
+                with flight.cond:
+                    flight.closed = True
+                    flight.finished = True
+                    flight.cond.notify_all()
+                if _inflight_streams.get(key) is flight:
+                    del _inflight_streams[key]
+
+    if is_leader:
+        context = context or contextvars.copy_context()
+        threading.Thread(target=context.run, args=(produce,), name="llm-stream", daemon=True).start()
+
+    index = 0
+    try:
+        while True:
+            with flight.cond:
+                while index >= len(flight.chunks) and not flight.finished:
+                    flight.cond.wait()
+                if index >= len(flight.chunks):
+                    return
+                chunk = flight.chunks[index]
+            index += 1
+            yield chunk
+    finally:
+        with flight.cond:
+            flight.subscribers -= 1
+
+
+def _is_error_response(response: str) -> bool:
+    """Providers report failures as text starting with "Error" instead of raising."""
+    return isinstance(response, str) and response.startswith("Error")
+
+
+def _is_listing(result: Any) -> bool:
+    """A model listing succeeded whatever its length; failures raise."""
+    return isinstance(result, list)
+
+
+def _guarded_call(provider: str, rejected_value: Any, is_ok: Callable[[Any], bool], func: Callable[..., Any], *args) -> Any:
+    """
+    Call a provider function through its circuit breaker and record the outcome.
+    
+    Args:
+        provider: Name of the provider
+        rejected_value: Returned without calling func when the circuit is open
+        is_ok: Tells whether a result counts as a success
+        func: Provider function to call
+        *args: Arguments for func
+        
+    Returns:
+        Any: The result of func, or rejected_value
+    """
+    if not provider_health.allow(provider):
+        return rejected_value
+    start_time = time.time()
+    try:
+        result = func(*args)
+    except Exception as e:
+        provider_health.record(provider, False, time.time() - start_time, str(e))
+        raise
+    ok = is_ok(result)
+    provider_health.record(provider, ok, time.time() - start_time, None if ok else str(result))
+    return result
+
+
+def _timed_chat(provider: str, chat_func: Callable[..., str], model: str, messages: List[Dict[str, str]], api_key: str) -> str:
+    """
+    Call a provider's chat function and record its latency metrics.
+    
+    Args:
+        provider: Name of the provider
+        chat_func: Provider chat function
+        model: Name of the model
+        messages: Normalized messages
+        api_key: API key or port
+        
+    Returns:
+        str: The response text
+    """
+    start_time = time.perf_counter()
+    response = ""
+    with tracing.span("provider.chat", provider=provider, model=model) as current:
+        try:
+            response = chat_func(model, messages, api_key)
+            if _is_error_response(response):
+                current.record_error(response)
+            return response
+        finally:
+            metrics.record_call(provider, model, time.perf_counter() - start_time, response or "",
+                                bool(response) and not _is_error_response(response))
+
+
+def _chat_with_usage(
+    provider: str,
+    chat_func: Callable[..., str],
+    model: str,
+    messages: List[Dict[str, str]],
+    api_key: str
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Call a provider's chat function through its circuit breaker and work out the token usage.
+    
+    Args:
+        provider: Name of the provider
+        chat_func: Provider chat function
+        model: Name of the model
+        messages: Normalized messages
+        api_key: API key or port
+        
+    Returns:
+        Tuple[str, Optional[Dict[str, Any]]]: The response text and its usage (None for errors)
+    """
+    with usage.collect() as reported:
+        response = _guarded_call(
+            provider, _circuit_open_message(provider),
+            lambda result: not _is_error_response(result),
+            _timed_chat, provider, chat_func, model, messages, api_key
+        )
+    if _is_error_response(response):
+        return response, None
+    return response, usage.message_usage(provider, model, messages, response, reported)
+
+
+def _guarded_stream(
+    provider: str,
+    model: str,
+    streaming_func: Callable[..., Iterator[str]],
+    messages: List[Dict[str, str]],
+    api_key: str
+) -> Iterator[str]:
+    """
+    Stream from a provider through its circuit breaker, recording health and latency metrics.
+    
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+        streaming_func: Provider streaming function
+        messages: Normalized messages
+        api_key: API key or port
+        
+    Yields:
+        str: Response chunks
+    """
+    if not provider_health.allow(provider):
+        yield _circuit_open_message(provider)
+        return
+    start_time = time.time()
+    timer = metrics.StreamTimer(provider, model)
+    # Not made current: this generator runs in the stream thread between yields
+    provider_span = tracing.start_span("provider.stream", provider=provider, model=model)
+    ok = True
+    error = None
+    chunks = 0
+    try:
+        with usage.collect() as reported:
+            for index, chunk in enumerate(streaming_func(model, messages, api_key)):
+                if index == 0 and _is_error_response(chunk):
+                    ok = False
+                    error = chunk
+                timer.chunk(chunk)
+                chunks += 1
+                yield chunk
+        if reported and ok:
+            # Usage travels in-band so every subscriber of a shared stream receives it
+            yield reported
+    except Exception as e:
+        ok = False
+        error = str(e)
+        raise
+    finally:
+        provider_health.record(provider, ok, time.time() - start_time, error)
+        timer.finish(ok)
+        provider_span.set_attribute("chunks", chunks)
+        if not ok:
+            provider_span.record_error(error)
+        provider_span.end()
+
+
+def _circuit_open_message(provider: str) -> str:
+    return f"Error: {provider} is temporarily unavailable after repeated failures. It will be retried automatically."
+
+
+def list_provider_models(provider: str, api_keys: Dict[str, str]) -> Optional[List[str]]:
+    """
+    List a provider's models upstream (one listing call).
+    
+    This is the only place provider listings happen; availability checks and
+    model selection are both served from its result by provider discovery.
+    
+    Args:
+        provider: Name of the provider
         api_keys: Dictionary of API keys
         
     Returns:
-        bool: True if provider is available, False otherwise
+        Optional[List[str]]: List of available model names, None when the listing failed
     """
     try:
         if provider not in PROVIDER_CONFIGS:
-            return False
+            return []
             
         config = PROVIDER_CONFIGS[provider]
         key_name = config["key_name"]
+        models_func = config["models_func"]
         
-        # For providers requiring a key, check if key exists
-        if config["requires_key"] and not api_keys.get(key_name):
-            return False
-            
-        # For Ollama specifically, check if models are available
-        if provider == "Ollama":
-            return get_available_models_ollama(api_keys[key_name]) is not None
-            
-        # For others, just check if the API key is provided
-        return len(api_keys[key_name]) > 0
+        # Concurrent listings for the same provider and key share one upstream call
+        key = _flight_key("models", provider, api_keys[key_name])
+        with tracing.span("provider.list_models", provider=provider):
+            # Only a raised error is a failure: an empty list (no model pulled, none matching) is an answer.
+            # An open circuit gives None, not [], so discovery keeps the cached listing.
+            return _single_flight(key, _guarded_call, provider, None, _is_listing, models_func, api_keys[key_name])[0]
     except Exception as e:
-        print(f"Error checking provider {provider}: {str(e)}")
+        logger.warning("Error getting models for %s: %s", provider, e)
+        # Not an empty listing: discovery keeps serving the previous one
+        return None
+
+
+# Process-wide discovery and health services shared by every session
+provider_discovery = ProviderDiscovery(PROVIDER_CONFIGS, list_provider_models)
+provider_health = HealthMonitor(PROVIDER_CONFIGS, provider_discovery.discover)
+
+
+def start_provider_discovery(api_keys: Dict[str, str]) -> None:
+    """
+    Refresh missing or stale provider listings in the background.
+    
+    Args:
+        api_keys: Dictionary of API keys
+    """
+    provider_discovery.start(api_keys)
+
+
+def start_health_monitor(api_keys: Dict[str, str]) -> None:
+    """
+    Start probing configured providers in the background (once per process).
+    
+    Args:
+        api_keys: Dictionary of API keys
+    """
+    provider_health.start(api_keys)
+
+
+def get_provider_health() -> List[Dict[str, Any]]:
+    """
+    Get the health of every provider seen so far.
+    
+    Returns:
+        List[Dict[str, Any]]: One row per provider with circuit state, error rate and latency
+    """
+    return provider_health.snapshot()
+
+
+def record_queue_wait(provider: str, model: str, seconds: float) -> None:
+    """
+    Record how long a request waited before being sent to its provider.
+    
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+        seconds: Time between the request being queued and the provider call starting
+    """
+    metrics.record_queue_wait(provider, model, seconds)
+
+
+def get_provider_state(provider: str, api_keys: Dict[str, str]) -> bool:
+    """
+    Check if a provider is available with the given API key.
+    
+    Args:
+        provider: Name of the provider to check
+        api_keys: Dictionary of API keys
+        
+    Returns:
+        bool: True if provider is available, False otherwise
+    """
+    try:
+        return bool(provider_discovery.models(provider, api_keys))
+    except Exception as e:
+        logger.error("Error checking provider %s: %s", provider, e)
         return False
 
 
-@st.cache_data(ttl=300)
 def get_available_providers(api_keys: Dict[str, str]) -> List[str]:
     """
     Get a list of available providers based on API keys.
@@ -111,28 +486,7 @@ def get_available_providers(api_keys: Dict[str, str]) -> List[str]:
     Returns:
         List[str]: List of available provider names
     """
-    providers = list(PROVIDER_CONFIGS.keys())
-    available_providers = []
-    
-    # Use multithreading to check providers concurrently
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Create a future for each provider check
-        future_to_provider = {
-            executor.submit(get_provider_state, provider, api_keys): provider
-            for provider in providers
-        }
-        
-        # Process results as they complete
-        for future in concurrent.futures.as_completed(future_to_provider):
-            provider = future_to_provider[future]
-            try:
-                is_available = future.result()
-                if is_available:
-                    available_providers.append(provider)
-            except Exception as e:
-                print(f"Error checking provider {provider}: {str(e)}")
-    
-    return available_providers
+    return provider_discovery.providers(api_keys)
 
 
 def get_available_models(provider: str, api_keys: Dict[str, str]) -> List[str]:
@@ -147,16 +501,9 @@ def get_available_models(provider: str, api_keys: Dict[str, str]) -> List[str]:
         List[str]: List of available model names
     """
     try:
-        if provider not in PROVIDER_CONFIGS:
-            return []
-            
-        config = PROVIDER_CONFIGS[provider]
-        key_name = config["key_name"]
-        models_func = config["models_func"]
-        
-        return models_func(api_keys[key_name])
+        return provider_discovery.models(provider, api_keys)
     except Exception as e:
-        print(f"Error getting models for {provider}: {str(e)}")
+        logger.error("Error getting models for %s: %s", provider, e)
         return []
 
 
@@ -180,59 +527,106 @@ def get_llm_response(
     Returns:
         str: The LLM response text
     """
+    return get_llm_response_with_usage(provider, model, messages, api_keys, chat_id)[0]
+
+
+def get_llm_response_with_usage(
+    provider: str, 
+    model: str, 
+    messages: List[Dict[str, Any]], 
+    api_keys: Dict[str, str], 
+    chat_id: Optional[str] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Get a response and its token usage from the specified LLM provider and model.
+    
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+        messages: List of message dictionaries
+        api_keys: Dictionary of API keys
+        chat_id: Optional chat ID for caching
+        
+    Returns:
+        Tuple[str, Optional[Dict[str, Any]]]: The response text and its usage from
+        usage.message_usage() (None when the call failed)
+    """
     # Extract chat_id from session state if not provided
     if chat_id is None and 'active_chat_id' in st.session_state:
         chat_id = st.session_state.active_chat_id
     
     # Get API key
     if provider not in PROVIDER_CONFIGS:
-        return f"Error: Unknown provider {provider}"
+        return f"Error: Unknown provider {provider}", None
         
     config = PROVIDER_CONFIGS[provider]
     key_name = config["key_name"]
     chat_func = config["chat_func"]
     api_key = api_keys[key_name]
     
-    # Time the response
-    start_time = time.time()
-    
     try:
-        # Get response from provider
-        response = chat_func(model, messages, api_key)
-        
-        # Log response time for performance monitoring
-        elapsed_time = time.time() - start_time
-        print(f"{provider} ({model}) response time: {elapsed_time:.2f} seconds")
-        
-        return response
+        # Identical requests in flight from other sessions share one upstream call
+        normalized_messages = _normalize_messages(messages)
+        key = _flight_key("chat", provider, api_key, model, normalized_messages)
+        (response, response_usage), leader = _single_flight(
+            key, _chat_with_usage, provider, chat_func, model, normalized_messages, api_key
+        )
+        if response_usage is not None and not leader:
+            # Billed once, to the session whose call it was
+            response_usage = usage.shared_usage(response_usage)
+        return response, response_usage
     except Exception as e:
         error_message = f"Error: {str(e)}"
-        print(f"LLM error with {provider} ({model}): {error_message}")
-        return error_message
+        logger.error("LLM error with %s (%s): %s", provider, model, error_message)
+        return error_message, None
 
 
-# Add a cached version for use from the UI
 @st.cache_data(ttl=15, show_spinner=False)
+def _cached_llm_response(
+    provider: str, 
+    model: str, 
+    messages: List[Dict[str, Any]], 
+    api_keys: Dict[str, str], 
+    chat_id: Optional[str] = None
+) -> Tuple[str, Optional[Dict[str, Any]]]:
+    # Only runs on a cache miss: tells cached_llm_response() the call was made for this caller
+    _cache_missed.set(True)
+    return get_llm_response_with_usage(provider, model, messages, api_keys, chat_id)
+
+
+# Add a cached version for use from the UI
 def cached_llm_response(
     provider: str, 
     model: str, 
     messages: List[Dict[str, Any]], 
     api_keys: Dict[str, str], 
     chat_id: Optional[str] = None
-) -> str:
+) -> Tuple[str, Optional[Dict[str, Any]]]:
     """
-    Cached version of get_llm_response to improve performance.
+    Cached version of get_llm_response_with_usage to improve performance.
     
-    This function has the same parameters as get_llm_response but includes caching.
+    This function has the same parameters as get_llm_response but includes caching,
+    and returns the response text with its token usage.
+    The span covers hashing the arguments for the cache as well as the call.
     """
-    return get_llm_response(provider, model, messages, api_keys, chat_id)
+    with tracing.span("llm.cached_response", provider=provider, model=model, messages=len(messages)):
+        token = _cache_missed.set(False)
+        try:
+            response, response_usage = _cached_llm_response(provider, model, messages, api_keys, chat_id)
+            if response_usage is not None and not _cache_missed.get():
+                # A cache hit reuses a response already billed to the caller that got it
+                response_usage = usage.shared_usage(response_usage)
+            return response, response_usage
+        finally:
+            _cache_missed.reset(token)
 
 
 def get_llm_response_streaming(
     provider: str, 
     model: str, 
     messages: List[Dict[str, Any]], 
-    api_keys: Dict[str, str]
+    api_keys: Dict[str, str],
+    usage_out: Optional[Dict[str, Any]] = None
 ) -> List[str]:
     """
     Get a streaming response from the specified LLM provider and model.
@@ -242,6 +636,7 @@ def get_llm_response_streaming(
         model: Name of the model
         messages: List of message dictionaries
         api_keys: Dictionary of API keys
+        usage_out: Filled with the usage from usage.message_usage() when the stream succeeds
         
     Returns:
         List[str]: List of response chunks
@@ -254,18 +649,47 @@ def get_llm_response_streaming(
     streaming_func = config["streaming_func"]
     api_key = api_keys[key_name]
     
+    # Spans the whole iteration; started, not made current, since this is a generator
+    stream_span = tracing.start_span("llm.stream", provider=provider, model=model, messages=len(messages))
+    chunks = 0
+    parts = []
+    reported = None
+    flight = {}
     try:
         # Add logging for debugging streaming issues
-        print(f"Starting streaming response from {provider} with model {model}")
+        logger.debug("Starting streaming response from %s with model %s", provider, model)
         
-        # Get the streaming generator and yield each chunk directly
+        # Subscribe to the shared stream and yield each chunk directly
         # Each provider implements its own streaming logic, including any necessary buffering
-        response_generator = streaming_func(model, messages, api_key)
+        normalized_messages = _normalize_messages(messages)
+        key = _flight_key("stream", provider, api_key, model, normalized_messages)
+        response_generator = _single_flight_stream(
+            key, _guarded_stream, provider, model, streaming_func, normalized_messages, api_key,
+            context=tracing.context_with(stream_span),
+            flight_out=flight
+        )
         for chunk in response_generator:
+            if isinstance(chunk, usage.UsageReport):
+                reported = chunk
+                continue
+            chunks += 1
+            if usage_out is not None:
+                parts.append(chunk)
             yield chunk
+        
+        if usage_out is not None and parts and not _is_error_response(parts[0]):
+            response_usage = usage.message_usage(provider, model, normalized_messages, "".join(parts), reported)
+            if not flight.get("leader", True):
+                # Joined a stream another session started: billed once, to that session
+                response_usage = usage.shared_usage(response_usage)
+            usage_out.update(response_usage)
             
     except Exception as e:
         error_message = f"Error: {str(e)}"
-        print(f"LLM streaming error with {provider} ({model}): {error_message}")
+        logger.error("LLM streaming error with %s (%s): %s", provider, model, error_message)
+        stream_span.record_error(e)
         yield error_message
+    finally:
+        stream_span.set_attribute("chunks", chunks)
+        stream_span.end()
 
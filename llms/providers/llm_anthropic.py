@@ -1,52 +1,44 @@
 import anthropic
 import random
 import time
+import logging
+from functools import lru_cache
 
+from ..usage import report_usage
 
-def check_anthropic(api_key):
-    """ Check if the Anthropic API key is valid """
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        models = client.models.list()
-        res = [model.id for model in models]
-        if res is not None:
-            return True
-        else:
-            return False
-    except Exception as e:
-        return False
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=16)
+def _get_client(api_key):
+    """ Get a shared Anthropic client so connections are pooled across requests """
+    return anthropic.Anthropic(api_key=api_key)
+
+
+# Seconds before a model listing gives up, so availability checks never hang
+LIST_TIMEOUT = 5.0
 
 
 def get_available_models_anthropic(api_key):
-    """ Get the available models for the Anthropic API """
-    try:
-        client = anthropic.Anthropic(api_key=api_key)
-        models = client.models.list()
-        return [model.id for model in models]
-    except Exception as e:
-        return []
+    """ Get the available models for the Anthropic API (errors are raised, for the circuit breaker) """
+    client = _get_client(api_key).with_options(timeout=LIST_TIMEOUT)
+    models = client.models.list()
+    return [model.id for model in models]
 
 
 def anthropic_chat(model, message, api_key):
     """ Send a chat request to Anthropic and get the response WITHOUT streaming """
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
+        client = _get_client(api_key)
         
         response = client.messages.create(
             max_tokens=4096,
             model=model,
-            messages=filtered_messages,
+            messages=message,  # Already reduced to role and content by llms.llm
             stream=False
         )
+        report_usage(response.usage.input_tokens, response.usage.output_tokens)
         return response.content[0].text
     except Exception as e:
         return "Error: " + str(e)
@@ -55,21 +47,12 @@ def anthropic_chat(model, message, api_key):
 def get_anthropic_streaming(model, message, api_key):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        client = anthropic.Anthropic(api_key=api_key)
-        
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
+        client = _get_client(api_key)
         
         stream = client.messages.create(
             max_tokens=4096,
             model=model,
-            messages=filtered_messages,
+            messages=message,  # Already reduced to role and content by llms.llm
             stream=True
         )
         
@@ -79,6 +62,8 @@ def get_anthropic_streaming(model, message, api_key):
         last_yield_time = time.time()
         max_buffer_time = 0.1  # Yield at least every 100ms even if buffer is small
         
+        input_tokens = None
+        
         # Process each chunk with buffering logic
         for chunk in stream:
             # Handle different types of chunks from Anthropic API
@@ -94,6 +79,12 @@ def get_anthropic_streaming(model, message, api_key):
                     if hasattr(chunk.content_block, 'text') and chunk.content_block.text:
                         # Add to buffer instead of yielding directly
                         buffer += chunk.content_block.text
+                
+                # Input tokens come with the message start, output tokens with the final delta
+                elif chunk.type == 'message_start':
+                    input_tokens = chunk.message.usage.input_tokens
+                elif chunk.type == 'message_delta' and getattr(chunk, 'usage', None):
+                    report_usage(input_tokens, chunk.usage.output_tokens)
             
             # Check if we should yield the buffer contents
             current_time = time.time()
@@ -111,5 +102,5 @@ def get_anthropic_streaming(model, message, api_key):
 
     except Exception as e:
         error_msg = f"Error with Anthropic streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg
@@ -1,52 +1,48 @@
+import os
 import openai
 import time
+import logging
+from functools import lru_cache
+
+from ..usage import report_usage
+
+
+logger = logging.getLogger(__name__)
+
+
+# Like OPENAI_BASE_URL for the OpenAI provider, e.g. to point Deepseek at tools.stub_server
+DEEPSEEK_BASE_URL = os.environ.get("DEEPSEEK_BASE_URL") or "https://api.deepseek.com"
 
-def check_deepseek(api_key):
-    """ Check if the Deepseek API key is valid """
-    try:
-        res = []
-        client = openai.OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-        models = client.models.list()
-        res = [model.id for model in models]
-        if res is not None:
-            return True
-        else:
-            return False
-    except Exception as e:
-        return False
+
+@lru_cache(maxsize=16)
+def _get_client(api_key):
+    """ Get a shared Deepseek client so connections are pooled across requests """
+    return openai.OpenAI(api_key=api_key, base_url=DEEPSEEK_BASE_URL)
+
+
+# Seconds before a model listing gives up, so availability checks never hang
+LIST_TIMEOUT = 5.0
 
 
 def get_available_models_deepseek(api_key):
-    """ Get the available models for the Deepseek API """
-    res = []
-    try:
-        client = openai.OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-        models = client.models.list()
-        res = [model.id for model in models]
-    except Exception as e:
-        return []
-    return res
+    """ Get the available models for the Deepseek API (errors are raised, for the circuit breaker) """
+    client = _get_client(api_key).with_options(timeout=LIST_TIMEOUT)
+    models = client.models.list()
+    return [model.id for model in models]
 
 
 def deepseek_chat(model, message, api_key):
     """ Send a chat request to Deepseek and get the response WITHOUT streaming """
     try:
-        client = openai.OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
+        client = _get_client(api_key)
         
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
-            
         response = client.chat.completions.create(
             model=model,
-            messages=filtered_messages,
+            messages=message,  # Already reduced to role and content by llms.llm
             stream=False
         )
+        if response.usage:
+            report_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content
     except Exception as e:
         return "Error: " + str(e)
@@ -55,21 +51,13 @@ def deepseek_chat(model, message, api_key):
 def get_deepseek_streaming(model, message, api_key):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        client = openai.OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-        
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
+        client = _get_client(api_key)
         
         stream = client.chat.completions.create(
             model=model,
-            messages=filtered_messages,
-            stream=True
+            messages=message,  # Already reduced to role and content by llms.llm
+            stream=True,
+            stream_options={"include_usage": True}  # Usage arrives in a final chunk without choices
         )
         
         # Internal buffering mechanism for smoother streaming
@@ -80,8 +68,10 @@ def get_deepseek_streaming(model, message, api_key):
         
         # Process each chunk with buffering logic
         for chunk in stream:
-            if chunk.choices[0].delta.content:
+            if chunk.choices and chunk.choices[0].delta.content:
                 buffer += chunk.choices[0].delta.content
+            if chunk.usage:
+                report_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
             current_time = time.time()
             time_since_last_yield = current_time - last_yield_time
             
@@ -97,5 +87,5 @@ def get_deepseek_streaming(model, message, api_key):
 
     except Exception as e:
         error_msg = f"Error with Deepseek streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg
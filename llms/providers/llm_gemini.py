@@ -1,35 +1,35 @@
 from google import genai
 import time
+import logging
+from functools import lru_cache
 
+from ..usage import report_usage
 
-def check_gemini(api_key):
-    """ Check if the Gemini API key is valid """
-    try:
-        client = genai.Client(api_key=api_key)
-        models = client.models.list()
-        res = [model.name for model in models]
-        if res is not None:
-            return True
-        else:
-            return False
-    except Exception as e:
-        return False
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=16)
+def _get_client(api_key):
+    """ Get a shared Gemini client so connections are pooled across requests """
+    return genai.Client(api_key=api_key)
+
+
+# Milliseconds before a model listing gives up, so availability checks never hang
+LIST_TIMEOUT_MS = 5000
 
 
 def get_available_models_gemini(api_key):
-    """ Get the available models for the Gemini API """
-    try:
-        client = genai.Client(api_key=api_key)
-        models = client.models.list()
-        return [model.name for model in models]
-    except Exception as e:
-        return []
+    """ Get the available models for the Gemini API (errors are raised, for the circuit breaker) """
+    client = _get_client(api_key)
+    models = client.models.list(config={"http_options": {"timeout": LIST_TIMEOUT_MS}})
+    return [model.name for model in models]
 
 
 def gemini_chat(model, message, api_key):
     """ Send a chat request to Gemini and get the response WITHOUT streaming """
     try:
-        client = genai.Client(api_key=api_key)
+        client = _get_client(api_key)
 
         # Prepare the content for Gemini
         # Convert the message history into a text representation
@@ -49,6 +49,8 @@ def gemini_chat(model, message, api_key):
             model=model,
             contents=conversation_text,
         )
+        if response.usage_metadata:
+            report_usage(response.usage_metadata.prompt_token_count, response.usage_metadata.candidates_token_count)
         return response.text
     except Exception as e:
         return "Error: " + str(e)
@@ -57,7 +59,7 @@ def gemini_chat(model, message, api_key):
 def get_gemini_streaming(model, message, api_key):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        client = genai.Client(api_key=api_key)
+        client = _get_client(api_key)
         
         # Convert the message history into a text representation
         conversation_text = ""
@@ -87,6 +89,9 @@ def get_gemini_streaming(model, message, api_key):
         for chunk in stream:
             if hasattr(chunk, "text") and chunk.text:
                 buffer += chunk.text
+            # Usage metadata is cumulative, the last chunk holds the totals
+            if getattr(chunk, "usage_metadata", None):
+                report_usage(chunk.usage_metadata.prompt_token_count, chunk.usage_metadata.candidates_token_count)
             current_time = time.time()
             time_since_last_yield = current_time - last_yield_time
             
@@ -102,5 +107,5 @@ def get_gemini_streaming(model, message, api_key):
 
     except Exception as e:
         error_msg = f"Error with Gemini streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg 
@@ -1,51 +1,42 @@
 import mistralai
 import time
+import logging
+from functools import lru_cache
 
+from ..usage import report_usage
 
-def check_mistral(api_key):
-    """ Check if the Mistral API key is valid """
-    try:
-        client = mistralai.Mistral(api_key=api_key)
-        models = client.models.list()
-        res = [model.id for model in models.data]
-        if res is not None:
-            return True
-        else:
-            return False
-    except Exception as e:
-        return False
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=16)
+def _get_client(api_key):
+    """ Get a shared Mistral client so connections are pooled across requests """
+    return mistralai.Mistral(api_key=api_key)
+
+
+# Milliseconds before a model listing gives up, so availability checks never hang
+LIST_TIMEOUT_MS = 5000
 
 
 def get_available_models_mistral(api_key):
-    """ Get the available models for the Mistral API """
-    res = []
-    try:
-        client = mistralai.Mistral(api_key=api_key)
-        models = client.models.list()
-        res = [model.id for model in models.data]
-    except Exception as e:
-        return []
-    return res
+    """ Get the available models for the Mistral API (errors are raised, for the circuit breaker) """
+    client = _get_client(api_key)
+    models = client.models.list(timeout_ms=LIST_TIMEOUT_MS)
+    return [model.id for model in models.data]
 
 
 def mistral_chat(model, message, api_key):
     """ Send a chat request to Mistral and get the response WITHOUT streaming """
     try:
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
-            
-        with mistralai.Mistral(api_key=api_key) as mistral:
-            response = mistral.chat.complete(
-                model=model,
-                messages=filtered_messages,
-            )
-            return response.choices[0].message.content
+        mistral = _get_client(api_key)
+        response = mistral.chat.complete(
+            model=model,
+            messages=message,  # Already reduced to role and content by llms.llm
+        )
+        if response.usage:
+            report_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content
     except Exception as e:
         return "Error: " + str(e)
 
@@ -53,46 +44,39 @@ def mistral_chat(model, message, api_key):
 def get_mistral_streaming(model, message, api_key):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
-        
-        with mistralai.Mistral(api_key=api_key) as mistral:
-            stream = mistral.chat.stream(
-                model=model,
-                messages=filtered_messages,
-            )
-        
-            # Internal buffering mechanism for smoother streaming
-            buffer = ""
-            min_yield_size = 5  # Only yield when we have at least 5 characters
-            last_yield_time = time.time()
-            max_buffer_time = 0.1  # Yield at least every 100ms even if buffer is small
-
-            with stream as event_stream:
-                for event in event_stream:
-                    if event.data.choices[0].delta.content:
-                        buffer += event.data.choices[0].delta.content
-
-                    current_time = time.time()
-                    time_since_last_yield = current_time - last_yield_time
-                
-                    # Yield when buffer reaches threshold OR if max time has passed since last yield
-                    if len(buffer) >= min_yield_size or time_since_last_yield >= max_buffer_time:
-                        yield buffer
-                        buffer = ""
-                        last_yield_time = current_time 
-                
-                # Yield any remaining text in buffer after loop completes
-                if buffer:
+        mistral = _get_client(api_key)
+        stream = mistral.chat.stream(
+            model=model,
+            messages=message,  # Already reduced to role and content by llms.llm
+        )
+    
+        # Internal buffering mechanism for smoother streaming
+        buffer = ""
+        min_yield_size = 5  # Only yield when we have at least 5 characters
+        last_yield_time = time.time()
+        max_buffer_time = 0.1  # Yield at least every 100ms even if buffer is small
+
+        with stream as event_stream:
+            for event in event_stream:
+                if event.data.choices and event.data.choices[0].delta.content:
+                    buffer += event.data.choices[0].delta.content
+                if event.data.usage:
+                    report_usage(event.data.usage.prompt_tokens, event.data.usage.completion_tokens)
+
+                current_time = time.time()
+                time_since_last_yield = current_time - last_yield_time
+            
+                # Yield when buffer reaches threshold OR if max time has passed since last yield
+                if len(buffer) >= min_yield_size or time_since_last_yield >= max_buffer_time:
                     yield buffer
+                    buffer = ""
+                    last_yield_time = current_time 
+            
+            # Yield any remaining text in buffer after loop completes
+            if buffer:
+                yield buffer
 
     except Exception as e:
         error_msg = f"Error with Mistral streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg
\ No newline at end of file
@@ -0,0 +1,176 @@
+import json
+import time
+import random
+import hashlib
+import logging
+from typing import Any, Dict, Iterator, List, Tuple
+
+from ..usage import report_usage
+
+
+logger = logging.getLogger(__name__)
+
+# Models listed by the mock provider; any model name is accepted when chatting
+MOCK_MODELS = ["mock-model"]
+
+# Words the synthetic responses are made of, roughly one token each
+VOCABULARY = (
+    "the of and to in is that for it as was with be by on not he this are or his from at which but have "
+    "an they you were her she there been one all we their has would when if so no will more can about "
+    "model token stream latency request response provider cache message history session chat benchmark"
+).split()
+
+
+class MockProfile:
+    """
+    Timing and failure behaviour of the mock provider and the stub servers.
+
+    Given as the mock "API key" (or the stub server --profile option), a
+    comma-separated list of settings, e.g. "ttft=0.2,tps=50,jitter=0.1".
+    Any non-empty value enables the provider; "default" uses the defaults.
+    """
+
+    __slots__ = ("ttft", "tps", "jitter", "tokens", "error_rate", "seed")
+
+    FIELDS = {
+        "ttft": float,        # Seconds before the first token
+        "tps": float,         # Tokens per second after the first one (0: no delay)
+        "jitter": float,      # Random variation of every delay, as a fraction of it
+        "tokens": int,        # Response length in tokens
+        "error_rate": float,  # Fraction of requests that fail
+        "seed": int,          # Changes every response and delay
+    }
+
+    def __init__(self, ttft=0.2, tps=50.0, jitter=0.1, tokens=120, error_rate=0.0, seed=0):
+        self.ttft = ttft
+        self.tps = tps
+        self.jitter = jitter
+        self.tokens = tokens
+        self.error_rate = error_rate
+        self.seed = seed
+
+    @classmethod
+    def parse(cls, spec: str) -> "MockProfile":
+        """
+        Parse a profile such as "ttft=0.5,tps=20,error_rate=0.1".
+
+        Raises:
+            ValueError: For unknown settings or invalid values
+        """
+        profile = cls()
+        for item in (spec or "").split(","):
+            item = item.strip()
+            if not item or item == "default":
+                continue
+            name, separator, value = item.partition("=")
+            name = name.strip()
+            if not separator or name not in cls.FIELDS:
+                raise ValueError(f"Unknown mock setting '{item}', expected one of {', '.join(cls.FIELDS)}")
+            setattr(profile, name, cls.FIELDS[name](value))
+        return profile
+
+    def plan(self, messages: List[Dict[str, Any]]) -> Tuple[bool, List[Tuple[float, str]]]:
+        """
+        Work out the response to a conversation.
+
+        The same profile and messages always give the same outcome, text
+        and delays, so runs can be compared.
+
+        Args:
+            messages: The conversation
+
+        Returns:
+            Tuple[bool, List[Tuple[float, str]]]: Whether the request fails, and
+            (delay before it in seconds, text) for each token
+        """
+        digest = hashlib.sha256(json.dumps(
+            [(m.get("role"), m.get("content")) for m in messages], ensure_ascii=False
+        ).encode("utf-8")).hexdigest()
+        rng = random.Random(f"{self.seed}:{digest}")
+
+        if rng.random() < self.error_rate:
+            return True, []
+
+        def jittered(delay):
+            return max(0.0, delay * (1 + self.jitter * rng.uniform(-1, 1)))
+
+        gap = 1.0 / self.tps if self.tps > 0 else 0.0
+        tokens = []
+        for index in range(self.tokens):
+            word = rng.choice(VOCABULARY)
+            tokens.append((jittered(self.ttft if index == 0 else gap), word if index == 0 else " " + word))
+        return False, tokens
+
+
+def prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Count prompt tokens the way the synthetic responses do, one per word."""
+    return sum(len(str(m.get("content", "")).split()) for m in messages)
+
+
+def check_mock(spec):
+    """ Check if the mock provider is enabled and its profile is valid """
+    if not spec:
+        return False
+    try:
+        MockProfile.parse(spec)
+        return True
+    except ValueError as e:
+        logger.warning("Mock profile error: %s", e)
+        return False
+
+
+def get_available_models_mock(spec):
+    """ Get the available models for the mock provider """
+    return list(MOCK_MODELS) if check_mock(spec) else []
+
+
+def mock_chat(model, messages, spec):
+    """ Answer with a synthetic response after the profile's full response time, WITHOUT streaming """
+    try:
+        failed, tokens = MockProfile.parse(spec).plan(messages)
+    except ValueError as e:
+        return f"Error: {str(e)}"
+
+    if failed:
+        return "Error: Mock provider injected failure"
+    time.sleep(sum(delay for delay, _ in tokens))
+    report_usage(prompt_tokens(messages), len(tokens))
+    return "".join(text for _, text in tokens)
+
+
+def get_mock_streaming(model, message, spec):
+    """Stream a synthetic response, token by token at the profile's pace."""
+    try:
+        failed, tokens = MockProfile.parse(spec).plan(message)
+        if failed:
+            yield "Error: Mock provider injected failure"
+            return
+
+        # Internal buffering mechanism, the same as the real providers use
+        buffer = ""
+        min_yield_size = 5  # Only yield when we have at least 5 characters
+        last_yield_time = time.time()
+        max_buffer_time = 0.1  # Yield at least every 100ms even if buffer is small
+
+        for delay, text in tokens:
+            if delay:
+                time.sleep(delay)
+            buffer += text
+            current_time = time.time()
+            time_since_last_yield = current_time - last_yield_time
+
+            # Yield when buffer reaches threshold OR if max time has passed since last yield
+            if len(buffer) >= min_yield_size or time_since_last_yield >= max_buffer_time:
+                yield buffer
+                buffer = ""
+                last_yield_time = current_time
+
+        # Yield any remaining text in buffer
+        if buffer:
+            yield buffer
+        report_usage(prompt_tokens(message), len(tokens))
+
+    except Exception as e:
+        error_msg = f"Error with Mock streaming: {str(e)}"
+        logger.error(error_msg)
+        yield error_msg
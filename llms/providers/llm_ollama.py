@@ -1,42 +1,39 @@
 import ollama
 import time
+import logging
 import requests
+from functools import lru_cache
 
+from ..usage import report_usage
+
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=16)
+def _get_client(port):
+    """ Get a shared Ollama client so connections are pooled across requests """
+    return ollama.Client(host=f"http://localhost:{port}")
 
-def check_ollama(port):
-    """ Check if Ollama is running and accessible on the specified port """
-    if not port:
-        return False
-        
-    try:
-        # Use a short timeout for the connection check
-        client = ollama.Client(host=f"http://localhost:{port}")
-        models = client.list()
-        return bool(models and models.get("models"))
-    except (requests.exceptions.ConnectionError, ConnectionRefusedError):
-        print(f"Ollama connection error: Could not connect to localhost:{port}")
-        return False
-    except Exception as e:
-        print(f"Ollama check error: {str(e)}")
-        return False
+
+@lru_cache(maxsize=16)
+def _get_list_client(port):
+    """ Get a shared Ollama client with a short timeout for liveness and model listing """
+    return ollama.Client(host=f"http://localhost:{port}", timeout=5.0)
 
 
 def get_available_models_ollama(port):
-    """ Get available Ollama models """
+    """ Get available Ollama models (errors are raised, for the circuit breaker) """
     if not port:
         return []
         
-    try:
-        client = ollama.Client(host=f"http://localhost:{port}")
-        models = client.list()
-        
-        if not models or not models.get("models"):
-            return []
-            
-        return [model["model"] for model in models["models"]]
-    except Exception as e:
-        print(f"Ollama list models error: {str(e)}")
+    client = _get_list_client(port)
+    models = client.list()
+    
+    if not models or not models.get("models"):
         return []
+        
+    return [model["model"] for model in models["models"]]
 
 
 def ollama_chat(model, messages, port):
@@ -45,8 +42,7 @@ def ollama_chat(model, messages, port):
         return "Error: Ollama port is not specified"
         
     try:
-        start_time = time.time()
-        client = ollama.Client(host=f"http://localhost:{port}")
+        client = _get_client(port)
         
         # Format messages for Ollama if needed
         formatted_messages = []
@@ -68,9 +64,7 @@ def ollama_chat(model, messages, port):
             },
         )
         
-        elapsed = time.time() - start_time
-        print(f"Ollama API call completed in {elapsed:.2f} seconds")
-        
+        report_usage(response.get("prompt_eval_count"), response.get("eval_count"))
         return response.message.content
     except requests.exceptions.Timeout:
         return "Error: The request to Ollama timed out. Please try again."
@@ -83,20 +77,11 @@ def ollama_chat(model, messages, port):
 def get_ollama_streaming(model, message, port):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        client = ollama.Client(host=f"http://localhost:{port}")
-        
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
+        client = _get_client(port)
         
         stream = client.chat(
             model=model,
-            messages=filtered_messages,
+            messages=message,  # Already reduced to role and content by llms.llm
             stream=True
         )
         
@@ -112,6 +97,9 @@ def get_ollama_streaming(model, message, port):
                 buffer += chunk["message"]["content"]
             elif "response" in chunk:
                 buffer += chunk["response"]
+            # The final chunk carries the token counts
+            if chunk.get("done"):
+                report_usage(chunk.get("prompt_eval_count"), chunk.get("eval_count"))
             current_time = time.time()
             time_since_last_yield = current_time - last_yield_time
             
@@ -127,5 +115,5 @@ def get_ollama_streaming(model, message, port):
 
     except Exception as e:
         error_msg = f"Error with Ollama streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg
\ No newline at end of file
@@ -1,38 +1,33 @@
 import openai
 import time
+import logging
+from functools import lru_cache
 
+from ..usage import report_usage
+
+
+logger = logging.getLogger(__name__)
 
-def check_openai(api_key):
-    """ Check if the OpenAI API key is valid """
-    if not api_key:
-        return False
-        
-    try:
-        client = openai.OpenAI(api_key=api_key, timeout=5.0)  # Add timeout
-        models = client.models.list()
-        return True if [model.id for model in models] else False
-    except Exception as e:
-        print(f"OpenAI API check error: {str(e)}")
-        return False
+
+@lru_cache(maxsize=16)
+def _get_client(api_key):
+    """ Get a shared OpenAI client so connections are pooled across requests """
+    return openai.OpenAI(api_key=api_key, timeout=60.0)  # 60 second timeout
 
 
 def get_available_models_openai(api_key):
-    """ Get the available models for the OpenAI API """
+    """ Get the available models for the OpenAI API (errors are raised, for the circuit breaker) """
     if not api_key:
         return []
         
-    try:
-        client = openai.OpenAI(api_key=api_key, timeout=5.0)  # Add timeout
-        models = client.models.list()
-        # Filter to include only GPT models for better performance
-        gpt_models = [model.id for model in models if 
-                     "gpt" in model.id.lower() or 
-                     "dall-e" in model.id.lower() or
-                     "dall-3" in model.id.lower()]
-        return gpt_models
-    except Exception as e:
-        print(f"OpenAI list models error: {str(e)}")
-        return []
+    client = _get_client(api_key).with_options(timeout=5.0)  # Short timeout for listing
+    models = client.models.list()
+    # Filter to include only GPT models for better performance
+    gpt_models = [model.id for model in models if 
+                 "gpt" in model.id.lower() or 
+                 "dall-e" in model.id.lower() or
+                 "dall-3" in model.id.lower()]
+    return gpt_models
 
 
 def openai_chat(model, messages, api_key):
@@ -41,8 +36,7 @@ def openai_chat(model, messages, api_key):
         return "Error: OpenAI API key is missing"
     
     try:
-        start_time = time.time()
-        client = openai.OpenAI(api_key=api_key, timeout=60.0)  # 60 second timeout
+        client = _get_client(api_key)
         
         # Format messages properly for OpenAI
         formatted_messages = []
@@ -63,9 +57,8 @@ def openai_chat(model, messages, api_key):
             timeout=60  # 60 seconds timeout
         )
         
-        elapsed = time.time() - start_time
-        print(f"OpenAI API call completed in {elapsed:.2f} seconds")
-        
+        if response.usage:
+            report_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
         return response.choices[0].message.content
     except openai.APITimeoutError:
         return "Error: The request to OpenAI timed out. Please try again."
@@ -82,21 +75,13 @@ def openai_chat(model, messages, api_key):
 def get_openai_streaming(model, message, api_key):
     """Get a streaming response from the specified LLM provider and model."""
     try:
-        client = openai.OpenAI(api_key=api_key)
-        
-        # Filter out 'id' field from messages to prevent API errors
-        filtered_messages = []
-        for msg in message:
-            filtered_msg = {
-                "role": msg["role"],
-                "content": msg["content"]
-            }
-            filtered_messages.append(filtered_msg)
+        client = _get_client(api_key)
         
         stream = client.chat.completions.create(
             model=model,
-            messages=filtered_messages,
-            stream=True
+            messages=message,  # Already reduced to role and content by llms.llm
+            stream=True,
+            stream_options={"include_usage": True}  # Usage arrives in a final chunk without choices
         )
         
         # Internal buffering mechanism for smoother streaming
@@ -107,8 +92,10 @@ def get_openai_streaming(model, message, api_key):
         
         # Process each chunk with buffering logic
         for chunk in stream:
-            if chunk.choices[0].delta.content:
+            if chunk.choices and chunk.choices[0].delta.content:
                 buffer += chunk.choices[0].delta.content
+            if chunk.usage:
+                report_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
             current_time = time.time()
             time_since_last_yield = current_time - last_yield_time
             
@@ -124,5 +111,5 @@ def get_openai_streaming(model, message, api_key):
 
     except Exception as e:
         error_msg = f"Error with OpenAI streaming: {str(e)}"
-        print(error_msg)  # Log the error
+        logger.error(error_msg)
         yield error_msg
\ No newline at end of file
@@ -0,0 +1,236 @@
+import importlib
+import logging
+from collections.abc import Mapping
+from importlib import metadata
+from typing import Any, Callable, Dict, Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# Entry point group third-party packages use to add providers, e.g. in pyproject.toml:
+#   [project.entry-points."promptly.providers"]
+#   "My Provider" = "my_package.promptly_plugin:PROVIDER"
+# where PROVIDER is a dict like the entries of BUILTIN_PROVIDERS (functions
+# given either as callables or, with "module", as attribute names). The target
+# module is imported the first time the provider's settings are read, which
+# is usually at startup to check its key, so it should only define the spec
+# and name its functions in "module" for its SDK to be imported on first use.
+ENTRY_POINT_GROUP = "promptly.providers"
+
+# Provider config keys holding functions, imported on first use
+FUNCTION_KEYS = ("models_func", "chat_func", "streaming_func")
+
+# Built-in providers. Only names are listed here so that no SDK is imported
+# until a provider is actually used.
+BUILTIN_PROVIDERS = {
+    "Ollama": {
+        "key_name": "ollama",
+        "module": "llms.providers.llm_ollama",
+        "models_func": "get_available_models_ollama",
+        "chat_func": "ollama_chat",
+        "streaming_func": "get_ollama_streaming",
+        "requires_key": False,  # Ollama just needs a port, not an API key
+    },
+    "Deepseek": {
+        "key_name": "deepseek",
+        "module": "llms.providers.llm_deepseek",
+        "models_func": "get_available_models_deepseek",
+        "chat_func": "deepseek_chat",
+        "streaming_func": "get_deepseek_streaming",
+        "requires_key": True,
+    },
+    "Mistral": {
+        "key_name": "mistral",
+        "module": "llms.providers.llm_mistral",
+        "models_func": "get_available_models_mistral",
+        "chat_func": "mistral_chat",
+        "streaming_func": "get_mistral_streaming",
+        "requires_key": True,
+    },
+    "Anthropic": {
+        "key_name": "anthropic",
+        "module": "llms.providers.llm_anthropic",
+        "models_func": "get_available_models_anthropic",
+        "chat_func": "anthropic_chat",
+        "streaming_func": "get_anthropic_streaming",
+        "requires_key": True,
+    },
+    "OpenAI": {
+        "key_name": "openai",
+        "module": "llms.providers.llm_openai",
+        "models_func": "get_available_models_openai",
+        "chat_func": "openai_chat",
+        "streaming_func": "get_openai_streaming",
+        "requires_key": True,
+    },
+    "Gemini": {
+        "key_name": "gemini",
+        "module": "llms.providers.llm_gemini",
+        "models_func": "get_available_models_gemini",
+        "chat_func": "gemini_chat",
+        "streaming_func": "get_gemini_streaming",
+        "requires_key": True,
+    },
+    "Mock": {
+        "key_name": "mock",
+        "module": "llms.providers.llm_mock",
+        "models_func": "get_available_models_mock",
+        "chat_func": "mock_chat",
+        "streaming_func": "get_mock_streaming",
+        "requires_key": True,  # The "key" is a timing profile such as "ttft=0.2,tps=50"; empty disables it
+    },
+}
+
+
+class ProviderLoadError(KeyError):
+    """A provider plugin's spec could not be loaded; the provider is left out."""
+
+
+class ProviderPlugin(Mapping):
+    """
+    A provider config that imports its functions on first access.
+
+    Reading plain settings such as "key_name" or "requires_key" never
+    imports anything; reading "chat_func" imports the provider module (and
+    with it the provider SDK) once. An entry point plugin's spec is loaded on
+    first access; if that fails the error is logged once and every access
+    raises ProviderLoadError.
+    """
+
+    def __init__(self, name: str, spec: Optional[Dict[str, Any]] = None, loader: Optional[Callable[[], Dict[str, Any]]] = None):
+        """
+        Args:
+            name: Display name of the provider
+            spec: Provider config, functions given as callables or names in spec["module"]
+            loader: Called once on first access to produce the spec (entry point plugins)
+        """
+        self.name = name
+        self._spec = dict(spec) if spec is not None else None
+        self._loader = loader
+        self._functions: Dict[str, Callable[..., Any]] = {}
+        self.error: Optional[str] = None
+
+    def _load_spec(self) -> Dict[str, Any]:
+        if self._spec is None:
+            if self.error is None:
+                try:
+                    spec = self._loader()
+                    if not isinstance(spec, dict):
+                        raise TypeError(f"must provide a dict, got {type(spec).__name__}")
+                    self._spec = dict(spec)
+                    return self._spec
+                except Exception as e:
+                    self.error = str(e) or type(e).__name__
+                    logger.error("Ignoring provider plugin %s: it could not be loaded (%s)", self.name, self.error)
+            raise ProviderLoadError(self.name)
+        return self._spec
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the provider's functions have been imported."""
+        return bool(self._functions)
+
+    @property
+    def usable(self) -> bool:
+        """Whether the provider's spec loads (loading it if needed)."""
+        try:
+            self._load_spec()
+        except ProviderLoadError:
+            return False
+        return True
+
+    def __getitem__(self, key: str) -> Any:
+        spec = self._load_spec()
+        if key not in FUNCTION_KEYS:
+            return spec[key]
+
+        if key not in self._functions:
+            func = spec[key]
+            if isinstance(func, str):
+                module = importlib.import_module(spec["module"])
+                func = getattr(module, func)
+            self._functions[key] = func
+        return self._functions[key]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load_spec())
+
+    def __len__(self) -> int:
+        return len(self._load_spec())
+
+
+def _provider_entry_points():
+    """Return installed provider entry points across importlib.metadata versions."""
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        return entry_points.select(group=ENTRY_POINT_GROUP)
+    return entry_points.get(ENTRY_POINT_GROUP, [])
+
+
+class ProviderRegistry(Mapping):
+    """
+    Mapping of provider name to ProviderPlugin, used as PROVIDER_CONFIGS.
+
+    Built-in providers are known up front; entry point plugins are looked up
+    the first time the registry is enumerated, and their specs and functions
+    are only loaded when used. A plugin whose spec cannot be loaded is left
+    out from then on: membership checks load the spec and answer False, and
+    enumeration skips it once it has failed. Code reading every provider's
+    settings should skip the ProviderLoadError of a plugin failing right then.
+    """
+
+    def __init__(self, builtins: Dict[str, Dict[str, Any]], group: str = ENTRY_POINT_GROUP):
+        self._providers: Dict[str, ProviderPlugin] = {
+            name: ProviderPlugin(name, spec) for name, spec in builtins.items()
+        }
+        self._group = group
+        self._entry_points_loaded = False
+
+    def _load_entry_points(self) -> None:
+        if self._entry_points_loaded:
+            return
+        self._entry_points_loaded = True
+        try:
+            entry_points = list(_provider_entry_points())
+        except Exception as e:
+            logger.error("Error reading provider plugins: %s", e)
+            return
+        for entry_point in entry_points:
+            if entry_point.name in self._providers:
+                logger.warning("Ignoring provider plugin %s: a provider with this name already exists", entry_point.name)
+                continue
+            self._providers[entry_point.name] = ProviderPlugin(entry_point.name, loader=entry_point.load)
+
+    def register(self, name: str, spec: Dict[str, Any]) -> None:
+        """
+        Register a provider at runtime.
+
+        Args:
+            name: Display name of the provider
+            spec: Provider config like the entries of BUILTIN_PROVIDERS
+        """
+        self._providers[name] = ProviderPlugin(name, spec)
+
+    def loaded_providers(self) -> list:
+        """Names of the providers whose modules have been imported."""
+        return [name for name, plugin in self._providers.items() if plugin.loaded]
+
+    def __getitem__(self, name: str) -> ProviderPlugin:
+        if name not in self._providers:
+            self._load_entry_points()
+        plugin = self._providers[name]
+        if plugin.error is not None:
+            raise ProviderLoadError(name)
+        return plugin
+
+    def __contains__(self, name: object) -> bool:
+        if name not in self._providers:
+            self._load_entry_points()
+        return name in self._providers and self._providers[name].usable
+
+    def __iter__(self) -> Iterator[str]:
+        self._load_entry_points()
+        return iter([name for name, plugin in self._providers.items() if plugin.error is None])
+
+    def __len__(self) -> int:
+        return len(list(iter(self)))
@@ -0,0 +1,295 @@
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from diagnostics.metrics import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = os.environ.get("PROMPTLY_DATA_DIR", "data")
+USAGE_FILE = os.path.join(DATA_DIR, "usage.json")
+
+# USD per million tokens as (input, output), matched by the longest model name prefix.
+# Override or extend with a [prices] table in secrets.toml, e.g.
+#   [prices."gpt-4o"]
+#   input = 2.5
+#   output = 10.0
+DEFAULT_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+    "o4-mini": (1.10, 4.40),
+    "o3-mini": (1.10, 4.40),
+    "o3": (2.00, 8.00),
+    "claude-opus-4": (15.00, 75.00),
+    "claude-sonnet-4": (3.00, 15.00),
+    "claude-3-7-sonnet": (3.00, 15.00),
+    "claude-3-5-sonnet": (3.00, 15.00),
+    "claude-3-5-haiku": (0.80, 4.00),
+    "claude-3-haiku": (0.25, 1.25),
+    "claude-3-opus": (15.00, 75.00),
+    "gemini-2.5-pro": (1.25, 10.00),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "mistral-large": (2.00, 6.00),
+    "mistral-medium": (0.40, 2.00),
+    "mistral-small": (0.10, 0.30),
+    "codestral": (0.30, 0.90),
+    "open-mistral-nemo": (0.15, 0.15),
+    "deepseek-chat": (0.27, 1.10),
+    "deepseek-reasoner": (0.55, 2.19),
+}
+
+# Providers running locally, whose calls cost nothing
+FREE_PROVIDERS = {"Ollama", "Mock"}
+
+_prices: Dict[str, Tuple[float, float]] = dict(DEFAULT_PRICES)
+
+# Token counts reported by the provider call running in this context
+_collector: contextvars.ContextVar = contextvars.ContextVar("promptly_usage_collector", default=None)
+
+
+class UsageReport(dict):
+    """Token counts reported by a provider, passed in-band after the last chunk of a stream."""
+
+
+def report_usage(prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+    """
+    Report the token counts of the provider call in progress.
+
+    Providers call this with the usage fields of their SDK; it does nothing
+    when no one is collecting.
+
+    Args:
+        prompt_tokens: Input tokens
+        completion_tokens: Output tokens
+    """
+    collected = _collector.get()
+    if collected is None:
+        return
+    if prompt_tokens is not None:
+        collected["prompt_tokens"] = int(prompt_tokens)
+    if completion_tokens is not None:
+        collected["completion_tokens"] = int(completion_tokens)
+
+
+@contextmanager
+def collect():
+    """
+    Collect the usage reported by provider calls made inside the block.
+
+    Yields:
+        UsageReport: Filled by report_usage(), empty if the provider reported nothing
+    """
+    collected = UsageReport()
+    token = _collector.set(collected)
+    try:
+        yield collected
+    finally:
+        _collector.reset(token)
+
+
+def set_prices(prices: Dict[str, Any]) -> None:
+    """
+    Override model prices, e.g. from the [prices] table of secrets.toml.
+
+    Args:
+        prices: Model name prefix to {"input": usd_per_million, "output": usd_per_million}
+    """
+    for prefix, price in prices.items():
+        try:
+            _prices[prefix] = (float(price["input"]), float(price["output"]))
+        except (KeyError, TypeError, ValueError):
+            logger.warning("Ignoring invalid price for %s: %s", prefix, price)
+
+
+def price_for(provider: str, model: str) -> Optional[Tuple[float, float]]:
+    """
+    Find the price of a model.
+
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+
+    Returns:
+        Optional[Tuple[float, float]]: USD per million input and output tokens, None if unknown
+    """
+    if provider in FREE_PROVIDERS:
+        return (0.0, 0.0)
+    name = model.lower().split("/")[-1]
+    matches = [prefix for prefix in _prices if name.startswith(prefix)]
+    return _prices[max(matches, key=len)] if matches else None
+
+
+def message_usage(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    text: str,
+    reported: Optional[Dict[str, int]] = None
+) -> Dict[str, Any]:
+    """
+    Build the usage record stored on an assistant message.
+
+    Token counts come from the provider when it reported them and are
+    estimated from the text otherwise.
+
+    Args:
+        provider: Name of the provider
+        model: Name of the model
+        messages: Messages sent to the provider
+        text: Response text
+        reported: Usage collected from the provider, if any
+
+    Returns:
+        Dict[str, Any]: prompt_tokens, completion_tokens, cost (USD, None if the price is unknown) and estimated
+    """
+    estimated = not reported or "completion_tokens" not in reported
+    if estimated:
+        prompt_tokens = sum(estimate_tokens(message.get("content", "")) for message in messages)
+        completion_tokens = estimate_tokens(text)
+    else:
+        prompt_tokens = reported.get("prompt_tokens", 0)
+        completion_tokens = reported["completion_tokens"]
+
+    price = price_for(provider, model)
+    cost = None
+    if price is not None:
+        cost = round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000, 6)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cost": cost,
+        "estimated": estimated,
+    }
+
+
+def shared_usage(usage: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Mark the usage of a response another caller's upstream call produced
+    (a coalesced request or a cache hit), so it is not billed twice.
+
+    Args:
+        usage: Record from message_usage()
+
+    Returns:
+        Dict[str, Any]: A copy with "shared": True
+    """
+    return dict(usage, shared=True)
+
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost": 0.0, "estimated": 0, "unpriced": 0,
+            "shared": 0}
+
+
+def _add(totals: Dict[str, Any], usage: Dict[str, Any]) -> None:
+    totals["requests"] += 1
+    if usage.get("shared"):
+        # Tokens and cost are counted with the caller whose call it was
+        totals["shared"] = totals.get("shared", 0) + 1
+        return
+    totals["prompt_tokens"] += usage["prompt_tokens"]
+    totals["completion_tokens"] += usage["completion_tokens"]
+    if usage["cost"] is None:
+        totals["unpriced"] += 1
+    else:
+        totals["cost"] = round(totals["cost"] + usage["cost"], 6)
+    if usage["estimated"]:
+        totals["estimated"] += 1
+
+
+class UsageLedger:
+    """
+    Running usage totals per chat, per provider and model, and per day.
+
+    Each recorded message updates the totals in place, so the dashboard
+    never rescans the history. Totals are saved to a small JSON file next
+    to the history.
+    """
+
+    def __init__(self, path: str = USAGE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data: Optional[Dict[str, Any]] = None
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the totals on first use. Caller holds the lock."""
+        if self._data is None:
+            try:
+                with open(self.path, "r") as f:
+                    self._data = json.load(f)
+            except FileNotFoundError:
+                self._data = {}
+            except (OSError, ValueError) as e:
+                logger.warning("Could not read usage totals, starting over: %s", e)
+                self._data = {}
+            for section in ("chats", "models", "days"):
+                self._data.setdefault(section, {})
+        return self._data
+
+    def _save(self) -> None:
+        """Write the totals atomically. Caller holds the lock."""
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._data, f, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not save usage totals: %s", e)
+
+    def record(self, chat_id: str, provider: str, model: str, usage: Dict[str, Any], timestamp: Optional[float] = None) -> None:
+        """
+        Add one message's usage to the totals.
+
+        Args:
+            chat_id: Chat the message belongs to
+            provider: Name of the provider
+            model: Name of the model
+            usage: Record from message_usage(), or shared_usage() for a response
+                billed to another caller (counted as a request of the chat, without tokens or cost)
+            timestamp: When the message was answered (default now)
+        """
+        day = time.strftime("%Y-%m-%d", time.localtime(timestamp))
+        with self._lock:
+            data = self._load()
+            _add(data["chats"].setdefault(str(chat_id), _empty_totals()), usage)
+            if not usage.get("shared"):
+                # A shared response made no upstream request of its own
+                _add(data["models"].setdefault(provider, {}).setdefault(model, _empty_totals()), usage)
+                _add(data["days"].setdefault(day, {}).setdefault(provider, _empty_totals()), usage)
+            self._save()
+
+    def forget_chat(self, chat_id: str) -> None:
+        """Drop a deleted chat's totals; provider and day totals keep its usage."""
+        with self._lock:
+            data = self._load()
+            if data["chats"].pop(str(chat_id), None) is not None:
+                self._save()
+
+    def totals(self) -> Dict[str, Any]:
+        """
+        Return a copy of every total.
+
+        Returns:
+            Dict[str, Any]: {"chats": {chat_id: totals}, "models": {provider: {model: totals}}, "days": {day: {provider: totals}}}
+        """
+        with self._lock:
+            return json.loads(json.dumps(self._load()))
+
+
+# Process-wide ledger shared by every session
+usage_ledger = UsageLedger()
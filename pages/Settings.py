@@ -3,6 +3,11 @@ import toml
 import os
 from pathlib import Path
 from state.state_manager import initialize_session_state
+from llms.llm import start_provider_discovery, get_provider_health
+from diagnostics.metrics import summary as metrics_summary, METRICS_FILE
+from history.store import chat_repository
+from history import archive
+from history.history import HISTORY_FORMATS, history_format
 from ui.components import render_chat_header
 
     
@@ -61,6 +66,14 @@ def show_settings():
             value=st.session_state.api_keys['ollama'],
             key="ollama_input",
         )
+        
+        st.session_state.api_keys['mock'] = st.text_input(
+            "Mock Provider Profile", 
+            value=st.session_state.api_keys['mock'],
+            key="mock_input",
+            help="Enables an offline provider with synthetic responses for testing and benchmarks, "
+                 "e.g. \"default\" or \"ttft=0.2,tps=50,jitter=0.1,tokens=120,error_rate=0\". Leave empty to disable."
+        )
 
         # App Settings section
         st.subheader("App Settings")
@@ -72,6 +85,15 @@ def show_settings():
             help="When enabled, responses will stream in real-time instead of waiting for complete responses",
             key="streaming_toggle"
         )
+        
+        # Add profiling toggle
+        st.session_state.app_settings['profile_reruns'] = st.toggle(
+            "Profile chat reruns",
+            value=st.session_state.app_settings.get('profile_reruns', False),
+            help="Profiles every run of the chat page and shows phase timings and the slowest functions "
+                 "in the chat sidebar. Adds overhead while enabled.",
+            key="profile_toggle"
+        )
 
         col1, col2 = st.columns(2)
         
@@ -79,11 +101,8 @@ def show_settings():
             if st.button("Save Settings", key="save_keys", use_container_width=True, type="primary"):
                 # Update secrets file (in development environment)
                 update_secrets_file(st.session_state.api_keys, st.session_state.app_settings)
-                # Clear any caches that depend on API keys
-                if 'cached_get_available_providers' in globals():
-                    globals()['cached_get_available_providers'].clear()
-                if 'cached_get_available_models' in globals():
-                    globals()['cached_get_available_models'].clear()
+                # Discover providers for the new keys in the background
+                start_provider_discovery(st.session_state.api_keys)
                 st.success("Settings saved successfully!")
         
         with col2:
@@ -91,16 +110,102 @@ def show_settings():
                 for key in st.session_state.api_keys:
                     st.session_state.api_keys[key] = '' if key != 'ollama' else '11434'
                 st.session_state.app_settings['use_streaming'] = False
+                st.session_state.app_settings['profile_reruns'] = False
                 update_secrets_file(st.session_state.api_keys, st.session_state.app_settings)
-                # Clear any caches that depend on API keys
-                if 'cached_get_available_providers' in globals():
-                    globals()['cached_get_available_providers'].clear()
-                if 'cached_get_available_models' in globals():
-                    globals()['cached_get_available_models'].clear()
+                # Discover providers for the new keys in the background
+                start_provider_discovery(st.session_state.api_keys)
                 st.success("Settings reset to defaults!")
                 st.rerun()
+
+        # Provider health section
+        st.subheader("Provider Health")
+        show_provider_health()
+
+        # Diagnostics section
+        st.subheader("Diagnostics")
+        with st.expander("Latency metrics"):
+            show_latency_metrics()
+        with st.expander("Memory"):
+            show_memory_stats()
+        with st.expander("Storage"):
+            show_storage_stats()
+
+
+def show_provider_health():
+    """Show circuit breaker state, error rate and latency for each provider."""
+    health = get_provider_health()
+    if not health:
+        st.info("No provider has been contacted yet.")
+        return
+    st.dataframe(health, hide_index=True, use_container_width=True)
+    if any(row["circuit"] != "closed" for row in health):
+        st.caption("Providers with an open circuit fail fast and are retried automatically.")
         
 
+def show_latency_metrics():
+    """Show per provider/model latency percentiles recorded by this server process."""
+    rows = metrics_summary()
+    if not rows:
+        st.info("No provider calls recorded since the server started.")
+        return
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+    st.caption(f"Prometheus metrics are written to {METRICS_FILE} and served on /metrics by the gateway.")
+
+
+def show_memory_stats():
+    """Show process memory and how many chats have their messages in memory."""
+    stats = chat_repository.memory_stats()
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Process RSS", f"{stats['rss_mb']} MB")
+    col2.metric("Resident messages", f"{stats['resident_mb']} / {stats['budget_mb']} MB")
+    col3.metric("Chats in memory", f"{stats['resident_chats']} / {stats['resident_chats'] + stats['evicted_chats']}")
+    st.caption(
+        f"{stats['evictions']} evictions and {stats['reloads']} reloads since the server started. "
+        "Messages of idle chats are evicted when over budget (PROMPTLY_MEMORY_BUDGET_MB) "
+        "and read back from the history file when the chat is opened. "
+        f"{stats['branch_mb']} MB of the resident messages are other branches (edited prompts, regenerated "
+        "answers), which stay in memory while their chat is in the history."
+    )
+
+
+def show_storage_stats():
+    """Show the disk used by the history file and by the compressed archive, and the history format."""
+    usage = chat_repository.storage_stats()
+    megabyte = 1024 * 1024
+    col1, col2 = st.columns(2)
+    col1.metric("History file", f"{usage['hot']['bytes'] / megabyte:.2f} MB", f"{usage['hot']['chats']} chats",
+                delta_color="off")
+    col2.metric("Archive", f"{usage['archive']['bytes'] / megabyte:.2f} MB",
+                f"{usage['archive']['chats']} chats, {usage['archive']['messages']} messages", delta_color="off")
+    retention = (
+        f"{archive.RETENTION_ACTION} after {archive.RETENTION_DAYS:g} days" if archive.RETENTION_DAYS > 0 else "kept"
+    )
+    st.caption(
+        f"Chats unchanged for {archive.ARCHIVE_AFTER_DAYS:g} days (PROMPTLY_ARCHIVE_AFTER_DAYS) move to "
+        f"compressed segments in {archive.ARCHIVE_DIR} and are restored when selected. "
+        f"Archived chats are {retention} (PROMPTLY_ARCHIVE_RETENTION_DAYS, PROMPTLY_ARCHIVE_RETENTION_ACTION)."
+    )
+    if st.button("Archive idle chats now", disabled=archive.ARCHIVE_AFTER_DAYS <= 0):
+        archived = chat_repository.archive_idle(force=True)
+        st.success(f"Archived {archived} chats.")
+
+    current_format = history_format()
+    labels = {"json": "JSON (history.json)", "binary": "Binary (history.pack, msgpack with an offset index)"}
+    selected_format = st.selectbox(
+        "History format",
+        HISTORY_FORMATS,
+        index=HISTORY_FORMATS.index(current_format),
+        format_func=labels.get,
+        help="The binary format loads faster and reads one chat without parsing the others. "
+             "Changing it converts the history file.",
+        key="history_format_select"
+    )
+    if selected_format != current_format:
+        with st.spinner("Converting the history..."):
+            chat_repository.convert_history(selected_format)
+        st.success(f"History converted to {labels[selected_format]}.")
+
+
 @st.cache_data(ttl=60)  # Cache writes to the secrets file to prevent frequent disk I/O
 def update_secrets_file(api_keys, app_settings):
     """
@@ -132,12 +237,14 @@ def update_secrets_file(api_keys, app_settings):
         secrets["api_keys"]["mistral"] = api_keys["mistral"]
         secrets["api_keys"]["deepseek"] = api_keys["deepseek"]
         secrets["api_keys"]["ollama"] = api_keys["ollama"]
+        secrets["api_keys"]["mock"] = api_keys["mock"]
         
         # Update app settings
         if "app_settings" not in secrets:
             secrets["app_settings"] = {}
             
         secrets["app_settings"]["use_streaming"] = app_settings["use_streaming"]
+        secrets["app_settings"]["profile_reruns"] = app_settings.get("profile_reruns", False)
         
         # Write back to file
         with open(secrets_file, "w") as f:
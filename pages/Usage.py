@@ -0,0 +1,79 @@
+import streamlit as st
+from state.state_manager import initialize_session_state
+from llms.usage import usage_ledger, USAGE_FILE
+from ui.components import render_chat_header
+
+
+render_chat_header()
+
+
+def _row(totals):
+    """Flatten a totals record for display."""
+    return {
+        "requests": totals["requests"],
+        "prompt_tokens": totals["prompt_tokens"],
+        "completion_tokens": totals["completion_tokens"],
+        "cost_usd": round(totals["cost"], 4),
+        "estimated": totals["estimated"],
+        "shared": totals.get("shared", 0),
+    }
+
+
+def show_usage():
+    """Show token usage and cost per day, per provider and model, and per chat."""
+    initialize_session_state()
+
+    st.header("Usage")
+
+    totals = usage_ledger.totals()
+    model_rows = [
+        dict(provider=provider, model=model, **_row(model_totals))
+        for provider, models in totals["models"].items()
+        for model, model_totals in models.items()
+    ]
+    if not model_rows:
+        st.info("No usage recorded yet. Token counts are recorded with every assistant message.")
+        return
+
+    # Overall totals
+    columns = st.columns(4)
+    columns[0].metric("Cost (USD)", f"{sum(row['cost_usd'] for row in model_rows):.4f}")
+    columns[1].metric("Requests", sum(row["requests"] for row in model_rows))
+    columns[2].metric("Prompt tokens", sum(row["prompt_tokens"] for row in model_rows))
+    columns[3].metric("Completion tokens", sum(row["completion_tokens"] for row in model_rows))
+
+    st.subheader("Per day")
+    day_rows = [
+        dict(day=day, provider=provider, **_row(day_totals))
+        for day, providers in sorted(totals["days"].items())
+        for provider, day_totals in providers.items()
+    ]
+    st.bar_chart(day_rows, x="day", y="cost_usd", color="provider")
+    st.dataframe(day_rows[::-1], hide_index=True, use_container_width=True)
+
+    st.subheader("Per provider and model")
+    st.dataframe(
+        sorted(model_rows, key=lambda row: row["cost_usd"], reverse=True),
+        hide_index=True, use_container_width=True
+    )
+
+    st.subheader("Per chat")
+    chats = st.session_state.chats
+    chat_rows = [
+        dict(chat=chats[chat_id].get("title", chat_id) if chat_id in chats else chat_id, **_row(chat_totals))
+        for chat_id, chat_totals in totals["chats"].items()
+    ]
+    st.dataframe(
+        sorted(chat_rows, key=lambda row: row["cost_usd"], reverse=True),
+        hide_index=True, use_container_width=True
+    )
+
+    st.caption(
+        "Token counts come from the providers; \"estimated\" counts requests whose usage was not reported "
+        "and was estimated from the text; \"shared\" counts answers reused from an identical request of another "
+        "session (coalesced or cached), whose tokens and cost are counted once, with that session. Costs use the price table in llms/usage.py, overridable with a "
+        f"[prices] table in secrets.toml. Totals are stored in {USAGE_FILE}."
+    )
+
+
+show_usage()
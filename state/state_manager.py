@@ -1,15 +1,31 @@
 import streamlit as st
-import gc
+import os
 import time
-import hashlib
+import logging
 from typing import Dict, List, Any, Tuple, Optional, Callable
 
-from history.history import load_chats, save_chats, add_message
-from llms.llm import cached_llm_response, get_llm_response_streaming
+from history.store import chat_repository
+from llms.llm import cached_llm_response, get_llm_response_with_usage, get_llm_response_streaming, record_queue_wait
+from llms.usage import usage_ledger, set_prices
+from diagnostics.tracing import traced
+from diagnostics.logging_setup import configure_logging, request_context
+
+logger = logging.getLogger(__name__)
+
+# Seconds between saves of an answer being streamed: a restart or a
+# disconnect loses at most that much of it (0 saves it only when it ends)
+CHECKPOINT_SECONDS = float(os.environ.get("PROMPTLY_CHECKPOINT_SECONDS", "2") or 0)
+
+# Sent after an interrupted answer to have the model finish it, never saved
+CONTINUE_PROMPT = ("Your previous answer was interrupted. Continue it exactly where it stopped, "
+                   "without repeating any of it and without any introduction.")
 
 
 def initialize_session_state() -> None:
     """Initialize all required session state variables if they don't exist."""
+    # Route log records through the background writer (once per process)
+    configure_logging()
+    
     # Initialize API keys
     if 'api_keys' not in st.session_state:
         st.session_state.api_keys = {
@@ -18,34 +34,36 @@ def initialize_session_state() -> None:
             'gemini': st.secrets.get("api_keys", {}).get("gemini", ""),
             'mistral': st.secrets.get("api_keys", {}).get("mistral", ""),
             'deepseek': st.secrets.get("api_keys", {}).get("deepseek", ""),
-            'ollama': st.secrets.get("api_keys", {}).get("ollama", "11434")
+            'ollama': st.secrets.get("api_keys", {}).get("ollama", "11434"),
+            'mock': st.secrets.get("api_keys", {}).get("mock", "")
         }
     
     # Initialize app settings
     if 'app_settings' not in st.session_state:
         st.session_state.app_settings = {
-            'use_streaming': st.secrets.get("app_settings", {}).get("use_streaming", False)
+            'use_streaming': st.secrets.get("app_settings", {}).get("use_streaming", False),
+            'profile_reruns': st.secrets.get("app_settings", {}).get("profile_reruns", False)
         }
-    
-    # Initialize chat state
-    if 'chats' not in st.session_state:
-        # Load chats from persistent storage
-        chats, chat_counter = load_chats()
-        st.session_state.chats = chats
-        st.session_state.chat_counter = chat_counter
         
-        # Ensure all messages have IDs
-        for chat_id, chat_data in st.session_state.chats.items():
-            for i, message in enumerate(chat_data.get("messages", [])):
-                if "id" not in message:
-                    # Create a stable ID based on position and content hash
-                    content_hash = hashlib.md5(message.get("content", "").encode()).hexdigest()
-                    message["id"] = f"{i}_{content_hash}"
-    
-    # Initialize active chat
-    if 'active_chat_id' not in st.session_state:
+        # Model prices overriding the built-in table
+        set_prices(st.secrets.get("prices", {}))
+    
+    # Save the answers a crashed or restarted process was generating
+    chat_repository.recover_partials()
+    
+    # Refresh the chats from the shared repository on every run, so chats
+    # created or deleted by other sessions show up. The session only holds
+    # references to the shared chat records.
+    st.session_state.chats = chat_repository.snapshot()
+    
+    # Initialize active chat, or move off a chat another session deleted
+    if st.session_state.get('active_chat_id') not in st.session_state.chats:
         st.session_state.active_chat_id = next(iter(st.session_state.chats)) if st.session_state.chats else None
     
+    # The active chat is the last one to be evicted from memory
+    if st.session_state.active_chat_id is not None:
+        chat_repository.touch(st.session_state.active_chat_id)
+    
     # Initialize processing state
     if 'processing' not in st.session_state:
         st.session_state.processing = False
@@ -67,8 +85,28 @@ def initialize_session_state() -> None:
 
 
 def clean_memory() -> None:
-    """Perform garbage collection to free memory."""
-    gc.collect()
+    """Evict the messages of idle chats when the resident messages exceed the memory budget."""
+    chat_repository.enforce_budget()
+
+
+def archive_idle_chats() -> None:
+    """Move chats idle past the archive age to the compressed archive (at most once an hour per process)."""
+    if chat_repository.archive_idle():
+        st.session_state.chats = chat_repository.snapshot()
+        if st.session_state.active_chat_id not in st.session_state.chats:
+            st.session_state.active_chat_id = next(iter(st.session_state.chats)) if st.session_state.chats else None
+
+
+def restore_chat(chat_id: str) -> None:
+    """
+    Bring an archived chat back and select it.
+
+    Args:
+        chat_id: The ID of the archived chat
+    """
+    if chat_repository.restore_chat(chat_id):
+        st.session_state.chats = chat_repository.snapshot()
+        select_chat(chat_id)
 
 
 def create_new_chat() -> str:
@@ -78,27 +116,13 @@ def create_new_chat() -> str:
     Returns:
         str: The ID of the newly created chat
     """
-    # Create a new unique chat ID
-    new_chat_id = f"chat_{st.session_state.chat_counter}"
-    
-    # Initialize the new chat
-    st.session_state.chats[new_chat_id] = {
-        "chat_started": False,
-        "messages": [],
-        "selected_provider": None,
-        "selected_model": None,
-        "title": "New Chat"
-    }
+    # Create and save the chat, with an ID unique across sessions
+    new_chat_id = chat_repository.create_chat()
+    st.session_state.chats = chat_repository.snapshot()
     
     # Set the new chat as active
     st.session_state.active_chat_id = new_chat_id
     
-    # Increment the counter
-    st.session_state.chat_counter += 1
-    
-    # Save to persistent storage
-    save_chats(st.session_state.chats, st.session_state.chat_counter)
-    
     return new_chat_id
 
 
@@ -125,19 +149,15 @@ def delete_chat(chat_id: str) -> None:
     Args:
         chat_id: The ID of the chat to delete
     """
-    # Remove the chat
-    if chat_id in st.session_state.chats:
-        del st.session_state.chats[chat_id]
+    # Remove and save the chat
+    if chat_repository.delete_chat(chat_id):
+        st.session_state.chats = chat_repository.snapshot()
         
         # If this was the active chat, set active to None or next available
         if st.session_state.active_chat_id == chat_id:
             st.session_state.active_chat_id = next(iter(st.session_state.chats)) if st.session_state.chats else None
         
-        # Save to persistent storage
-        save_chats(st.session_state.chats, st.session_state.chat_counter)
-        
-        # Force garbage collection
-        clean_memory()
+        usage_ledger.forget_chat(chat_id)
         
         # Set deletion flag to trigger rerun
         st.session_state.deleted_chat = True
@@ -151,19 +171,11 @@ def start_chat(provider: str, model: str) -> None:
         provider: The selected provider
         model: The selected model
     """
-    active_chat = st.session_state.chats[st.session_state.active_chat_id]
-    
-    # Update chat data
-    active_chat["chat_started"] = True
-    active_chat["selected_provider"] = provider
-    active_chat["selected_model"] = model
-    active_chat["messages"] = []
-    active_chat["title"] = f"{provider} - {model}"
-    
-    # Save to persistent storage
-    save_chats(st.session_state.chats, st.session_state.chat_counter)
+    # Update and save the chat
+    chat_repository.start_chat(st.session_state.active_chat_id, provider, model)
 
 
+@traced("state.add_user_message")
 def add_user_message(message: str) -> None:
     """
     Add a user message to the active chat.
@@ -174,13 +186,9 @@ def add_user_message(message: str) -> None:
     if not message:
         return
         
-    active_chat = st.session_state.chats[st.session_state.active_chat_id]
-    
-    # Create message ID
-    message_id = time.time()  # Use timestamp as a unique message ID
-    
-    # Add user message to history
-    active_chat["messages"].append({"role": "user", "content": message, "id": message_id})
+    # Add user message to history and save it, the repository gives it the chat's next ID
+    if not chat_repository.append_message(st.session_state.active_chat_id, {"role": "user", "content": message}):
+        return
     
     # Keep the completed responses set from growing too large
     if len(st.session_state.completed_responses) > 100:
@@ -188,17 +196,81 @@ def add_user_message(message: str) -> None:
         completed_list = list(st.session_state.completed_responses)
         st.session_state.completed_responses = set(completed_list[-50:])
     
-    # Save to persistent storage
-    save_chats(st.session_state.chats, st.session_state.chat_counter)
-    
     # Set processing state
     st.session_state.processing = True
     st.session_state.processing_chat_id = st.session_state.active_chat_id
+    st.session_state.processing_queued_at = time.time()
+
+
+def pending_request(active_chat: Dict[str, Any]) -> Optional[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]]:
+    """
+    Get the messages to send for the response being processed.
+    
+    That is the chat's messages when the last one is a prompt. When the
+    last one is an interrupted answer the user chose to continue, it is the
+    chat's messages and an instruction to finish that answer.
+    
+    Args:
+        active_chat: The chat being answered
+        
+    Returns:
+        Optional[Tuple]: The messages and the interrupted answer (None for a new answer), None if there is nothing to answer
+    """
+    messages = active_chat["messages"]
+    if not messages:
+        return None
+    last_message = messages[-1]
+    if last_message["role"] == "user":
+        # A copy: the answer's checkpoints are added to the chat while it is sent
+        return list(messages), None
+    if last_message.get("incomplete") and last_message.get("id") == st.session_state.get('continue_message_id'):
+        return list(messages) + [{"role": "user", "content": CONTINUE_PROMPT}], last_message
+    return None
+
+
+class ResponseCheckpoint:
+    """
+    Saves an answer while it is generated to its checkpoint file, marked
+    incomplete, at most every CHECKPOINT_SECONDS, then to the history once
+    it ends or is interrupted.
+    
+    When continuing an interrupted answer, the text generated is added to
+    that answer's message.
+    """
+
+    def __init__(self, chat_id: str, partial: Optional[Dict[str, Any]] = None):
+        self.prefix = partial["content"] if partial is not None else ""
+        self.message_id = partial["id"] if partial is not None else None
+        self.name = chat_repository.start_partial(chat_id, self.message_id)
+        self._saved_at = time.monotonic()
+
+    def update(self, text: str) -> None:
+        """Checkpoint the text generated so far if the last checkpoint is old enough."""
+        if CHECKPOINT_SECONDS > 0 and text and time.monotonic() - self._saved_at >= CHECKPOINT_SECONDS:
+            chat_repository.save_partial(self.name, self.prefix + text)
+            self._saved_at = time.monotonic()
+
+    def interrupt(self, text: str) -> None:
+        """Save the text generated so far to the history as the incomplete answer."""
+        if text:
+            self.message_id = chat_repository.keep_partial(self.name, self.prefix + text)
+        else:
+            chat_repository.discard_partial(self.name)
+
+    @property
+    def saved(self) -> bool:
+        """Whether an incomplete answer is in the history."""
+        return self.message_id is not None
+
+    def complete(self, text: str, usage: Optional[Dict[str, Any]] = None) -> None:
+        """Save the whole answer."""
+        chat_repository.complete_message(self.name, self.prefix + text, usage)
 
 
 def process_assistant_response() -> bool:
     """
-    Process the assistant's response to the last user message.
+    Process the assistant's response to the last user message, or the
+    continuation of an interrupted answer.
     
     Returns:
         bool: True if processing was successful, False otherwise
@@ -212,15 +284,17 @@ def process_assistant_response() -> bool:
     active_chat = st.session_state.chats[st.session_state.active_chat_id]
     
     try:
-        # Check if we have a user message to respond to
-        if not active_chat["messages"] or active_chat["messages"][-1]["role"] != "user":
+        # Check if we have a user message to respond to, or an answer to continue
+        request = pending_request(active_chat)
+        st.session_state.pop('continue_message_id', None)
+        if request is None:
             st.session_state.processing = False
             st.session_state.processing_chat_id = None
             return False
+        messages, partial = request
             
-        # Create a unique response ID based on the last user message
-        last_user_msg = active_chat["messages"][-1]
-        response_id = f"{st.session_state.processing_chat_id}_{last_user_msg['id']}"
+        # Create a unique response ID based on the last message
+        response_id = f"{st.session_state.processing_chat_id}_{active_chat['messages'][-1]['id']}"
         
         # Skip if we've already processed this response
         if response_id in st.session_state.completed_responses:
@@ -228,30 +302,40 @@ def process_assistant_response() -> bool:
             st.session_state.processing_chat_id = None
             return False
         
-        # Get the full response at once (non-streaming)
-        response = cached_llm_response(
-            active_chat["selected_provider"], 
-            active_chat["selected_model"], 
-            active_chat["messages"], 
-            st.session_state.api_keys
+        record_queue_wait(
+            active_chat["selected_provider"],
+            active_chat["selected_model"],
+            time.time() - st.session_state.get('processing_queued_at', time.time())
         )
         
+        # Get the full response at once (non-streaming), bypassing the cache for a regenerated answer
+        respond = get_llm_response_with_usage if st.session_state.pop('regenerate', False) else cached_llm_response
+        with request_context(response_id, st.session_state.processing_chat_id):
+            response, response_usage = respond(
+                active_chat["selected_provider"], 
+                active_chat["selected_model"], 
+                messages, 
+                st.session_state.api_keys
+            )
+        
         # Add assistant response to history
-        message_id = time.time()  # Use timestamp as a unique message ID
-        active_chat["messages"].append({"role": "assistant", "content": response, "id": message_id})
+        if response_usage:
+            usage_ledger.record(
+                st.session_state.processing_chat_id,
+                active_chat["selected_provider"],
+                active_chat["selected_model"],
+                response_usage
+            )
+        ResponseCheckpoint(st.session_state.processing_chat_id, partial).complete(response, response_usage)
         
         # Mark this response as completed to prevent duplicates
         st.session_state.completed_responses.add(response_id)
         
-        # Save to persistent storage
-        save_chats(st.session_state.chats, st.session_state.chat_counter)
-        
         return True
         
     except Exception as e:
         # Handle errors gracefully
         error_message = f"Error: Failed to get response from {active_chat['selected_provider']} - {active_chat['selected_model']}. {str(e)}"
-        message_id = time.time()  # Use timestamp as a unique message ID
         
         # Create a unique response ID for error handling
         if active_chat["messages"] and active_chat["messages"][-1]["role"] == "user":
@@ -260,14 +344,14 @@ def process_assistant_response() -> bool:
             
             # Only add error message if we haven't processed this response yet
             if response_id not in st.session_state.completed_responses:
-                active_chat["messages"].append({"role": "assistant", "content": error_message, "id": message_id})
+                chat_repository.append_message(
+                    st.session_state.processing_chat_id,
+                    {"role": "assistant", "content": error_message}
+                )
                 st.session_state.completed_responses.add(response_id)
-                
-                # Save to persistent storage since we had an error
-                save_chats(st.session_state.chats, st.session_state.chat_counter)
         
         # Log the error
-        print(f"Error in LLM response: {str(e)}")
+        logger.error("Error in LLM response: %s", e)
         return False
     finally:
         # Set processing to False ONLY for the current processing_chat_id
@@ -276,6 +360,76 @@ def process_assistant_response() -> bool:
             st.session_state.processing_chat_id = None
 
 
+def switch_branch(message_id: Any) -> None:
+    """
+    Show another version of a message of the active chat, and the messages that follow it.
+    
+    Args:
+        message_id: The ID of the version to show
+    """
+    chat_repository.switch_branch(st.session_state.active_chat_id, message_id)
+
+
+def edit_message(message_id: Any, content: str) -> None:
+    """
+    Send an edited version of a prompt; the original stays available as a branch.
+    
+    Args:
+        message_id: The ID of the user message edited
+        content: The new prompt
+    """
+    if st.session_state.processing or not content:
+        return
+    if chat_repository.branch_before(st.session_state.active_chat_id, message_id):
+        add_user_message(content)
+
+
+def regenerate_response(message_id: Any) -> None:
+    """
+    Ask for a new version of an answer; the original stays available as a branch.
+    
+    Args:
+        message_id: The ID of the assistant message to regenerate
+    """
+    if st.session_state.processing:
+        return
+    chat_id = st.session_state.active_chat_id
+    if not chat_repository.branch_before(chat_id, message_id):
+        return
+    
+    messages = chat_repository.get(chat_id)["messages"]
+    if not messages or messages[-1]["role"] != "user":
+        return
+    
+    # Answer the prompt again, without the cached answer
+    st.session_state.completed_responses.discard(f"{chat_id}_{messages[-1]['id']}")
+    st.session_state.regenerate = True
+    st.session_state.processing = True
+    st.session_state.processing_chat_id = chat_id
+    st.session_state.processing_queued_at = time.time()
+
+
+def continue_response(message_id: Any) -> None:
+    """
+    Ask for the rest of an interrupted answer, added to it once generated.
+    
+    Args:
+        message_id: The ID of the incomplete assistant message, the last of the active chat
+    """
+    if st.session_state.processing:
+        return
+    chat_id = st.session_state.active_chat_id
+    messages = chat_repository.get(chat_id)["messages"]
+    if not messages or messages[-1].get("id") != message_id or not messages[-1].get("incomplete"):
+        return
+    
+    st.session_state.completed_responses.discard(f"{chat_id}_{message_id}")
+    st.session_state.continue_message_id = message_id
+    st.session_state.processing = True
+    st.session_state.processing_chat_id = chat_id
+    st.session_state.processing_queued_at = time.time()
+
+
 def get_chat_list_data() -> List[Tuple[str, Dict]]:
     """
     Get the list of chats data without any UI elements.
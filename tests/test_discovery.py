@@ -0,0 +1,60 @@
+import time
+
+from llms import discovery
+from llms.discovery import ProviderDiscovery
+
+
+CONFIGS = {"X": {"key_name": "x_key"}}
+API_KEYS = {"x_key": "secret"}
+
+
+def _discovery(tmp_path, listings):
+    """A discovery service answering listings in turn (the last one repeated), None meaning a failed listing."""
+    def list_models(provider, api_keys):
+        return listings.pop(0) if len(listings) > 1 else listings[0]
+    return ProviderDiscovery(CONFIGS, list_models, str(tmp_path / "discovery.json"))
+
+
+def _age(service: ProviderDiscovery, seconds: float) -> None:
+    for entry in service.entries.values():
+        entry["fetched_at"] -= seconds
+
+
+def test_failed_refresh_keeps_the_stale_listing(tmp_path):
+    service = _discovery(tmp_path, [["m1", "m2"], None])
+    assert service.models("X", API_KEYS) == ["m1", "m2"]
+
+    _age(service, discovery.DISCOVERY_TTL + 1)
+    assert service.discover("X", API_KEYS) == ["m1", "m2"]
+    assert service.models("X", API_KEYS, wait=False) == ["m1", "m2"]
+    assert service.providers(API_KEYS) == ["X"]
+
+
+def test_failed_refresh_after_max_stale_drops_the_listing(tmp_path):
+    service = _discovery(tmp_path, [["m1"], None])
+    service.discover("X", API_KEYS)
+
+    _age(service, discovery.DISCOVERY_MAX_STALE + 1)
+    assert service.discover("X", API_KEYS) == []
+    entry = next(iter(service.entries.values()))
+    assert entry["models"] == [] and time.time() - entry["fetched_at"] < 5
+
+
+def test_successful_empty_listing_replaces_the_previous_one(tmp_path):
+    service = _discovery(tmp_path, [["m1"], []])
+    service.discover("X", API_KEYS)
+    assert service.discover("X", API_KEYS) == []
+    assert service.providers(API_KEYS) == []
+
+
+def test_open_circuit_keeps_the_cached_listing(tmp_path, monkeypatch):
+    from llms import llm
+
+    service = ProviderDiscovery(llm.PROVIDER_CONFIGS, llm.list_provider_models, str(tmp_path / "discovery.json"))
+    api_keys = {"mock": "default"}
+    models = service.discover("Mock", api_keys)
+    assert models
+
+    monkeypatch.setattr(llm.provider_health, "allow", lambda provider: False)
+    assert llm.list_provider_models("Mock", api_keys) is None
+    assert service.discover("Mock", api_keys) == models
@@ -0,0 +1,25 @@
+import os
+import sys
+import subprocess
+
+from benchmarks.bench_import_time import IMPORT_BUDGET_MS, SDK_MODULES, parse_importtime
+
+
+ENTRY_STATEMENT = "import llms.llm, state.state_manager"
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_startup_imports_no_provider_sdk_within_budget():
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", ENTRY_STATEMENT],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=REPO_DIR
+    )
+    cumulative = parse_importtime(result.stderr)
+
+    assert [sdk for sdk in SDK_MODULES if sdk in cumulative] == []
+    total_ms = (cumulative["llms.llm"] + cumulative["state.state_manager"]) / 1000
+    assert total_ms < IMPORT_BUDGET_MS
@@ -0,0 +1,56 @@
+import logging
+
+from llms import registry
+from llms.registry import ProviderRegistry
+
+
+class FakeEntryPoint:
+    """An installed entry point whose target is produced by a function."""
+
+    def __init__(self, name, target):
+        self.name = name
+        self.target = target
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return self.target()
+
+
+def _registry(monkeypatch, *entry_points):
+    monkeypatch.setattr(registry, "_provider_entry_points", lambda: list(entry_points))
+    return ProviderRegistry({"Builtin": {"key_name": "builtin", "requires_key": True}})
+
+
+def _broken():
+    raise ImportError("No module named 'missing_sdk'")
+
+
+def test_enumerating_does_not_load_plugin_specs(monkeypatch):
+    plugin = FakeEntryPoint("Plugin", lambda: {"key_name": "plugin", "requires_key": True})
+    providers = _registry(monkeypatch, plugin)
+
+    assert list(providers) == ["Builtin", "Plugin"]
+    assert plugin.loads == 0
+    assert providers["Plugin"]["key_name"] == "plugin"
+    assert plugin.loads == 1
+
+
+def test_broken_plugin_is_left_out_on_first_use(monkeypatch, caplog):
+    broken = FakeEntryPoint("Broken", _broken)
+    not_a_dict = FakeEntryPoint("NotADict", lambda: ["key_name"])
+    providers = _registry(monkeypatch, broken, not_a_dict)
+    assert list(providers) == ["Builtin", "Broken", "NotADict"]
+
+    with caplog.at_level(logging.ERROR, logger="llms.registry"):
+        assert "Broken" not in providers
+        assert "Broken" not in providers
+        assert "NotADict" not in providers
+
+    assert list(providers) == ["Builtin"]
+    assert len(providers) == 1
+    assert broken.loads == 1
+    assert [record.getMessage().split(":")[0] for record in caplog.records] == [
+        "Ignoring provider plugin Broken",
+        "Ignoring provider plugin NotADict",
+    ]
@@ -0,0 +1,67 @@
+import io
+import json
+import random
+
+from history.transfer import JsonStream
+
+
+def _walk(stream: JsonStream):
+    """Read a document through the stream the way the importers do: containers walked, other values decoded."""
+    character = stream.peek()
+    if character == "[":
+        return [_walk(stream) for _ in _iter_items(stream)]
+    if character == "{":
+        document = {}
+        for key in stream.iter_object():
+            document[key] = _walk(stream)
+        return document
+    return stream.value()
+
+
+def _iter_items(stream: JsonStream):
+    # iter_array() decodes its items whole; walk nested containers item by item instead
+    stream.expect("[")
+    if stream.peek() == "]":
+        stream.expect("]")
+        return
+    while True:
+        yield
+        if stream.expect(",]") == "]":
+            return
+
+
+def _random_value(rng: random.Random, depth: int = 0):
+    kind = rng.randrange(8 if depth < 3 else 5)
+    if kind == 0:
+        return rng.randint(-10 ** 6, 10 ** 6)
+    if kind == 1:
+        return rng.choice([12.75, -0.5, 1e-7, 6.02e23, 3.0, rng.uniform(-1000, 1000)])
+    if kind == 2:
+        return rng.choice([True, False, None])
+    if kind == 3:
+        return "".join(rng.choice("ab \"\\é\n") for _ in range(rng.randrange(6)))
+    if kind == 4:
+        return rng.randint(0, 9)
+    if kind in (5, 6):
+        return [_random_value(rng, depth + 1) for _ in range(rng.randrange(5))]
+    return {f"k{index}": _random_value(rng, depth + 1) for index in range(rng.randrange(4))}
+
+
+def test_float_split_after_the_point():
+    for chunk_size in range(1, 8):
+        assert list(JsonStream(io.StringIO("[12.75]"), chunk_size=chunk_size).iter_array()) == [12.75]
+
+
+def test_numbers_cut_at_every_position():
+    text = "[12.75, -3e+5, 1E-2, 0, 4.0e10, 7]"
+    for chunk_size in range(1, len(text) + 1):
+        assert list(JsonStream(io.StringIO(text), chunk_size=chunk_size).iter_array()) == json.loads(text)
+
+
+def test_walk_matches_json_loads():
+    rng = random.Random(1)
+    for _ in range(300):
+        document = [_random_value(rng) for _ in range(rng.randrange(1, 6))]
+        text = json.dumps(document, separators=rng.choice([(",", ":"), (", ", ": ")]))
+        for chunk_size in (1, 2, 3, 5, 8):
+            assert _walk(JsonStream(io.StringIO(text), chunk_size=chunk_size)) == json.loads(text), (text, chunk_size)
@@ -0,0 +1,102 @@
+"""
+Import and export conversation archives without loading them into memory.
+
+`import` reads a ChatGPT or Claude data export (conversations.json) or a
+Promptly history (history.json, history.pack or an export of this tool),
+gzip-compressed or not, one conversation at a time, and adds its chats to
+the history in batches. Conversations already in the history are skipped
+(by a digest of their messages), so an import can be run again safely.
+
+`export` writes every chat, archived ones included, to one history.json
+file (gzip-compressed if the name ends with .gz) for backup or for
+importing on another machine.
+
+Both are safe while the app is running.
+
+Usage:
+    python -m tools.archive_io import conversations.json [--provider Anthropic --model claude-sonnet-4-5]
+    python -m tools.archive_io export backup.json.gz [--no-archived]
+"""
+import os
+import sys
+import argparse
+from typing import Any, Dict
+
+from diagnostics.logging_setup import configure_logging
+
+
+def format_import_progress(stats: Dict[str, Any]) -> str:
+    """One progress line of an import."""
+    megabyte = 1024 * 1024
+    percent = stats["bytes_read"] / stats["total_bytes"] if stats["total_bytes"] else 1
+    return (f"{percent:6.1%} {stats['bytes_read'] / megabyte:,.0f}/{stats['total_bytes'] / megabyte:,.0f} MB read, "
+            f"{stats['imported']} chats imported ({stats['messages']} messages), {stats['duplicates']} duplicates, "
+            f"{stats['empty']} empty skipped, {stats['seconds']}s")
+
+
+def format_export_progress(stats: Dict[str, Any]) -> str:
+    """One progress line of an export."""
+    return f"{stats['chats']} chats ({stats['archived']} archived), {stats['messages']} messages, {stats['seconds']}s"
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Import and export conversation archives.")
+    parser.add_argument("--data-dir", help="Data directory (default: PROMPTLY_DATA_DIR or data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Add the conversations of an archive to the history")
+    import_parser.add_argument("archive", help="ChatGPT or Claude conversations.json, or a Promptly history or export")
+    import_parser.add_argument("--provider", help="Provider of chats whose archive does not name one")
+    import_parser.add_argument("--model", help="Model of chats whose archive does not name one")
+    import_parser.add_argument("--batch-chats", type=int, default=500, help="Chats per history save (default: 500)")
+    import_parser.add_argument("--batch-mb", type=float, default=64,
+                               help="Megabytes of messages per history save (default: 64)")
+
+    export_parser = commands.add_parser("export", help="Write every chat to a history.json file")
+    export_parser.add_argument("output", help="Output file, gzip-compressed if it ends with .gz")
+    export_parser.add_argument("--no-archived", action="store_true", help="Leave the archived chats out")
+    args = parser.parse_args(argv)
+
+    if args.data_dir:
+        # Read when the history modules are imported
+        os.environ["PROMPTLY_DATA_DIR"] = args.data_dir
+    configure_logging()
+    from history import transfer
+    from history.store import chat_repository
+
+    try:
+        if args.command == "import":
+            if args.batch_chats < 1:
+                parser.error("--batch-chats must be at least 1")
+            stats = transfer.import_archive(
+                args.archive,
+                chat_repository,
+                provider=args.provider,
+                model=args.model,
+                batch_chats=args.batch_chats,
+                batch_mb=args.batch_mb,
+                on_progress=lambda stats: print(format_import_progress(stats), flush=True),
+            )
+            print(f"Imported {stats['imported']} chats from {args.archive}")
+        else:
+            stats = transfer.export_history(
+                args.output,
+                include_archived=not args.no_archived,
+                on_progress=lambda stats: print(format_export_progress(stats), flush=True),
+            )
+            print(f"Exported {stats['chats']} chats to {args.output} ({stats['bytes']} bytes)")
+    except KeyboardInterrupt:
+        if args.command == "import":
+            print("Interrupted - the chats imported so far are saved; run the import again to continue.", file=sys.stderr)
+        else:
+            print("Interrupted - nothing was written.", file=sys.stderr)
+        return 130
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
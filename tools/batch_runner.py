@@ -0,0 +1,323 @@
+"""
+Headless batch runner for JSONL prompt files.
+
+Each input line is a JSON object describing one conversation:
+
+    {"id": "q-001", "provider": "OpenAI", "model": "gpt-4o-mini",
+     "messages": [{"role": "user", "content": "Hello"}]}
+
+`id` defaults to the line number, `provider` and `model` default to the
+--provider/--model options. Results are appended to the output JSONL as soon
+as they complete, so an interrupted run can be restarted with the same
+arguments and only the missing (or failed) records are sent again.
+
+Usage:
+    python -m tools.batch_runner prompts.jsonl results.jsonl --concurrency 4
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import concurrent.futures
+from typing import Dict, Any, Iterator, Optional, Set, Tuple
+
+from llms.llm import PROVIDER_CONFIGS, get_llm_response_with_usage, record_queue_wait
+from tools.common import DEFAULT_SECRETS_FILE, load_api_keys, percentile
+from diagnostics.logging_setup import configure_logging, request_context
+
+
+# Number of latency samples kept for percentiles, whatever the input size
+LATENCY_RESERVOIR_SIZE = 10000
+
+# Print a progress line every N completed records
+PROGRESS_EVERY = 100
+
+
+def iter_records(
+    input_file: str,
+    default_provider: Optional[str],
+    default_model: Optional[str]
+) -> Iterator[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Stream records from a JSONL file one line at a time.
+
+    Args:
+        input_file: Path to the input JSONL file
+        default_provider: Provider used when a record does not name one
+        default_model: Model used when a record does not name one
+
+    Yields:
+        Tuple of (record, error). Exactly one of the two is set.
+    """
+    with open(input_file, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield None, f"line {line_number}: invalid JSON ({e})"
+                continue
+            if not isinstance(record, dict):
+                yield None, f"line {line_number}: invalid record (expected a JSON object)"
+                continue
+
+            record.setdefault("id", str(line_number))
+            record["id"] = str(record["id"])
+            record.setdefault("provider", default_provider)
+            record.setdefault("model", default_model)
+
+            if record["provider"] not in PROVIDER_CONFIGS:
+                yield None, f"line {line_number}: unknown provider {record['provider']}"
+            elif not record["model"]:
+                yield None, f"line {line_number}: no model given"
+            elif not isinstance(record.get("messages"), list) or not record["messages"]:
+                yield None, f"line {line_number}: no messages given"
+            else:
+                yield record, None
+
+
+def load_completed_ids(output_file: str, retry_errors: bool) -> Set[str]:
+    """
+    Read the ids already present in a previous output file.
+
+    Args:
+        output_file: Path to the output JSONL file
+        retry_errors: When True, failed records are not considered completed
+
+    Returns:
+        Set[str]: Ids of records that should not be sent again
+    """
+    completed = set()
+    if not os.path.exists(output_file):
+        return completed
+
+    with open(output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A partially written last line from an interrupted run
+                continue
+            if retry_errors and result.get("status") != "ok":
+                completed.discard(str(result.get("id")))
+            else:
+                completed.add(str(result.get("id")))
+    return completed
+
+
+class BatchStats:
+    """Thread-safe counters and a fixed-size latency reservoir."""
+
+    def __init__(self, reservoir_size: int = LATENCY_RESERVOIR_SIZE):
+        self.lock = threading.Lock()
+        self.reservoir_size = reservoir_size
+        self.latencies = []
+        self.completed = 0
+        self.errors = 0
+        self.skipped = 0
+        self.started_at = time.time()
+
+    def record(self, latency: float, ok: bool) -> None:
+        """Record one finished request."""
+        with self.lock:
+            self.completed += 1
+            if not ok:
+                self.errors += 1
+            # Reservoir sampling keeps memory flat on arbitrarily long runs
+            if len(self.latencies) < self.reservoir_size:
+                self.latencies.append(latency)
+            else:
+                slot = random.randrange(self.completed)
+                if slot < self.reservoir_size:
+                    self.latencies[slot] = latency
+
+    def summary(self) -> Dict[str, float]:
+        """Return throughput and latency percentiles for the run so far."""
+        with self.lock:
+            latencies = sorted(self.latencies)
+            completed = self.completed
+            errors = self.errors
+            skipped = self.skipped
+        elapsed = max(time.time() - self.started_at, 1e-9)
+        return {
+            "completed": completed,
+            "errors": errors,
+            "skipped": skipped,
+            "elapsed": elapsed,
+            "throughput": completed / elapsed,
+            "p50": percentile(latencies, 0.50),
+            "p90": percentile(latencies, 0.90),
+            "p99": percentile(latencies, 0.99),
+            "max": latencies[-1] if latencies else 0.0,
+        }
+
+
+def format_summary(summary: Dict[str, float]) -> str:
+    """Format a summary dictionary as a single log line."""
+    return (
+        f"{summary['completed']} done ({summary['errors']} errors, {summary['skipped']} skipped) "
+        f"in {summary['elapsed']:.1f}s - {summary['throughput']:.2f} req/s - "
+        f"latency p50 {summary['p50']:.2f}s p90 {summary['p90']:.2f}s "
+        f"p99 {summary['p99']:.2f}s max {summary['max']:.2f}s"
+    )
+
+
+def run_record(record: Dict[str, Any], api_keys: Dict[str, str], queued_at: float) -> Dict[str, Any]:
+    """
+    Send one conversation to its provider.
+
+    Args:
+        record: Input record with provider, model and messages
+        api_keys: Dictionary of API keys
+        queued_at: time.time() when the record was queued
+
+    Returns:
+        Dict[str, Any]: Result record written to the output file
+    """
+    started_at = time.time()
+    record_queue_wait(record["provider"], record["model"], started_at - queued_at)
+    with request_context(record["id"], record["id"]):
+        response, response_usage = get_llm_response_with_usage(
+            record["provider"],
+            record["model"],
+            record["messages"],
+            api_keys,
+            chat_id=record["id"]
+        )
+    latency = time.time() - started_at
+
+    # Providers report failures as "Error..." strings rather than exceptions
+    status = "error" if response.startswith("Error") else "ok"
+    return {
+        "id": record["id"],
+        "provider": record["provider"],
+        "model": record["model"],
+        "status": status,
+        "response": response,
+        "latency": round(latency, 4),
+        "started_at": started_at,
+        "usage": response_usage,
+    }
+
+
+def run_batch(
+    input_file: str,
+    output_file: str,
+    api_keys: Dict[str, str],
+    concurrency: int = 4,
+    default_provider: Optional[str] = None,
+    default_model: Optional[str] = None,
+    retry_errors: bool = False
+) -> Dict[str, float]:
+    """
+    Run every record of a JSONL file and append the results to another.
+
+    Each provider gets its own pool of `concurrency` workers and at most
+    `concurrency` queued records, so the reader only runs ahead of the
+    workers by a bounded amount and memory does not grow with the input.
+
+    Args:
+        input_file: Path to the input JSONL file
+        output_file: Path to the output JSONL file (appended to)
+        api_keys: Dictionary of API keys
+        concurrency: Maximum concurrent requests per provider
+        default_provider: Provider for records that do not name one
+        default_model: Model for records that do not name one
+        retry_errors: Send records that failed in a previous run again
+
+    Returns:
+        Dict[str, float]: Final run summary
+    """
+    completed_ids = load_completed_ids(output_file, retry_errors)
+    stats = BatchStats()
+    write_lock = threading.Lock()
+    executors = {}
+    slots = {}
+
+    def on_done(future, record, output):
+        slots[record["provider"]].release()
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"id": record["id"], "provider": record["provider"], "model": record["model"],
+                      "status": "error", "response": f"Error: {str(e)}", "latency": 0.0}
+
+        stats.record(result["latency"], result["status"] == "ok")
+        with write_lock:
+            output.write(json.dumps(result, ensure_ascii=False) + "\n")
+            output.flush()
+
+        if stats.completed % PROGRESS_EVERY == 0:
+            print(format_summary(stats.summary()), file=sys.stderr)
+
+    with open(output_file, "a", encoding="utf-8") as output:
+        try:
+            for record, error in iter_records(input_file, default_provider, default_model):
+                if error:
+                    print(f"Skipping {error}", file=sys.stderr)
+                    continue
+                if record["id"] in completed_ids:
+                    stats.skipped += 1
+                    continue
+
+                provider = record["provider"]
+                if provider not in executors:
+                    executors[provider] = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=concurrency,
+                        thread_name_prefix=f"batch-{PROVIDER_CONFIGS[provider]['key_name']}"
+                    )
+                    slots[provider] = threading.BoundedSemaphore(concurrency * 2)
+
+                # Block the reader while this provider already has enough work queued
+                slots[provider].acquire()
+                future = executors[provider].submit(run_record, record, api_keys, time.time())
+                future.add_done_callback(lambda f, r=record: on_done(f, r, output))
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+    return stats.summary()
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Run a JSONL file of conversations through Promptly providers.")
+    parser.add_argument("input", help="Input JSONL file, one conversation per line")
+    parser.add_argument("output", help="Output JSONL file, appended to and used to resume")
+    parser.add_argument("--provider", choices=list(PROVIDER_CONFIGS.keys()), help="Default provider")
+    parser.add_argument("--model", help="Default model")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent requests per provider (default: 4)")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_FILE, help="secrets.toml holding the API keys")
+    parser.add_argument("--retry-errors", action="store_true", help="Send records that failed in a previous run again")
+    args = parser.parse_args(argv)
+
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+
+    configure_logging()
+    api_keys = load_api_keys(args.secrets)
+    try:
+        summary = run_batch(
+            args.input,
+            args.output,
+            api_keys,
+            concurrency=args.concurrency,
+            default_provider=args.provider,
+            default_model=args.model,
+            retry_errors=args.retry_errors
+        )
+    except KeyboardInterrupt:
+        print("Interrupted - rerun the same command to resume.", file=sys.stderr)
+        return 130
+
+    print(format_summary(summary))
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
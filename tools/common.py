@@ -0,0 +1,52 @@
+import os
+import toml
+from typing import Dict
+
+
+DEFAULT_SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+
+# Same defaults as initialize_session_state, so tools and the UI agree
+DEFAULT_API_KEYS = {
+    'openai': "",
+    'anthropic': "",
+    'gemini': "",
+    'mistral': "",
+    'deepseek': "",
+    'ollama': "11434",
+    'mock': "",
+}
+
+
+def load_api_keys(secrets_file: str = DEFAULT_SECRETS_FILE) -> Dict[str, str]:
+    """
+    Load the API keys saved by the Settings page.
+    
+    Args:
+        secrets_file: Path to the secrets.toml file
+        
+    Returns:
+        Dict[str, str]: Dictionary of API keys keyed like st.session_state.api_keys
+    """
+    api_keys = dict(DEFAULT_API_KEYS)
+    if os.path.exists(secrets_file):
+        secrets = toml.load(secrets_file)
+        for key_name, value in secrets.get("api_keys", {}).items():
+            api_keys[key_name] = str(value)
+    return api_keys
+
+
+def percentile(sorted_values, fraction: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    
+    Args:
+        sorted_values: Sorted list of numbers
+        fraction: Percentile as a fraction between 0 and 1
+        
+    Returns:
+        float: The percentile value, or 0.0 for an empty list
+    """
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
@@ -0,0 +1,90 @@
+"""
+Convert chat histories between the JSON and the binary format.
+
+With --to only, converts the history of the data directory in place, under
+the history lock, so it is safe while the app is running; the running
+server processes switch to the new file on their next access. The same
+conversion is available in Settings -> Diagnostics -> Storage.
+
+With an input and an output file, converts a copy (a backup, or a history
+from another machine) without touching the data directory. The output
+format is --to, or taken from the output's extension (.pack is binary).
+
+Usage:
+    python -m tools.convert_history --to binary [--data-dir data]
+    python -m tools.convert_history history.json history.pack
+"""
+import os
+import sys
+import json
+import argparse
+from typing import Any, Dict
+
+
+def read_history_file(path: str) -> Dict[str, Any]:
+    """Read a history file in either format."""
+    from history import binary
+
+    with open(path, "rb") as f:
+        head = f.read(len(binary.MAGIC))
+    if binary.is_binary(head):
+        with binary.BinaryHistory(path) as history:
+            return history.read_history()
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def write_history_file(path: str, history: Dict[str, Any], file_format: str) -> None:
+    """Write a history file in a format, through a temporary file."""
+    from history import binary
+
+    tmp_file = f"{path}.{os.getpid()}.tmp"
+    if file_format == "binary":
+        with open(tmp_file, "wb") as f:
+            binary.write_history(f, history, {})
+    else:
+        with open(tmp_file, "w") as f:
+            json.dump(history, f)
+    os.replace(tmp_file, path)
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Convert chat histories between the JSON and the binary format.")
+    parser.add_argument("input", nargs="?", help="History file to convert (default: the data directory's history)")
+    parser.add_argument("output", nargs="?", help="File to write the converted history to")
+    parser.add_argument("--to", choices=["json", "binary"], help="Format to convert to")
+    parser.add_argument("--data-dir", help="Data directory converted in place (default: PROMPTLY_DATA_DIR or data)")
+    args = parser.parse_args(argv)
+
+    if args.input:
+        if not args.output:
+            parser.error("an output file is needed with an input file")
+        file_format = args.to or ("binary" if args.output.endswith(".pack") else "json")
+        history = read_history_file(args.input)
+        write_history_file(args.output, history, file_format)
+        messages = sum(len(chat.get("messages", [])) for chat in history.get("chats", {}).values())
+        print(f"Wrote {len(history.get('chats', {}))} chats and {messages} messages to {args.output} ({file_format}), "
+              f"{os.path.getsize(args.input)} -> {os.path.getsize(args.output)} bytes")
+        return 0
+
+    if not args.to:
+        parser.error("--to is needed to convert the data directory")
+    if args.data_dir:
+        # Read when the history modules are imported
+        os.environ["PROMPTLY_DATA_DIR"] = args.data_dir
+    from history.history import history_file
+    from history.store import ChatRepository
+
+    repository = ChatRepository()
+    old_file = history_file()
+    old_size = os.path.getsize(old_file) if os.path.exists(old_file) else 0
+    if not repository.convert_history(args.to):
+        print(f"The history is already in the {args.to} format")
+        return 0
+    print(f"Converted {old_file} to {history_file()}, {old_size} -> {os.path.getsize(history_file())} bytes")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
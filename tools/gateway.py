@@ -0,0 +1,296 @@
+"""
+OpenAI-compatible local gateway on top of the Promptly provider layer.
+
+Exposes `GET /v1/models` and `POST /v1/chat/completions` (with `"stream": true`
+Server-Sent Events) so other services can use every provider configured in
+Settings through one endpoint, plus Prometheus metrics on `GET /metrics`. Models are addressed as `<provider>/<model>`
+using the provider key names, e.g. `ollama/llama3` or `openai/gpt-4o-mini`.
+
+Usage:
+    python -m tools.gateway --port 8000
+"""
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import threading
+import concurrent.futures
+from typing import Any, Dict, List, Optional, Tuple
+
+from llms.llm import (
+    PROVIDER_CONFIGS,
+    get_available_providers,
+    get_available_models,
+    get_llm_response_with_usage,
+    get_llm_response_streaming,
+    start_provider_discovery,
+    start_health_monitor,
+    record_queue_wait
+)
+from diagnostics.metrics import render_prometheus
+from diagnostics.logging_setup import configure_logging, request_context
+from tools.common import DEFAULT_SECRETS_FILE, load_api_keys
+from tools.http_server import (
+    HttpError,
+    HttpRequest,
+    serve,
+    send_json,
+    send_text,
+    send_event,
+    start_stream,
+    error_payload
+)
+
+
+# Chunks buffered per streaming connection before the provider thread waits for the client
+STREAM_QUEUE_SIZE = 64
+
+# Chat id used by get_llm_response for requests coming through the gateway
+GATEWAY_CHAT_ID = "gateway"
+
+
+def openai_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """Convert a usage record from llms.usage to OpenAI's usage object."""
+    if not usage:
+        return None
+    return {
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "total_tokens": usage["prompt_tokens"] + usage["completion_tokens"],
+    }
+
+
+class Gateway:
+    """Request dispatcher shared by every connection of the server."""
+
+    def __init__(self, api_keys: Dict[str, str], token: Optional[str] = None):
+        self.api_keys = api_keys
+        self.token = token
+        self.key_to_provider = {}
+        for name, config in PROVIDER_CONFIGS.items():
+            try:
+                self.key_to_provider[config["key_name"]] = name
+            except KeyError:
+                # Provider plugin that could not be loaded (already logged)
+                pass
+
+    def resolve_model(self, model_id: str) -> Tuple[str, str]:
+        """
+        Split a `<provider>/<model>` id into the provider name and model name.
+
+        Args:
+            model_id: Model id sent by the client
+
+        Returns:
+            Tuple[str, str]: Provider name and provider model name
+        """
+        key_name, _, model = (model_id or "").partition("/")
+        provider = self.key_to_provider.get(key_name.lower())
+        if not provider or not model:
+            raise HttpError(404, f"Unknown model '{model_id}'. Use '<provider>/<model>', see /v1/models.")
+        return provider, model
+
+    async def list_models(self) -> List[Dict[str, Any]]:
+        """List the models of every available provider from provider discovery."""
+        loop = asyncio.get_running_loop()
+        providers = await loop.run_in_executor(None, get_available_providers, self.api_keys)
+        listings = await asyncio.gather(*[
+            loop.run_in_executor(None, get_available_models, provider, self.api_keys)
+            for provider in providers
+        ])
+
+        created = int(time.time())
+        models = []
+        for provider, provider_models in zip(providers, listings):
+            key_name = PROVIDER_CONFIGS[provider]["key_name"]
+            for model in provider_models:
+                models.append({
+                    "id": f"{key_name}/{model}",
+                    "object": "model",
+                    "created": created,
+                    "owned_by": provider,
+                })
+        return models
+
+    async def handle(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        """Route one request. Returns whether the connection can be reused."""
+        if self.token and request.headers.get("authorization") != f"Bearer {self.token}":
+            raise HttpError(401, "Invalid or missing bearer token")
+
+        if request.path == "/v1/models":
+            if request.method != "GET":
+                raise HttpError(405, "Use GET")
+            models = await self.list_models()
+            await send_json(writer, 200, {"object": "list", "data": models})
+            return True
+
+        if request.path == "/metrics":
+            await send_text(writer, 200, render_prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+            return True
+
+        if request.path == "/v1/chat/completions":
+            if request.method != "POST":
+                raise HttpError(405, "Use POST")
+            return await self.chat_completions(request, writer)
+
+        raise HttpError(404, f"No route for {request.path}")
+
+    async def chat_completions(self, request: HttpRequest, writer: asyncio.StreamWriter) -> bool:
+        """Handle POST /v1/chat/completions, streaming or not."""
+        body = request.json()
+        if not isinstance(body, dict):
+            raise HttpError(400, "Body must be a JSON object")
+        messages = body.get("messages")
+        if not isinstance(messages, list) or not messages:
+            raise HttpError(400, "'messages' must be a non-empty list")
+
+        model_id = body.get("model")
+        provider, model = self.resolve_model(model_id)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        queued_at = time.perf_counter()
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            await self.stream_completion(
+                writer, completion_id, created, model_id, provider, model, messages, queued_at, include_usage
+            )
+            return False
+
+        def respond():
+            # Time spent waiting for a free worker thread
+            record_queue_wait(provider, model, time.perf_counter() - queued_at)
+            with request_context(completion_id, GATEWAY_CHAT_ID):
+                return get_llm_response_with_usage(provider, model, messages, self.api_keys, GATEWAY_CHAT_ID)
+
+        loop = asyncio.get_running_loop()
+        response, response_usage = await loop.run_in_executor(None, respond)
+        if response.startswith("Error"):
+            await send_json(writer, 502, error_payload(response, "upstream_error"), request.keep_alive)
+            return True
+
+        await send_json(writer, 200, {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model_id,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": response},
+                "finish_reason": "stop",
+            }],
+            "usage": openai_usage(response_usage),
+        }, request.keep_alive)
+        return True
+
+    async def stream_completion(
+        self,
+        writer: asyncio.StreamWriter,
+        completion_id: str,
+        created: int,
+        model_id: str,
+        provider: str,
+        model: str,
+        messages: List[Dict[str, Any]],
+        queued_at: float,
+        include_usage: bool = False
+    ) -> None:
+        """Relay a provider stream to the client as OpenAI chat.completion.chunk events."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        cancelled = threading.Event()
+        done = object()
+        response_usage = {}
+
+        def produce():
+            # Runs in a worker thread: the provider SDKs are synchronous
+            with request_context(completion_id, GATEWAY_CHAT_ID):
+                record_queue_wait(provider, model, time.perf_counter() - queued_at)
+                generator = get_llm_response_streaming(
+                    provider, model, messages, self.api_keys, usage_out=response_usage
+                )
+                try:
+                    for chunk in generator:
+                        if cancelled.is_set():
+                            break
+                        # Wait for room in the queue so a slow client slows the upstream read
+                        asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+                except Exception as e:
+                    asyncio.run_coroutine_threadsafe(queue.put(f"Error: {str(e)}"), loop).result()
+                finally:
+                    generator.close()
+                    asyncio.run_coroutine_threadsafe(queue.put(done), loop).result()
+
+        def chunk_event(delta: Dict[str, str], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model_id,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        await start_stream(writer)
+        producer = loop.run_in_executor(None, produce)
+        try:
+            await send_event(writer, chunk_event({"role": "assistant"}))
+            while True:
+                chunk = await queue.get()
+                if chunk is done:
+                    break
+                await send_event(writer, chunk_event({"content": chunk}))
+            await send_event(writer, chunk_event({}, "stop"))
+            await producer
+            if include_usage:
+                # Like OpenAI: a last chunk without choices carrying the usage
+                await send_event(writer, dict(chunk_event({}), choices=[], usage=openai_usage(response_usage)))
+            await send_event(writer, "[DONE]")
+        except (ConnectionError, asyncio.CancelledError):
+            cancelled.set()
+            # Drain so the producer thread never blocks on a full queue
+            while not producer.done():
+                try:
+                    queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    await asyncio.sleep(0.01)
+            raise
+        await producer
+
+
+async def run_server(gateway: Gateway, host: str, port: int, workers: int) -> None:
+    """Run the gateway until interrupted."""
+    loop = asyncio.get_running_loop()
+    # Each in-flight upstream call holds one thread, size the pool for the expected concurrency
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(
+        max_workers=workers, thread_name_prefix="gateway"
+    ))
+    start_provider_discovery(gateway.api_keys)
+    start_health_monitor(gateway.api_keys)
+    server = await serve(gateway.handle, host, port)
+    print(f"Promptly gateway listening on http://{host}:{port}/v1")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve the Promptly providers through an OpenAI-compatible API.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8000, help="Port to bind (default: 8000)")
+    parser.add_argument("--workers", type=int, default=512, help="Maximum concurrent upstream calls (default: 512)")
+    parser.add_argument("--secrets", default=DEFAULT_SECRETS_FILE, help="secrets.toml holding the API keys")
+    parser.add_argument("--token", help="Require this bearer token from clients")
+    args = parser.parse_args(argv)
+
+    configure_logging()
+    gateway = Gateway(load_api_keys(args.secrets), token=args.token)
+    try:
+        asyncio.run(run_server(gateway, args.host, args.port, args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+"""
+Minimal asyncio HTTP/1.1 server primitives shared by the command-line servers.
+
+Only what the gateway and stub servers need is implemented: request parsing
+with Content-Length bodies, keep-alive JSON responses and close-delimited
+streaming responses (Server-Sent Events and newline-delimited JSON).
+"""
+import json
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+
+
+logger = logging.getLogger(__name__)
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    401: "Unauthorized",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    500: "Internal Server Error",
+    502: "Bad Gateway",
+    503: "Service Unavailable",
+}
+
+
+class HttpError(Exception):
+    """An error that maps directly to an HTTP error response."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class HttpRequest:
+    """A parsed HTTP request."""
+
+    def __init__(self, method: str, target: str, headers: Dict[str, str], body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        self.headers = headers
+        self.body = body
+
+    @property
+    def keep_alive(self) -> bool:
+        """Whether the client allows the connection to be reused."""
+        return self.headers.get("connection", "").lower() != "close"
+
+    def json(self) -> Any:
+        """Decode the request body as JSON."""
+        try:
+            return json.loads(self.body or b"null")
+        except json.JSONDecodeError as e:
+            raise HttpError(400, f"Invalid JSON body: {e}")
+
+
+async def read_request(reader: asyncio.StreamReader) -> Optional[HttpRequest]:
+    """
+    Read one request from the connection.
+
+    Args:
+        reader: The connection's stream reader
+
+    Returns:
+        Optional[HttpRequest]: The request, or None when the client closed the connection
+    """
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        if e.partial.strip():
+            raise HttpError(400, "Incomplete request")
+        return None
+    except asyncio.LimitOverrunError:
+        raise HttpError(413, "Request headers too large")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, _version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    for line in lines[1:]:
+        if not line:
+            continue
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HttpError(400, "Invalid Content-Length")
+    if length < 0:
+        raise HttpError(400, "Invalid Content-Length")
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b""
+
+    return HttpRequest(method.upper(), target, headers, body)
+
+
+def _head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Unknown')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def send_json(writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool = True) -> None:
+    """Send a complete JSON response."""
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    writer.write(_head(status, {
+        "Content-Type": "application/json",
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive" if keep_alive else "close",
+    }) + body)
+    await writer.drain()
+
+
+async def send_text(writer: asyncio.StreamWriter, status: int, text: str, content_type: str = "text/plain; charset=utf-8") -> None:
+    """Send a complete plain text response."""
+    body = text.encode("utf-8")
+    writer.write(_head(status, {
+        "Content-Type": content_type,
+        "Content-Length": str(len(body)),
+        "Connection": "keep-alive",
+    }) + body)
+    await writer.drain()
+
+
+async def start_stream(writer: asyncio.StreamWriter, content_type: str = "text/event-stream") -> None:
+    """Start a streaming response delimited by closing the connection."""
+    writer.write(_head(200, {
+        "Content-Type": content_type,
+        "Cache-Control": "no-cache",
+        "Connection": "close",
+    }))
+    await writer.drain()
+
+
+async def send_event(writer: asyncio.StreamWriter, data: Any) -> None:
+    """Send one Server-Sent Event; strings are sent verbatim, anything else as JSON."""
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    writer.write(f"data: {data}\n\n".encode("utf-8"))
+    await writer.drain()
+
+
+async def send_ndjson(writer: asyncio.StreamWriter, data: Any) -> None:
+    """Send one newline-delimited JSON record."""
+    writer.write((json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8"))
+    await writer.drain()
+
+
+def error_payload(message: str, error_type: str = "invalid_request_error") -> Dict[str, Any]:
+    """Build an OpenAI-style error body."""
+    return {"error": {"message": message, "type": error_type}}
+
+
+Handler = Callable[[HttpRequest, asyncio.StreamWriter], Awaitable[bool]]
+
+
+async def serve(handler: Handler, host: str, port: int, backlog: int = 1024) -> asyncio.AbstractServer:
+    """
+    Start serving connections with the given request handler.
+
+    The handler writes the response itself and returns whether the
+    connection may be reused for another request.
+
+    Args:
+        handler: Coroutine called once per request
+        host: Interface to bind
+        port: Port to bind
+        backlog: Listen backlog for bursts of new connections
+
+    Returns:
+        asyncio.AbstractServer: The started server
+    """
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as e:
+                    await send_json(writer, e.status, error_payload(e.message), keep_alive=False)
+                    break
+                if request is None:
+                    break
+                try:
+                    keep_alive = await handler(request, writer)
+                except HttpError as e:
+                    await send_json(writer, e.status, error_payload(e.message), keep_alive=request.keep_alive)
+                    keep_alive = True
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    logger.exception("Error handling %s %s", request.method, request.path)
+                    # The handler may have started its response: close the connection after this one
+                    await send_json(writer, 500, error_payload(f"Internal error: {e}", "server_error"), keep_alive=False)
+                    break
+                if not (keep_alive and request.keep_alive):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle_connection, host, port, limit=MAX_HEADER_BYTES, backlog=backlog)
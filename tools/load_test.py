@@ -0,0 +1,431 @@
+"""
+Multi-session load test of the chat app against the Mock provider.
+
+Runs N simulated browser sessions of Chat.py in one process, as one
+Streamlit server would, using Streamlit's headless app testing (AppTest).
+Every session follows the same flow:
+
+    open the app -> create --chats chats with the Mock provider ->
+    send --messages messages, switching to another chat every --switch-every
+
+Sessions start --ramp seconds apart at most and share the data directory,
+so they also compete for data/history.json like real sessions do.
+
+Reported:
+
+- throughput: answered messages and user actions per second
+- latency: p50/p95/p99/max per action (send covers the whole response)
+- server RSS: at start, peak and end, sampled every --rss-interval seconds
+- history writes: count, duration percentiles, writes that overlapped
+  another write, and messages missing from the history file at the end
+
+Usage:
+    python -m tools.load_test --sessions 20 --messages 10 --profile "ttft=0.2,tps=50"
+    python -m tools.load_test --sessions 50 --streaming --output load_test.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import psutil
+
+from tools.common import percentile
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP_FILE = os.path.join(ROOT_DIR, "Chat.py")
+
+MOCK_PROVIDER = "Mock"
+MOCK_MODEL = "mock-model"
+
+# Seconds a single script run (including a whole response) may take
+APP_TIMEOUT = 300
+
+# Extra runs allowed for a response to land after a message is sent
+MAX_RESPONSE_RUNS = 3
+
+
+class SessionError(Exception):
+    """A simulated session hit an exception in the app."""
+
+
+class HistoryWriteMonitor:
+    """
+    Times every write of the history file and counts overlapping writes.
+
+    Installed by replacing history.history.save_history, which every
+    save_chats() call goes through.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._original = None
+        self.max_in_flight = 0
+        self.overlapping = 0
+        self.failed = 0
+        self.durations: List[float] = []
+
+    def install(self) -> None:
+        import history.history as history_module
+        self._original = history_module.save_history
+        history_module.save_history = self._save_history
+
+    def uninstall(self) -> None:
+        import history.history as history_module
+        history_module.save_history = self._original
+
+    def _save_history(self, history, raw_messages=None):
+        with self._lock:
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            if self._in_flight > 1:
+                self.overlapping += 1
+        start = time.perf_counter()
+        try:
+            return self._original(history, raw_messages)
+        except Exception:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._in_flight -= 1
+                self.durations.append(elapsed)
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            durations = sorted(self.durations)
+        return {
+            "writes": len(durations),
+            "failed": self.failed,
+            "overlapping": self.overlapping,
+            "max_concurrent": self.max_in_flight,
+            "p50_ms": round(percentile(durations, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(durations, 0.95) * 1000, 2),
+            "max_ms": round(durations[-1] * 1000, 2) if durations else 0.0,
+        }
+
+
+class RssSampler:
+    """Samples the resident memory of this process in the background."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self.start_bytes = self._process.memory_info().rss
+        self.peak_bytes = self.start_bytes
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak_bytes = max(self.peak_bytes, self._process.memory_info().rss)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Dict[str, float]:
+        self._stop.set()
+        self._thread.join()
+        end_bytes = self._process.memory_info().rss
+        self.peak_bytes = max(self.peak_bytes, end_bytes)
+        megabyte = 1024 * 1024
+        return {
+            "start_mb": round(self.start_bytes / megabyte, 1),
+            "peak_mb": round(self.peak_bytes / megabyte, 1),
+            "end_mb": round(end_bytes / megabyte, 1),
+        }
+
+
+@contextmanager
+def shared_runtime():
+    """
+    Serve one mock Streamlit runtime to every session.
+
+    AppTest installs a fresh mock runtime for each script run and removes it
+    when the run ends, which breaks the runs still going in other threads.
+    Sharing one also shares st.cache_data between sessions, as a server does.
+    The compiled script is shared too: AppTest compiles it again for every
+    run, and parsing in several threads at once can crash Python 3.11.
+    """
+    from unittest.mock import MagicMock
+    from streamlit.testing.v1 import app_test
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.components.v2.component_manager import BidiComponentManager
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    runtime.bidi_component_registry = BidiComponentManager()
+
+    script_cache = ScriptCache()
+
+    original_instance, original_exists = Runtime.__dict__["instance"], Runtime.__dict__["exists"]
+    original_script_cache = app_test.ScriptCache
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+    app_test.ScriptCache = lambda: script_cache
+    try:
+        yield runtime
+    finally:
+        Runtime.instance, Runtime.exists = original_instance, original_exists
+        app_test.ScriptCache = original_script_cache
+
+
+class SimulatedSession:
+    """One browser session driven through the chat flow."""
+
+    def __init__(self, index: int, args, secrets: Dict[str, Any]):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.args = args
+        self.app = AppTest.from_file(APP_FILE, default_timeout=APP_TIMEOUT)
+        self.app.secrets.update(secrets)
+        self.timings: List[Dict[str, Any]] = []
+        self.chat_ids: List[str] = []
+        self.answered = 0
+        self.error: Optional[str] = None
+
+    def _act(self, action: str, func) -> None:
+        """Run one user action and time it until the page has settled."""
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        failed = bool(self.app.exception)
+        self.timings.append({"action": action, "seconds": elapsed, "ok": not failed})
+        if failed:
+            raise SessionError(f"{action}: {self.app.exception[0].message}")
+
+    def _button(self, label: str):
+        return next(button for button in self.app.button if button.label == label)
+
+    def _active_chat(self) -> Dict[str, Any]:
+        return self.app.session_state["chats"][self.app.session_state["active_chat_id"]]
+
+    def open(self) -> None:
+        self._act("open", self.app.run)
+
+    def create_chat(self) -> None:
+        self._act("new_chat", lambda: self._button("New Chat").click().run())
+        self._act("select_provider", lambda: self.app.selectbox[0].select(MOCK_PROVIDER).run())
+        self._act("select_model", lambda: self.app.selectbox[1].select(MOCK_MODEL).run())
+        self._act("start_chat", lambda: self._button("Start Chat").click().run())
+        self.chat_ids.append(self.app.session_state["active_chat_id"])
+
+    def switch_chat(self, chat_id: str) -> None:
+        self._act("switch_chat", lambda: self.app.button(key=f"select_{chat_id}").click().run())
+
+    def send(self, number: int) -> None:
+        prompt = f"Session {self.index} message {number}: summarize the previous answer in one sentence."
+
+        def send_and_wait():
+            self.app.chat_input[0].set_value(prompt).run()
+            # A response finished by a rerun may need more runs to land
+            for _ in range(MAX_RESPONSE_RUNS):
+                if self.app.exception or self._active_chat()["messages"][-1]["role"] == "assistant":
+                    break
+                self.app.run()
+
+        self._act("send", send_and_wait)
+        if self._active_chat()["messages"][-1]["role"] == "assistant":
+            self.answered += 1
+
+    def run(self) -> None:
+        """Follow the whole flow, stopping at the first error."""
+        try:
+            self.open()
+            for _ in range(self.args.chats):
+                self.create_chat()
+            for number in range(self.args.messages):
+                # The last chat created is active; cycle from the first one
+                if self.args.switch_every and number and number % self.args.switch_every == 0:
+                    self.switch_chat(self.chat_ids[(number // self.args.switch_every - 1) % len(self.chat_ids)])
+                self.send(number)
+        except SessionError as e:
+            self.error = str(e)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+
+
+def _latency_summary(timings: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    """Percentiles of every action, in milliseconds."""
+    by_action: Dict[str, List[float]] = {}
+    for timing in timings:
+        by_action.setdefault(timing["action"], []).append(timing["seconds"])
+    summary = {}
+    for action, samples in by_action.items():
+        samples.sort()
+        summary[action] = {
+            "count": len(samples),
+            "p50_ms": round(percentile(samples, 0.50) * 1000, 1),
+            "p95_ms": round(percentile(samples, 0.95) * 1000, 1),
+            "p99_ms": round(percentile(samples, 0.99) * 1000, 1),
+            "max_ms": round(samples[-1] * 1000, 1),
+        }
+    return summary
+
+
+def _history_check(expected_messages: int) -> Dict[str, Any]:
+    """Compare the saved history (JSON or binary) with the messages the sessions produced."""
+    from history.history import read_history
+
+    try:
+        history = read_history()
+    except (OSError, ValueError) as e:
+        return {"readable": False, "error": str(e), "expected_messages": expected_messages}
+    saved = sum(len(chat.get("messages", [])) for chat in history.get("chats", {}).values())
+    return {
+        "readable": True,
+        "chats": len(history.get("chats", {})),
+        "expected_messages": expected_messages,
+        "saved_messages": saved,
+        "lost_messages": max(0, expected_messages - saved),
+    }
+
+
+def run_load_test(args) -> Dict[str, Any]:
+    """
+    Run every simulated session and build the report.
+
+    Args:
+        args: Parsed command-line options
+
+    Returns:
+        Dict[str, Any]: Report with throughput, latency, rss and history sections
+    """
+    secrets = {
+        "api_keys": {"openai": "", "anthropic": "", "gemini": "", "mistral": "", "deepseek": "", "ollama": "", "mock": args.profile},
+        "app_settings": {"use_streaming": args.streaming},
+    }
+
+    monitor = HistoryWriteMonitor()
+    monitor.install()
+    sampler = RssSampler(args.rss_interval)
+    sampler.start()
+
+    sessions = [SimulatedSession(index, args, secrets) for index in range(args.sessions)]
+    threads = [threading.Thread(target=session.run, name=f"session-{session.index}") for session in sessions]
+    delay = args.ramp / args.sessions if args.sessions else 0
+    start = time.perf_counter()
+    try:
+        with shared_runtime():
+            for thread in threads:
+                thread.start()
+                time.sleep(delay)
+            for thread in threads:
+                thread.join()
+    finally:
+        duration = time.perf_counter() - start
+        rss = sampler.stop()
+        monitor.uninstall()
+
+    timings = [timing for session in sessions for timing in session.timings]
+    answered = sum(session.answered for session in sessions)
+    errors = [f"session {session.index}: {session.error}" for session in sessions if session.error]
+    # Each session's chats end with its user messages and their answers
+    expected_messages = sum(
+        len(session.app.session_state["chats"][chat_id]["messages"])
+        for session in sessions if "chats" in session.app.session_state
+        for chat_id in session.chat_ids
+    )
+
+    return {
+        "parameters": {
+            "sessions": args.sessions, "chats": args.chats, "messages": args.messages,
+            "switch_every": args.switch_every, "ramp": args.ramp,
+            "profile": args.profile, "streaming": args.streaming,
+        },
+        "duration_s": round(duration, 2),
+        "throughput": {
+            "messages_per_s": round(answered / duration, 2) if duration else 0.0,
+            "actions_per_s": round(len(timings) / duration, 2) if duration else 0.0,
+            "answered": answered,
+            "actions": len(timings),
+        },
+        "latency": _latency_summary(timings),
+        "rss": rss,
+        "history_writes": monitor.summary(),
+        "history_file": _history_check(expected_messages),
+        "errors": errors,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """Print a readable summary of the report."""
+    throughput = report["throughput"]
+    print(f"{report['parameters']['sessions']} sessions in {report['duration_s']:.1f}s: "
+          f"{throughput['answered']} messages answered ({throughput['messages_per_s']:.2f}/s), "
+          f"{throughput['actions']} actions ({throughput['actions_per_s']:.2f}/s)")
+    print(f"{'action':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for action, stats in report["latency"].items():
+        print(f"{action:<16} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    rss = report["rss"]
+    print(f"Server RSS: {rss['start_mb']:.1f} MB at start, {rss['peak_mb']:.1f} MB peak, {rss['end_mb']:.1f} MB at end")
+    writes = report["history_writes"]
+    print(f"History writes: {writes['writes']} ({writes['failed']} failed), p50 {writes['p50_ms']:.1f} ms, "
+          f"p95 {writes['p95_ms']:.1f} ms, max {writes['max_ms']:.1f} ms, "
+          f"{writes['overlapping']} overlapping (up to {writes['max_concurrent']} at once)")
+    history = report["history_file"]
+    if history["readable"]:
+        print(f"History file: {history['saved_messages']} of {history['expected_messages']} messages saved "
+              f"({history['lost_messages']} lost) in {history['chats']} chats")
+    else:
+        print(f"History file unreadable: {history['error']}")
+    for error in report["errors"]:
+        print(f"Error: {error}")
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Drive simulated chat sessions against the Mock provider.")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent sessions (default: 20)")
+    parser.add_argument("--chats", type=int, default=2, help="Chats created by each session (default: 2)")
+    parser.add_argument("--messages", type=int, default=10, help="Messages sent by each session (default: 10)")
+    parser.add_argument("--switch-every", type=int, default=3, help="Switch chat every N messages, 0 to never (default: 3)")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which sessions start (default: 5)")
+    parser.add_argument("--profile", default="ttft=0.2,tps=50,tokens=60", help="Mock provider timing profile")
+    parser.add_argument("--streaming", action="store_true", help="Use streaming responses")
+    parser.add_argument("--history",
+                        help="Start from a copy of this history file (history.json or history.pack) instead of an empty one")
+    parser.add_argument("--rss-interval", type=float, default=0.1, help="Seconds between RSS samples (default: 0.1)")
+    parser.add_argument("--output", help="Also write the report to this JSON file")
+    args = parser.parse_args(argv)
+
+    if args.sessions < 1 or args.chats < 1:
+        parser.error("--sessions and --chats must be at least 1")
+
+    with tempfile.TemporaryDirectory(prefix="promptly-load-") as data_dir:
+        # Set before the app modules are imported, they read it once
+        os.environ["PROMPTLY_DATA_DIR"] = data_dir
+        if args.history:
+            name = "history.pack" if args.history.endswith(".pack") else "history.json"
+            shutil.copyfile(args.history, os.path.join(data_dir, name))
+        report = run_load_test(args)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+    return 1 if report["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""
+Local stub LLM server speaking the OpenAI-compatible and Ollama wire formats.
+
+Responses are synthetic and deterministic (see llms.providers.llm_mock), with
+configurable time to first token, token rate, jitter, error injection and
+response length, so benchmarks and load tests can exercise the real
+provider code paths on a machine with no network:
+
+    python -m tools.stub_server --port 8001 --profile "ttft=0.2,tps=50"
+
+    # OpenAI provider (the OpenAI SDK reads OPENAI_BASE_URL) and Deepseek provider
+    OPENAI_BASE_URL=http://127.0.0.1:8001/v1 DEEPSEEK_BASE_URL=http://127.0.0.1:8001/v1 streamlit run Chat.py
+
+    # Ollama provider: set the Ollama port to 8001 in Settings
+
+Endpoints: GET /v1/models, POST /v1/chat/completions (with "stream" and
+"stream_options.include_usage"), GET /api/tags, GET /api/version and
+POST /api/chat (newline-delimited JSON unless "stream" is false).
+"""
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+from llms.providers.llm_mock import MockProfile, prompt_tokens
+from tools.http_server import (
+    HttpError,
+    HttpRequest,
+    error_payload,
+    send_json,
+    send_event,
+    send_ndjson,
+    start_stream,
+    serve,
+)
+
+
+INJECTED_ERROR = "Injected failure from the stub server"
+
+# Listed models. The OpenAI provider only lists models with "gpt" in their name.
+DEFAULT_MODELS = ["gpt-stub", "llama-stub"]
+
+
+class StubServer:
+    """Request dispatcher answering every request from one MockProfile."""
+
+    def __init__(self, profile: MockProfile, models: List[str] = DEFAULT_MODELS):
+        self.profile = profile
+        self.models = models
+
+    async def handle(self, request: HttpRequest, writer) -> bool:
+        """Route one request. Returns whether the connection can be reused."""
+        routes = {
+            ("GET", "/v1/models"): self.openai_models,
+            ("POST", "/v1/chat/completions"): self.openai_chat,
+            ("GET", "/api/tags"): self.ollama_tags,
+            ("GET", "/api/version"): self.ollama_version,
+            ("POST", "/api/chat"): self.ollama_chat,
+        }
+        route = routes.get((request.method, request.path))
+        if route is None:
+            raise HttpError(404, f"No route for {request.method} {request.path}")
+        return await route(request, writer)
+
+    def _conversation(self, request: HttpRequest) -> Dict[str, Any]:
+        body = request.json()
+        if not isinstance(body, dict) or not isinstance(body.get("messages"), list):
+            raise HttpError(400, "'messages' must be a list")
+        return body
+
+    async def openai_models(self, request: HttpRequest, writer) -> bool:
+        created = int(time.time())
+        await send_json(writer, 200, {
+            "object": "list",
+            "data": [{"id": model, "object": "model", "created": created, "owned_by": "stub"} for model in self.models],
+        }, request.keep_alive)
+        return True
+
+    async def openai_chat(self, request: HttpRequest, writer) -> bool:
+        body = self._conversation(request)
+        messages: List[Dict[str, Any]] = body["messages"]
+        failed, tokens = self.profile.plan(messages)
+        if failed:
+            await send_json(writer, 500, error_payload(INJECTED_ERROR, "server_error"), request.keep_alive)
+            return True
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model") or self.models[0]
+        usage = {
+            "prompt_tokens": prompt_tokens(messages),
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens(messages) + len(tokens),
+        }
+
+        if not body.get("stream"):
+            await asyncio.sleep(sum(delay for delay, _ in tokens))
+            await send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(text for _, text in tokens)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }, request.keep_alive)
+            return True
+
+        def chunk(delta: Dict[str, str], finish_reason=None) -> Dict[str, Any]:
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        await start_stream(writer)
+        await send_event(writer, chunk({"role": "assistant", "content": ""}))
+        for delay, text in tokens:
+            await asyncio.sleep(delay)
+            await send_event(writer, chunk({"content": text}))
+        await send_event(writer, chunk({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            await send_event(writer, dict(chunk({}), choices=[], usage=usage))
+        await send_event(writer, "[DONE]")
+        return False
+
+    async def ollama_tags(self, request: HttpRequest, writer) -> bool:
+        modified_at = datetime.now(timezone.utc).isoformat()
+        await send_json(writer, 200, {
+            "models": [{"name": model, "model": model, "modified_at": modified_at, "size": 0, "digest": ""} for model in self.models],
+        }, request.keep_alive)
+        return True
+
+    async def ollama_version(self, request: HttpRequest, writer) -> bool:
+        await send_json(writer, 200, {"version": "0.0.0-stub"}, request.keep_alive)
+        return True
+
+    async def ollama_chat(self, request: HttpRequest, writer) -> bool:
+        body = self._conversation(request)
+        messages: List[Dict[str, Any]] = body["messages"]
+        failed, tokens = self.profile.plan(messages)
+        if failed:
+            await send_json(writer, 500, {"error": INJECTED_ERROR}, request.keep_alive)
+            return True
+
+        model = body.get("model") or self.models[0]
+        started = time.perf_counter()
+
+        def record(content: str, done: bool) -> Dict[str, Any]:
+            result = {
+                "model": model,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "message": {"role": "assistant", "content": content},
+                "done": done,
+            }
+            if done:
+                result.update({
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - started) * 1e9),
+                    "prompt_eval_count": prompt_tokens(messages),
+                    "eval_count": len(tokens),
+                })
+            return result
+
+        if body.get("stream") is False:
+            await asyncio.sleep(sum(delay for delay, _ in tokens))
+            await send_json(writer, 200, record("".join(text for _, text in tokens), True), request.keep_alive)
+            return True
+
+        await start_stream(writer, "application/x-ndjson")
+        for delay, text in tokens:
+            await asyncio.sleep(delay)
+            await send_ndjson(writer, record(text, False))
+        await send_ndjson(writer, record("", True))
+        return False
+
+
+async def run_server(stub: StubServer, host: str, port: int) -> None:
+    """Run the stub server until interrupted."""
+    server = await serve(stub.handle, host, port)
+    print(f"Stub LLM server listening on http://{host}:{port} (OpenAI: /v1, Ollama: /api)")
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description="Serve synthetic LLM responses over the OpenAI and Ollama APIs.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8001, help="Port to bind (default: 8001)")
+    parser.add_argument("--profile", default="default",
+                        help='Timing profile, e.g. "ttft=0.2,tps=50,jitter=0.1,tokens=120,error_rate=0,seed=0"')
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS), help="Comma-separated model names to list")
+    args = parser.parse_args(argv)
+
+    try:
+        profile = MockProfile.parse(args.profile)
+    except ValueError as e:
+        parser.error(str(e))
+
+    try:
+        asyncio.run(run_server(StubServer(profile, [m.strip() for m in args.models.split(",") if m.strip()]), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,9 @@
+import time
 import base64
 import streamlit as st
 from pathlib import Path
-from typing import List, Dict, Any, Callable
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Optional
 
 
 def render_message(role: str, content: str) -> Dict[str, str]:
@@ -11,9 +13,14 @@ def render_message(role: str, content: str) -> Dict[str, str]:
 
 def display_messages(
     messages: List[Dict[str, Any]],
-    exclude_last_assistant: bool = False
+    exclude_last_assistant: bool = False,
+    alternatives: Optional[Dict[Any, List[Any]]] = None,
+    on_switch_branch: Optional[Callable[[Any], None]] = None,
+    on_edit: Optional[Callable[[Any, str], None]] = None,
+    on_regenerate: Optional[Callable[[Any], None]] = None,
+    on_continue: Optional[Callable[[Any], None]] = None
 ) -> None:
-    """ Display a list of chat messages in the UI """
+    """ Display a list of chat messages in the UI, with branch controls when callbacks are given """
     
     messages_to_show = messages.copy()
     if exclude_last_assistant and messages_to_show:
@@ -21,10 +28,61 @@ def display_messages(
         if messages_to_show[-1]["role"] == "assistant":
             messages_to_show = messages_to_show[:-1]
     
+    # Only the last answer can be continued
+    last_message = messages_to_show[-1] if messages_to_show else None
+    
     for message in messages_to_show:
         if message["role"] != "system":
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
+                if message.get("incomplete"):
+                    st.caption("⚠️ This answer was interrupted before the end")
+                if "id" in message and (on_switch_branch or on_edit or on_regenerate or on_continue):
+                    render_message_controls(message, (alternatives or {}).get(message["id"]),
+                                            on_switch_branch, on_edit, on_regenerate,
+                                            on_continue if message is last_message else None)
+
+
+def render_message_controls(
+    message: Dict[str, Any],
+    versions: Optional[List[Any]],
+    on_switch_branch: Optional[Callable[[Any], None]],
+    on_edit: Optional[Callable[[Any, str], None]],
+    on_regenerate: Optional[Callable[[Any], None]],
+    on_continue: Optional[Callable[[Any], None]] = None
+) -> None:
+    """ Render the version selector and the edit, regenerate or continue actions under a message """
+    message_id = message["id"]
+    col1, col2, col3, col4, col5, _ = st.columns([1, 1, 1, 1, 1, 7], vertical_alignment="center")
+    
+    # Version selector, for a prompt edited or an answer regenerated
+    if versions and on_switch_branch:
+        index = versions.index(message_id)
+        with col1:
+            if st.button("◀", key=f"previous_version_{message_id}", disabled=index == 0, help="Previous version"):
+                on_switch_branch(versions[index - 1])
+        with col2:
+            st.caption(f"{index + 1}/{len(versions)}")
+        with col3:
+            if st.button("▶", key=f"next_version_{message_id}", disabled=index == len(versions) - 1, help="Next version"):
+                on_switch_branch(versions[index + 1])
+    
+    with col4:
+        if message["role"] == "user" and on_edit:
+            with st.popover("✏️", help="Edit this prompt"):
+                with st.form(key=f"edit_form_{message_id}", border=False):
+                    content = st.text_area("Prompt", value=message["content"], label_visibility="collapsed")
+                    if st.form_submit_button("Send", type="primary"):
+                        on_edit(message_id, content)
+        elif message["role"] == "assistant" and on_regenerate:
+            if st.button("🔄", key=f"regenerate_{message_id}", help="Regenerate this answer"):
+                on_regenerate(message_id)
+    
+    # Finish an interrupted answer, from the text saved so far
+    if message.get("incomplete") and on_continue:
+        with col5:
+            if st.button("⏩", key=f"continue_{message_id}", help="Continue this answer"):
+                on_continue(message_id)
 
 
 def render_model_selection(
@@ -75,6 +133,21 @@ def render_model_selection(
         st.error(f"Error loading providers: {str(e)}")
 
 
+def render_profile_panel(
+    profile_summary: Dict[str, Any],
+    on_save: Callable[[], None]
+) -> None:
+    """ Render the phase timings and slowest functions of the last profiled run """
+    with st.expander(f"Last run profile ({profile_summary['duration_ms']:.0f} ms)"):
+        st.caption("Phases")
+        st.dataframe(profile_summary["phases"], hide_index=True, use_container_width=True)
+        if profile_summary["top"]:
+            st.caption("Slowest functions (cumulative)")
+            st.dataframe(profile_summary["top"], hide_index=True, use_container_width=True)
+        if st.button("Save profile to disk", key="save_profile", use_container_width=True):
+            on_save()
+
+
 def render_sidebar(
     chats: Dict[str, Any],
     active_chat_id: str,
@@ -127,6 +200,21 @@ def render_sidebar(
                 on_delete_chat(chat_id)
 
 
+def render_archived_chats(
+    archived_chats: Dict[str, Dict[str, Any]],
+    on_restore_chat: Callable[[str], None]
+) -> None:
+    """ Render the archived chats, each restored into the chat list when selected """
+    if not archived_chats:
+        return
+    with st.expander(f"Archived chats ({len(archived_chats)})"):
+        for chat_id, entry in archived_chats.items():
+            updated = time.strftime("%Y-%m-%d", time.localtime(entry["updated_at"])) if entry.get("updated_at") else "?"
+            if st.button(entry.get("title") or chat_id, key=f"restore_{chat_id}", use_container_width=True,
+                         help=f"Last changed {updated}, {entry.get('messages', 0)} messages. Select to restore."):
+                on_restore_chat(chat_id)
+
+
 def apply_theme() -> None:
     """Apply custom CSS styling to the app."""
     st.markdown("""
@@ -147,14 +235,15 @@ def apply_theme() -> None:
     """, unsafe_allow_html=True)
 
 
-def render_chat_header():
-    """ Render the chat header with the raccoon logo """
+@lru_cache(maxsize=1)
+def _chat_header_css() -> str:
+    """ Build the header CSS once per process, the logo never changes at runtime """
     def img_to_base64(img_path: str) -> str:
         with open(img_path, "rb") as img_file:
             return base64.b64encode(img_file.read()).decode('utf-8')
     img_path = Path("assets/logo.png")
     img_base64 = img_to_base64(img_path)
-    css = f"""
+    return f"""
     <style>
         [data-testid="stSidebarHeader"] {{
             background-image: url("data:image/png;base64,{img_base64}");
@@ -165,4 +254,8 @@ def render_chat_header():
         }}
     </style>
     """
-    st.markdown(css, unsafe_allow_html=True)
+
+
+def render_chat_header():
+    """ Render the chat header with the raccoon logo """
+    st.markdown(_chat_header_css(), unsafe_allow_html=True)